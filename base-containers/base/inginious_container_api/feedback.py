@@ -5,15 +5,17 @@
 
 import json
 import os
+import socket
+import socketserver
+import threading
 import traceback
 
-from jinja2 import Template
-
 from inginious_container_api.input import get_lang
 import inginious_container_api.lang
 
 _feedback_dir = '/.__output' if not inginious_container_api.DEBUG else './'
 _feedback_file = os.path.join(_feedback_dir, '__feedback.json')
+_feedback_socket = os.path.join(_feedback_dir, '__feedback.sock')
 
 def _load_feedback():
     """ Open existing feedback file """
@@ -32,65 +34,301 @@ def _load_feedback():
     return result
 
 
-def save_feedback(rdict):
-    """ Save feedback file """
+def _write_feedback(rdict):
+    """ Write feedback file. A symlink put in its place is not followed, as the file may be written by root. """
     # Check for output folder
     if not os.path.exists(_feedback_dir):
         os.makedirs(_feedback_dir)
     
     jcont = json.dumps(rdict)
-    f = open(_feedback_file, 'w')
+    f = os.fdopen(os.open(_feedback_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o666), 'w')
     f.write(jcont)
     f.close()
 
 
-# Doing the real stuff
-def set_global_result(result):
-    """ Set global result value """
-    rdict = _load_feedback()
+def _feedback_file_version():
+    """ Returns the modification time and the size of the feedback file, or None if it does not exist """
+    try:
+        stat = os.stat(_feedback_file)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def save_feedback(rdict):
+    """ Save feedback file. The whole feedback is replaced by rdict, also in the feedback helper if it is running. """
+    _update("replace", rdict)
+
+
+# Modifications of the feedback dict, applied by the functions below
+def _replace(rdict, new_rdict):
+    rdict.clear()
+    rdict.update(new_rdict)
+
+
+def _set_global_result(rdict, result):
     rdict['result'] = result
-    save_feedback(rdict)
 
 
-def set_problem_result(result, problem_id):
-    """ Set problem specific result value """
-    rdict = _load_feedback()
+def _set_problem_result(rdict, result, problem_id):
     if not 'problems' in rdict:
         rdict['problems'] = {}
     cur_val = rdict['problems'].get(problem_id, '')
     rdict['problems'][problem_id] = [result, cur_val] if type(cur_val) == str else [result, cur_val[1]]
-    save_feedback(rdict)
 
 
-def set_grade(grade):
-    """ Set global grade of this job """
-    rdict = _load_feedback()
+def _set_grade(rdict, grade):
     rdict['grade'] = float(grade)
-    save_feedback(rdict)
 
 
-def set_global_feedback(feedback, append=False):
-    """ Set global feedback in case of error """
-    rdict = _load_feedback()
+def _set_global_feedback(rdict, feedback, append):
     rdict['text'] = rdict.get('text', '') + feedback if append else feedback
-    save_feedback(rdict)
 
 
-def set_problem_feedback(feedback, problem_id, append=False):
-    """ Set problem specific feedback """
-    rdict = _load_feedback()
+def _set_problem_feedback(rdict, feedback, problem_id, append):
     if not 'problems' in rdict:
         rdict['problems'] = {}
     cur_val = rdict['problems'].get(problem_id, '')
     rdict['problems'][problem_id] = (cur_val + feedback if append else feedback) if type(cur_val) == str else [cur_val[0], (cur_val[1] + feedback if append else feedback)]
-    save_feedback(rdict)
+
+
+def _set_state(rdict, state):
+    rdict['state'] = state
+
+
+def _set_test(rdict, test_id, value):
+    tests = rdict.setdefault("tests", {})
+    tests[test_id] = value
+
+
+def _set_custom_value(rdict, custom_name, custom_val):
+    if not "custom" in rdict:
+        rdict["custom"] = {}
+    rdict["custom"][custom_name] = custom_val
+
+
+_operations = {
+    "replace": _replace,
+    "set_global_result": _set_global_result,
+    "set_problem_result": _set_problem_result,
+    "set_grade": _set_grade,
+    "set_global_feedback": _set_global_feedback,
+    "set_problem_feedback": _set_problem_feedback,
+    "set_state": _set_state,
+    "set_test": _set_test,
+    "set_custom_value": _set_custom_value
+}
+
+
+class FeedbackClosedError(Exception):
+    """ Raised by a Feedback that was closed: the modifications must then be made in the feedback file """
+    pass
+
+
+class Feedback(object):
+    """
+    Feedback of the job, kept in memory. The modifications are written in the feedback file only by flush().
+    It is used by the feedback helper, that applies the modifications made by all the processes of the container.
+
+    The feedback file can still be written directly (without save_feedback) while the feedback is kept in memory: it
+    then replaces the feedback, as it did when each modification read the file. The next modifications apply to it, and
+    it is not overwritten by flush() if there are none.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rdict = _load_feedback()
+        self._file_version = _feedback_file_version()
+        self._modified = False
+        self._closed = False
+
+    def _check_open(self):
+        if self._closed:
+            raise FeedbackClosedError()
+
+    def _reload_if_written(self):
+        """ Reads the feedback file again if it was written since it was last read or written here """
+        version = _feedback_file_version()
+        if version != self._file_version:
+            self._rdict = _load_feedback()
+            self._file_version = version
+            self._modified = False
+
+    def update(self, operation, *args):
+        """ Applies one of the modifications of the feedback (see _operations) """
+        with self._lock:
+            self._check_open()
+            self._reload_if_written()
+            _operations[operation](self._rdict, *args)
+            self._modified = True
+
+    def get(self):
+        """ Returns a copy of the feedback dict """
+        with self._lock:
+            self._check_open()
+            self._reload_if_written()
+            return json.loads(json.dumps(self._rdict))
+
+    def _flush(self):
+        self._reload_if_written()
+        if self._modified:
+            _write_feedback(self._rdict)
+            self._file_version = _feedback_file_version()
+            self._modified = False
+
+    def flush(self):
+        """ Writes the feedback in the feedback file, if it was modified """
+        with self._lock:
+            self._check_open()
+            self._flush()
+
+    def close(self):
+        """ Writes the feedback in the feedback file, if it was modified. The next calls raise FeedbackClosedError. """
+        with self._lock:
+            self._flush()
+            self._closed = True
+
+
+class _FeedbackRequestHandler(socketserver.StreamRequestHandler):
+    """ Handles the requests of a process to the feedback helper: one JSON list [operation, args...] per line """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if request[0] == "get":
+                    response = {"value": self.server.feedback.get()}
+                elif request[0] == "flush":
+                    self.server.feedback.flush()
+                    response = {}
+                else:
+                    self.server.feedback.update(*request)
+                    response = {}
+            except FeedbackClosedError:
+                return  # the helper was stopped: closes the connection, the process then uses the feedback file
+            except Exception as e:
+                response = {"error": repr(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+
+
+class FeedbackHelper(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long-lived helper, started by the container before the run file, that keeps the feedback in memory (see Feedback).
+    The container runs it in its own process, as the worker user (see bin/_feedback_helper).
+    While it is running, the functions of this module, called by the run file or by the feedback-* commands, send their
+    modifications to the helper through a unix socket, instead of reading and writing the whole feedback file each time.
+    The feedback is written in the feedback file once, when the helper is stopped, or when flush() is called.
+    save_feedback() replaces the feedback kept by the helper, and a feedback file written directly replaces it too.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        if os.path.exists(_feedback_socket):
+            os.unlink(_feedback_socket)
+        super().__init__(_feedback_socket, _FeedbackRequestHandler)
+        os.chmod(_feedback_socket, 0o777)
+        self.feedback = Feedback()
+        # stop() waits for the end of the current poll interval: keep it short, not to delay the end of the job
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True)
+
+    def start(self):
+        """ Starts serving the requests, in a thread """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the helper, and writes the feedback in the feedback file. The connections still open are closed at their
+        next request, so that the processes using them modify the feedback file instead.
+        """
+        os.unlink(_feedback_socket)
+        self.shutdown()
+        self.server_close()
+        self.feedback.close()
+
+
+# (pid, socket file) connection of this thread to the feedback helper. Each thread has its own connection, so that the
+# requests and the responses of several threads are not interleaved.
+_helper_connections = threading.local()
+
+
+def _call_helper(*request):
+    """
+    Sends a request to the feedback helper.
+    :return: (True, value returned by the helper), or (False, None) if no helper is running
+    """
+    for _ in range(2):
+        helper_connection = getattr(_helper_connections, "connection", None)
+        if helper_connection is None or helper_connection[0] != os.getpid():  # no connection was made by this thread
+            if not os.path.exists(_feedback_socket):
+                return False, None
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(_feedback_socket)
+            except OSError:
+                sock.close()
+                return False, None
+            helper_connection = (os.getpid(), sock.makefile('rwb'))
+            _helper_connections.connection = helper_connection
+
+        try:
+            connection = helper_connection[1]
+            connection.write(json.dumps(request).encode('utf-8') + b"\n")
+            connection.flush()
+            response = json.loads(connection.readline().decode('utf-8'))
+        except (OSError, ValueError):
+            # the helper was stopped or restarted: try again with a new connection
+            _helper_connections.connection = None
+            continue
+
+        if "error" in response:
+            raise ValueError("Feedback helper: " + response["error"])
+        return True, response.get("value")
+    return False, None
+
+
+def _update(operation, *args):
+    """ Modifies the feedback, through the feedback helper if it is running, or in the feedback file otherwise """
+    sent, _ = _call_helper(operation, *args)
+    if not sent:
+        rdict = _load_feedback()
+        _operations[operation](rdict, *args)
+        _write_feedback(rdict)
+
+
+def flush():
+    """ Writes the feedback kept by the feedback helper, if it is running, in the feedback file """
+    _call_helper("flush")
+
+
+# Doing the real stuff
+def set_global_result(result):
+    """ Set global result value """
+    _update("set_global_result", result)
+
+
+def set_problem_result(result, problem_id):
+    """ Set problem specific result value """
+    _update("set_problem_result", result, problem_id)
+
+
+def set_grade(grade):
+    """ Set global grade of this job """
+    _update("set_grade", float(grade))
+
+
+def set_global_feedback(feedback, append=False):
+    """ Set global feedback in case of error """
+    _update("set_global_feedback", feedback, append)
+
+
+def set_problem_feedback(feedback, problem_id, append=False):
+    """ Set problem specific feedback """
+    _update("set_problem_feedback", feedback, problem_id, append)
 
 
 def set_state(state):
     """ Set the task state """
-    rdict = _load_feedback()
-    rdict['state'] = state
-    save_feedback(rdict)
+    _update("set_state", state)
 
 
 def set_tag(tag, value):
@@ -100,20 +338,14 @@ def set_tag(tag, value):
     :param tag: should be the id of the tag. Can not starts with '*auto-tag-'
     """ 
     if not tag.startswith("*auto-tag-"):
-        rdict = _load_feedback()
-        tests = rdict.setdefault("tests", {})
-        tests[tag] = (value == True)
-        save_feedback(rdict)
+        _update("set_test", tag, value == True)
         
 def tag(value):
     """
     Add a tag with generated id.
     :param value: everything working with the str() function
     """
-    rdict = _load_feedback()
-    tests = rdict.setdefault("tests", {})
-    tests["*auto-tag-" + str(hash(str(value)))] = str(value)
-    save_feedback(rdict)
+    _update("set_test", "*auto-tag-" + str(hash(str(value))), str(value))
 
 def set_custom_value(custom_name, custom_val):
     """
@@ -121,16 +353,14 @@ def set_custom_value(custom_name, custom_val):
     :param custom_name: name/key of the entry to be placed in the custom dict
     :param custom_val: content of the entry to be placed in the custom dict
     """
-    rdict = _load_feedback()
-    if not "custom" in rdict:
-        rdict["custom"] = {}
-    rdict["custom"][custom_name] = custom_val
-    save_feedback(rdict)
+    _update("set_custom_value", custom_name, custom_val)
 
 
 def get_feedback():
     """ Returns the dictionary containing the feedback """
-    rdict = _load_feedback()
+    sent, rdict = _call_helper("get")
+    if not sent:
+        rdict = _load_feedback()
     return rdict
 
 
@@ -180,6 +410,7 @@ def set_feedback_from_tpl(tpl_name, parameters, problem_id=None, append=False):
         return False
 
     try:
+        from jinja2 import Template  # only imported here, as the feedback-* commands do not need it
         template = Template(open(tpl_location, 'r').read())
         parameters.update({"_": _})
         output = template.render(parameters)
@@ -3,6 +3,7 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 
+import copy
 import os
 import re
 import json
@@ -11,12 +12,24 @@ import inginious_container_api
 
 _input_file = '/.__input/__inputdata.json' if not inginious_container_api.DEBUG else './__inputdata.json'
 
+# [(inode, mtime, size) of the input file, input data, regex matching the fields in the templates (built when needed)]
+_input_cache = None
+
 def _load_input():
-    """ Open existing input file """
-    file = open(_input_file, 'r')
-    result = json.loads(file.read().strip('\0').strip())
-    file.close()
-    return result
+    """ Open existing input file. It is only parsed again if it was modified since the last call. """
+    global _input_cache
+    stat = os.stat(_input_file)
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _input_cache is None or _input_cache[0] != key:
+        file = open(_input_file, 'r')
+        _input_cache = [key, json.loads(file.read().strip('\0').strip()), None]
+        file.close()
+    return _input_cache[1]
+
+
+def _is_file_input(problem_input):
+    """ Returns True if the input of a problem is a file: a dict {"filename": ..., "value": path of the file} """
+    return isinstance(problem_input, dict) and "filename" in problem_input and "value" in problem_input
 
 
 def get_username():
@@ -37,15 +50,76 @@ def get_input(problem):
     input_data = _load_input()
     pbsplit = problem.split(":")
     problem_input = input_data['input'][pbsplit[0]]
-    if isinstance(problem_input, dict) and "filename" in problem_input and "value" in problem_input:
+    if _is_file_input(problem_input):
         if len(pbsplit) > 1 and pbsplit[1] == 'filename':
             return problem_input["filename"]
         else:
-            return open(problem_input["value"], 'rb').read()
+            with open(problem_input["value"], 'rb') as file:
+                return file.read()
+    elif isinstance(problem_input, (list, dict)):
+        return copy.deepcopy(problem_input)  # the input is kept in cache: it must not be modified by the caller
     else:
         return problem_input
 
 
+def open_input(problem):
+    """ Returns a binary file object, opened for reading, containing the file given as answer to the specified problem.
+        Unlike get_input, the file is not read in memory.
+        problem: problem id
+    """
+    pbsplit = problem.split(":")
+    problem_input = _load_input()['input'][pbsplit[0]]
+    if not _is_file_input(problem_input) or pbsplit[1:] not in ([], ["value"]):
+        raise TypeError("The input of problem %s is not a file" % problem)
+    return open(problem_input["value"], 'rb')
+
+
+def _template_regex():
+    """ Returns a regex matching, in one pass, the markups @prefix@field@postfix@ of all the fields of the input """
+    data = _load_input()
+
+    # Check if 'input' in data
+    if not 'input' in data:
+        raise ValueError("Could not find 'input' in data")
+
+    if _input_cache[2] is None:
+        displayed_fields = []
+        for field, value in data['input'].items():
+            if _is_file_input(value):
+                displayed_fields += [field + ":filename", field + ":value"]
+            else:
+                displayed_fields.append(field)
+        # longest fields first, so that "field:filename" is not taken for "field"
+        alternatives = "|".join(re.escape(field) for field in sorted(displayed_fields, key=len, reverse=True))
+        _input_cache[2] = re.compile("@([^@]*)@(" + alternatives + ")@([^@]*)@") if alternatives else None
+    return _input_cache[2]
+
+
+def _parse_template_text(template, regex, values):
+    """ Replaces the markups of the fields in a template, given as a str
+        values: cache of the texts of the fields, by displayed field, shared by the templates parsed together
+    """
+    if regex is None:
+        return template
+
+    data = _load_input()
+
+    def replace(match):
+        prefix, displayed_field, postfix = match.groups()
+        if displayed_field not in values:
+            field, _, sub = displayed_field.partition(":")
+            if sub == "value":
+                with open(data['input'][field][sub], 'rb') as file:
+                    values[displayed_field] = file.read().decode('utf-8')
+            elif sub:
+                values[displayed_field] = data['input'][field][sub]
+            else:
+                values[displayed_field] = data['input'][field]
+        return "\n".join([prefix + v + postfix for v in values[displayed_field].splitlines()])
+
+    return regex.sub(replace, template)
+
+
 def parse_template(input_filename, output_filename=''):
     """ Parses a template file
         Replaces all occurences of @@problem_id@@ by the value
@@ -54,39 +128,38 @@ def parse_template(input_filename, output_filename=''):
         input_filename: file to parse
         output_filename: if not specified, overwrite input file
     """
-    data = _load_input()
-    with open(input_filename, 'rb') as file:
-        template = file.read().decode("utf-8")
-    
-    # Check if 'input' in data
-    if not 'input' in data:
-        raise ValueError("Could not find 'input' in data")
-    
-    # Parse template
-    for field in data['input']:
-        subs = ["filename", "value"] if isinstance(data['input'][field], dict) and "filename" in data['input'][field] and "value" in data['input'][field] else [""]
-        for sub in subs:
-            displayed_field = field + (":" if sub else "") + sub
-            regex = re.compile("@([^@]*)@" + displayed_field + '@([^@]*)@')
-            for prefix, postfix in set(regex.findall(template)):
-                if sub == "value":
-                    text = open(data['input'][field][sub], 'rb').read().decode('utf-8')
-                elif sub:
-                    text = data['input'][field][sub]
-                else:
-                    text = data['input'][field]
-                rep = "\n".join([prefix + v + postfix for v in text.splitlines()])
-                template = template.replace("@{0}@{1}@{2}@".format(prefix, displayed_field, postfix), rep)
-    
-    if output_filename == '':
-        output_filename=input_filename
-    
-    # Ensure directory of resulting file exists
-    try:
-        os.makedirs(os.path.dirname(output_filename))
-    except OSError as e:
-        pass
-
-    # Write file
-    with open(output_filename, 'wb') as file:
-        file.write(template.encode("utf-8"))
+    parse_templates([input_filename], [output_filename])
+
+
+def parse_templates(input_filenames, output_filenames=None):
+    """ Parses many template files in one pass: the input is only read once, and the files given as answers are read
+        at most once, for all the templates
+        
+        input_filenames: list of the files to parse
+        output_filenames: list of the files where the parsed templates are written, in the same order. If not
+                          specified (or for the empty names), the input files are overwritten.
+    """
+    regex = _template_regex()
+    values = {}
+    output_filenames = output_filenames or [''] * len(input_filenames)
+    if len(output_filenames) != len(input_filenames):
+        raise ValueError("There must be as many output files as templates")
+
+    for input_filename, output_filename in zip(input_filenames, output_filenames):
+        with open(input_filename, 'rb') as file:
+            template = file.read().decode("utf-8")
+
+        template = _parse_template_text(template, regex, values)
+
+        if output_filename == '':
+            output_filename=input_filename
+
+        # Ensure directory of resulting file exists
+        try:
+            os.makedirs(os.path.dirname(output_filename))
+        except OSError as e:
+            pass
+
+        # Write file
+        with open(output_filename, 'wb') as file:
+            file.write(template.encode("utf-8"))
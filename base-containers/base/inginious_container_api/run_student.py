@@ -4,9 +4,11 @@
 # more information about the licensing of this file.
 import array
 import os
+import selectors
 import signal
 import socket
 import tempfile
+import threading
 
 import msgpack
 import zmq
@@ -118,13 +120,143 @@ def run_student(cmd, container=None,
     except:
         return 254
 
+def _run_student_pumped(cmd, cmd_input, stdout_err_fuse, **run_student_args):
+    """
+    Runs `run_student` in a thread, while its stdin is written and its stdout/stderr are read concurrently, with pipes.
+    Large inputs and outputs thus never block the command.
+    :param cmd_input: input of the command, as bytes, or None
+    :return: a generator that yields ("stdout" or "stderr", bytes) as the outputs are read. Its return value (the
+             `value` of its StopIteration) is the return value of the command.
+    """
+    open_fds = set()
+
+    def pipe():
+        fds = os.pipe()
+        open_fds.update(fds)
+        return fds
+
+    def close(fd):
+        if fd in open_fds:
+            open_fds.remove(fd)
+            os.close(fd)
+
+    selector = selectors.DefaultSelector()
+    try:
+        stdin_r = stdin_w = None
+        if cmd_input is not None:
+            stdin_r, stdin_w = pipe()
+            os.set_blocking(stdin_w, False)
+            selector.register(stdin_w, selectors.EVENT_WRITE)
+        stdout_r, stdout_w = pipe()
+        streams = {stdout_r: "stdout"}
+        if stdout_err_fuse:
+            stderr_w = stdout_w
+        else:
+            stderr_r, stderr_w = pipe()
+            streams[stderr_r] = "stderr"
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+
+        # The ends of the pipes given to run_student belong to the thread: it closes them when the command has ended,
+        # so that the outputs end, and then writes in done_w
+        done_r, done_w = pipe()
+        selector.register(done_r, selectors.EVENT_READ)
+        thread_fds = {fd for fd in (stdin_r, stdout_w, stderr_w, done_w) if fd is not None}
+        retval = []
+
+        def run():
+            try:
+                retval.append(run_student(cmd, stdin=stdin_r, stdout=stdout_w, stderr=stderr_w, **run_student_args))
+            finally:
+                for fd in thread_fds - {done_w}:
+                    os.close(fd)
+                try:
+                    os.write(done_w, b'D')
+                except BrokenPipeError:
+                    pass  # the outputs are not read anymore
+                os.close(done_w)
+
+        thread = threading.Thread(target=run, daemon=True)
+        open_fds.difference_update(thread_fds)
+        thread.start()
+
+        cmd_input = memoryview(cmd_input) if cmd_input is not None else None
+        written = 0
+        while streams:
+            for key, _ in selector.select():
+                if key.fd not in open_fds:
+                    continue  # stdin_w, closed while handling a previous event
+                if key.fd == stdin_w:
+                    try:
+                        written += os.write(stdin_w, cmd_input[written:written + 65536])
+                    except BrokenPipeError:
+                        written = len(cmd_input)
+                    if written >= len(cmd_input):
+                        # all the input is written: the command reads EOF
+                        selector.unregister(stdin_w)
+                        close(stdin_w)
+                elif key.fd == done_r:
+                    # the command has ended: the input it did not read is dropped
+                    selector.unregister(done_r)
+                    if stdin_w in open_fds:
+                        selector.unregister(stdin_w)
+                        close(stdin_w)
+                else:
+                    data = os.read(key.fd, 65536)
+                    if data:
+                        yield streams[key.fd], data
+                    else:
+                        selector.unregister(key.fd)
+                        del streams[key.fd]
+
+        thread.join()
+        return retval[0] if retval else 254
+    finally:
+        # if the caller stopped reading, the command receives a SIGPIPE when it writes
+        selector.close()
+        for fd in list(open_fds):
+            close(fd)
+
+
+class _OutputCollector(object):
+    """ Limits each output stream to its first `max_output_size` bytes, and keeps them if `keep` is True """
+
+    def __init__(self, max_output_size, keep=True):
+        self._max_output_size = max_output_size
+        self._keep = keep
+        self.sizes = {"stdout": 0, "stderr": 0}
+        self.outputs = {"stdout": bytearray(), "stderr": bytearray()}
+        self.truncated = set()
+
+    def add(self, stream, data):
+        """ Adds data read from a stream, and returns the part of it that is within the limit """
+        size = self.sizes[stream]
+        if self._max_output_size is not None and size + len(data) > self._max_output_size:
+            data = data[:max(0, self._max_output_size - size)]
+            self.truncated.add(stream)
+        self.sizes[stream] = size + len(data)
+        if self._keep:
+            self.outputs[stream] += data
+        return data
+
+    def decode(self, stream, text):
+        """ Returns the output of a stream, decoded with the encoding `text` (or as bytes if it is False) """
+        output = bytes(self.outputs[stream])
+        if text is False:
+            return output
+        # a truncated output may end in the middle of a character
+        return output.decode(text, 'replace' if stream in self.truncated else 'strict')
+
+
 def run_student_simple(cmd, cmd_input=None, container=None,
         time_limit=0, hard_time_limit=0,
         memory_limit=0, share_network=False,
-        working_dir=None, stdout_err_fuse=False, text="utf-8"):
+        working_dir=None, stdout_err_fuse=False, text="utf-8", max_output_size=None):
     """
     A simpler version of `run`, which takes an input string and return the output of the command.
     This disallows interactive processes.
+    The input is written and the outputs are read while the command runs: they can be larger than the buffers of the
+    pipes.
 
     :param cmd: cmd to be run.
     :param cmd_input: input of the command. Can be a string or a bytes object, or None.
@@ -143,37 +275,103 @@ def run_student_simple(cmd, cmd_input=None, container=None,
                  will make the streams encoded using this encoding. text=False indicates that the streams should be
                  opened in binary mode. In this case, run_simple returns streams in the form of binary, unencoded,
                  strings.
+    :param max_output_size: maximum number of bytes kept from stdout, and from stderr. The rest of the outputs is read
+                            and dropped. By default it is None, which means that the outputs are not limited.
     :return: The output of the command, as a tuple of objects (stdout, stderr, retval). If stdout_err_fuse is True, the
              output is in the form (stdout, retval) is returned.
              The type of the returned strings (stdout, stderr) is dependent of the `text` arg.
     """
-    stdin = None
-    if cmd_input is not None:
-        r, w = os.pipe()
-        fdo = os.fdopen(w, 'w')
-        fdo.write(cmd_input)
-        fdo.close()
-        stdin = r
-
-    stdout_r, stdout_w = os.pipe()
-    if stdout_err_fuse:
-        stderr_r, stderr_w = stdout_r, stdout_w
-    else:
-        stderr_r, stderr_w = os.pipe()
-
-    retval = run_student(cmd, container, time_limit, hard_time_limit, memory_limit,
-                         share_network, working_dir, stdin, stdout_w, stderr_w)
+    if isinstance(cmd_input, str):
+        cmd_input = cmd_input.encode("utf-8")
 
-    preprocess_out = (lambda x: x.decode(text)) if text is not False else (lambda x: x)
+    collector = _OutputCollector(max_output_size)
+    outputs = _run_student_pumped(cmd, cmd_input, stdout_err_fuse, container=container, time_limit=time_limit,
+                                  hard_time_limit=hard_time_limit, memory_limit=memory_limit,
+                                  share_network=share_network, working_dir=working_dir)
+    while True:
+        try:
+            collector.add(*next(outputs))
+        except StopIteration as e:
+            retval = e.value
+            break
 
-    os.fdopen(stdout_w, 'w').close()
-    stdout = preprocess_out(os.fdopen(stdout_r, 'rb').read())
     if not stdout_err_fuse:
-        os.fdopen(stderr_w, 'w').close()
-        stderr = preprocess_out(os.fdopen(stderr_r, 'rb').read())
-        return stdout, stderr, retval
+        return collector.decode("stdout", text), collector.decode("stderr", text), retval
     else:
-        return stdout, retval
+        return collector.decode("stdout", text), retval
+
+
+class StudentOutputLines(object):
+    """
+    Lines written by a command run by `run_student_lines`, as they are written. Iterating over it yields tuples
+    (stream, line), where stream is "stdout" or "stderr", and line ends with its end of line (except the last line
+    of a stream, if it has none). It can be iterated only once.
+
+    Once the iteration is over, `retval` is the return value of the command, and `truncated` the set of the streams
+    whose output was larger than the `max_output_size` given to `run_student_lines`.
+    """
+
+    def __init__(self, outputs, text, max_output_size):
+        self._outputs = outputs
+        self._text = text
+        self._collector = _OutputCollector(max_output_size, keep=False)  # the lines are given, not kept
+        self.retval = None
+        self.truncated = self._collector.truncated
+
+    def _decode(self, line, stream):
+        if self._text is False:
+            return bytes(line)
+        return bytes(line).decode(self._text, 'replace' if stream in self.truncated else 'strict')
+
+    def __iter__(self):
+        pending = {"stdout": bytearray(), "stderr": bytearray()}  # start of the current line of each stream
+        while True:
+            try:
+                stream, data = next(self._outputs)
+            except StopIteration as e:
+                self.retval = e.value
+                break
+
+            data = self._collector.add(stream, data)
+            buffer = pending[stream]
+            buffer += data
+            end = buffer.rfind(b'\n') + 1
+            if end:
+                for line in bytes(buffer[:end]).splitlines(True):
+                    yield stream, self._decode(line, stream)
+                del buffer[:end]
+
+        for stream, buffer in pending.items():
+            if buffer:
+                yield stream, self._decode(buffer, stream)
+
+
+def run_student_lines(cmd, cmd_input=None, container=None,
+        time_limit=0, hard_time_limit=0,
+        memory_limit=0, share_network=False,
+        working_dir=None, stdout_err_fuse=False, text="utf-8", max_output_size=None):
+    """
+    A version of `run_student_simple` that gives the lines written by the command as they are written, instead of
+    its whole output once it has ended. The input is written while the command runs.
+
+    Example:
+        output = run_student_lines("student/prog", cmd_input=big_input, max_output_size=10 * 1024 * 1024)
+        for stream, line in output:
+            ...
+        retval = output.retval
+
+    The parameters are the same as the ones of `run_student_simple`. The command starts when the iteration starts.
+    If stdout_err_fuse is True, all the lines are given as "stdout". With max_output_size, the lines of a stream stop
+    after the given number of bytes (the last one may be cut).
+    :return: a StudentOutputLines
+    """
+    if isinstance(cmd_input, str):
+        cmd_input = cmd_input.encode("utf-8")
+
+    outputs = _run_student_pumped(cmd, cmd_input, stdout_err_fuse, container=container, time_limit=time_limit,
+                                  hard_time_limit=hard_time_limit, memory_limit=memory_limit,
+                                  share_network=share_network, working_dir=working_dir)
+    return StudentOutputLines(outputs, text, max_output_size)
 
 def _hack_signals(receive_signal):
     """ Catch every signal, and send it to the remote process """
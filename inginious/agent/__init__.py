@@ -12,9 +12,9 @@ from typing import Dict, Any, Optional
 
 import zmq
 
-from inginious.common.message_meta import ZMQUtils
+from inginious.common.message_meta import ZMQUtils, MessageMeta
 from inginious.common.messages import AgentHello, BackendJobId, SPResult, AgentJobDone, BackendNewJob, BackendKillJob, \
-    AgentJobStarted, AgentJobSSHDebug, Ping, Pong
+    AgentJobStarted, AgentJobSSHDebug, Ping, Pong, BackendNewJobBatch
 
 """
 Various utils to implements new kind of agents easily.
@@ -74,6 +74,7 @@ class Agent(object, metaclass=ABCMeta):
         self.__running_batch_job = set()
 
         self.__backend_last_seen_time = None
+        self.__hello_resent = False
 
         self.__asyncio_tasks_running = set()
 
@@ -99,6 +100,15 @@ class Agent(object, metaclass=ABCMeta):
         """
         return {}
 
+    @property
+    def resources(self):
+        """
+        :return: a dict of the resources shared by the jobs of the agent, e.g. {"memory": 16384} (in MB). The backend
+            only sends a job to the agent if the job fits in the resources left by the other running jobs. By default,
+            the agent gives no resources: only its number of concurrent jobs is limited.
+        """
+        return {}
+
     async def run(self):
         """
         Runs the agent. Answer to the requests made by the Backend.
@@ -109,7 +119,7 @@ class Agent(object, metaclass=ABCMeta):
 
         # Tell the backend we are up and have `concurrency` threads available
         self._logger.info("Saying hello to the backend")
-        await ZMQUtils.send(self.__backend_socket, AgentHello(self.__friendly_name, self.__concurrency, self.environments))
+        await self.__say_hello()
         self.__backend_last_seen_time = time.time()
 
         run_listen = self._loop.create_task(self.__run_listen())
@@ -118,13 +128,23 @@ class Agent(object, metaclass=ABCMeta):
 
         await run_listen
 
+    async def __say_hello(self):
+        """ Tell the backend we are up, have `concurrency` slots, and the jobs we are still running """
+        await ZMQUtils.send(self.__backend_socket, AgentHello(self.__friendly_name, self.__concurrency, self.environments, True,
+                                                              list(self.__running_job), self.resources))
+
     async def __check_last_ping(self, run_listen):
         """ Check if the last timeout is too old. If it is, kills the run_listen task """
-        if self.__backend_last_seen_time < time.time()-10:
+        if self.__backend_last_seen_time < time.time()-30:
             self._logger.warning("Last ping too old. Restarting the agent.")
             run_listen.cancel()
             self.__cancel_remaining_safe_tasks()
         else:
+            if self.__backend_last_seen_time < time.time()-3 and not self.__hello_resent:
+                # The backend may have restarted: say hello again, so that it knows the jobs we are running
+                self._logger.warning("No ping from the backend for 3 seconds. Saying hello again.")
+                self.__hello_resent = True
+                await self.__say_hello()
             self._loop.call_later(1, self._create_safe_task, self.__check_last_ping(run_listen))
 
     async def __run_listen(self):
@@ -136,8 +156,10 @@ class Agent(object, metaclass=ABCMeta):
     async def __handle_backend_message(self, message):
         """ Dispatch messages received from clients to the right handlers """
         self.__backend_last_seen_time = time.time()
+        self.__hello_resent = False
         message_handlers = {
             BackendNewJob: self.__handle_new_job,
+            BackendNewJobBatch: self.__handle_new_job_batch,
             BackendKillJob: self.kill_job,
             Ping: self.__handle_ping
         }
@@ -151,6 +173,11 @@ class Agent(object, metaclass=ABCMeta):
         """ Handle a Ping message. Pong the backend """
         await ZMQUtils.send(self.__backend_socket, Pong())
 
+    async def __handle_new_job_batch(self, message: BackendNewJobBatch):
+        """ Handle a BackendNewJobBatch message. Each job is started as if it was received alone """
+        for dumped_message in message.messages:
+            await self.__handle_backend_message(MessageMeta.load(dumped_message))
+
     async def __handle_new_job(self, message: BackendNewJob):
         self._logger.info("Received request for jobid %s", message.job_id)
 
@@ -10,6 +10,7 @@ import os
 import shutil
 import struct
 import tempfile
+import time
 from os.path import join as path_join
 
 import msgpack
@@ -17,15 +18,21 @@ import psutil
 from inginious.agent.docker_agent._docker_interface import DockerInterface
 
 from inginious.agent import Agent, CannotCreateJobException
+from inginious.agent.docker_agent._cleanup_queue import CleanupQueue
+from inginious.agent.docker_agent._container_output import ContainerOutputParser
+from inginious.agent.docker_agent._container_pool import ContainerPool
+from inginious.agent.docker_agent._task_cache import TaskCache
 from inginious.agent.docker_agent._timeout_watcher import TimeoutWatcher
-from inginious.common.asyncio_utils import AsyncIteratorWrapper, AsyncProxy
+from inginious.common.asyncio_utils import AsyncIteratorWrapper, AsyncProxy, MeasuredThreadPoolExecutor
 from inginious.common.base import id_checker, id_checker_tests
 from inginious.common.filesystems.provider import FileSystemProvider
 from inginious.common.messages import BackendNewJob, BackendKillJob
 
 
 class DockerAgent(Agent):
-    def __init__(self, context, backend_addr, friendly_name, concurrency, tasks_fs: FileSystemProvider, address_host=None, external_ports=None, tmp_dir="./agent_tmp"):
+    def __init__(self, context, backend_addr, friendly_name, concurrency, tasks_fs: FileSystemProvider, address_host=None, external_ports=None, tmp_dir="./agent_tmp",
+                 docker_threads=None, staging_threads=None, cleanup_threads=2, warm_containers=0, warm_min_free_memory=0.1,
+                 task_staging="copy", max_message_size=100 * 1024 * 1024, memory=None):
         """
         :param context: ZeroMQ context for this process
         :param backend_addr: address of the backend (for example, "tcp://127.0.0.1:2222")
@@ -35,11 +42,29 @@ class DockerAgent(Agent):
         :param address_host: hostname/ip/... to which external client should connect to access to the docker
         :param external_ports: iterable containing ports to which the docker instance can bind internal ports
         :param tmp_dir: temp dir that is used by the agent to start new containers
+        :param docker_threads: number of threads doing the (blocking) calls to Docker that create, start and kill the
+            containers. Defaults to concurrency + 4.
+        :param staging_threads: number of threads copying the files of the tasks for the new jobs. Defaults to concurrency.
+        :param cleanup_threads: number of threads removing the containers and the files of the finished jobs (see
+            CleanupQueue).
+        :param warm_containers: maximum number of grading containers created and started in advance (see ContainerPool).
+            0 disables the pool.
+        :param warm_min_free_memory: fraction of the memory of the host that must stay available. Below, warm containers
+            are removed.
+        :param task_staging: how the files of the task are given to the containers.
+            "copy" copies them from tasks_fs for each job.
+            "cache" copies each version of the task once in a local cache (see TaskCache). The course common files are
+            then mounted from the cache, and the task files are cloned from it (or copied if the filesystem of tmp_dir
+            does not support reflinks).
+        :param max_message_size: maximum size, in bytes, of a message sent by a grading container (e.g. its result).
+            Larger messages are dropped.
+        :param memory: memory shared by the grading containers, in MB. The backend only sends a job to the agent if its
+            memory limit fits in the memory left by the running jobs. Defaults to the total memory of the host.
         """
         super(DockerAgent, self).__init__(context, backend_addr, friendly_name, concurrency, tasks_fs)
         self._logger = logging.getLogger("inginious.agent.docker")
 
-        self._max_memory_per_slot = int(psutil.virtual_memory().total / concurrency / 1024 / 1024)
+        self._memory = memory if memory is not None else int(psutil.virtual_memory().total / 1024 / 1024)
 
         self.tasks_fs = tasks_fs
 
@@ -50,9 +75,21 @@ class DockerAgent(Agent):
         self._address_host = address_host
         self._external_ports = set(external_ports) if external_ports is not None else set()
 
-        # Async proxy to os
-        self._aos = AsyncProxy(os)
-        self._ashutil = AsyncProxy(shutil)
+        # Thread pools: calls to Docker, staging of the files of the new jobs, cleanup of the finished jobs. The
+        # connections to the Docker daemon are used by the threads of the first and last pools, the event stream and
+        # the streams of the running containers.
+        self._docker_threads = docker_threads if docker_threads is not None else concurrency + 4
+        self._staging_threads = staging_threads if staging_threads is not None else concurrency
+        self._cleanup_threads = cleanup_threads
+        self._docker_pool_size = self._docker_threads + self._cleanup_threads + concurrency + 1
+
+        # Warm containers
+        self._warm_containers = warm_containers
+        self._task_staging = task_staging
+        self._warm_min_free_memory = warm_min_free_memory
+
+        # Messages sent by the grading containers
+        self._max_message_size = max_message_size
 
     async def _init_clean(self):
         """ Must be called when the agent is starting """
@@ -65,19 +102,30 @@ class DockerAgent(Agent):
 
         self._containers_killed = dict()
 
-        # Delete tmp_dir, and recreate-it again
-        try:
-            await self._ashutil.rmtree(self._tmp_dir)
-        except OSError:
-            pass
+        # Thread pools
+        self._docker_executor = MeasuredThreadPoolExecutor(self._docker_threads, "docker")
+        self._staging_executor = MeasuredThreadPoolExecutor(self._staging_threads, "staging")
+        self._cleanup_executor = MeasuredThreadPoolExecutor(self._cleanup_threads, "cleanup")
+        self._create_safe_task(self._report_executors())
 
+        # Removal of the containers and directories of the finished jobs, in the background
+        self._cleanup_queue = CleanupQueue(self._cleanup_threads, executor=self._cleanup_executor)
+
+        # Create tmp_dir, and delete the files left in it in the background
+        self._aos = AsyncProxy(os, executor=self._staging_executor)
         try:
             await self._aos.mkdir(self._tmp_dir)
         except OSError:
             pass
+        leftovers = await self._loop.run_in_executor(self._staging_executor, _move_leftovers, self._tmp_dir)
+        if leftovers is not None:
+            await self._cleanup_queue.put(shutil.rmtree, leftovers, True)
+
+        self._task_cache = TaskCache(path_join(self._tmp_dir, "task_cache")) if self._task_staging == "cache" else None
+        self._cached_for_container = {}  # container_id: path of the cached version of $common mounted in the container
 
         # Docker
-        self._docker = AsyncProxy(DockerInterface())
+        self._docker = AsyncProxy(DockerInterface(self._docker_pool_size), executor=self._docker_executor)
 
         # Auto discover containers
         self._logger.info("Discovering containers")
@@ -100,6 +148,11 @@ class DockerAgent(Agent):
         # Watchers
         self._timeout_watcher = TimeoutWatcher(self._docker)
 
+        # Warm containers
+        self._container_pool = ContainerPool(self._warm_containers)
+        if self._container_pool.enabled:
+            self._create_safe_task(self._maintain_container_pool())
+
     async def _end_clean(self):
         """ Must be called when the agent is closing """
         await self._timeout_watcher.clean()
@@ -114,11 +167,22 @@ class DockerAgent(Agent):
             await close_and_delete(container_id)
         for container_id  in self._student_containers_running:
             await close_and_delete(container_id)
+        for container_id, _ in self._container_pool.remove_all():
+            await close_and_delete(container_id)
+        await self._cleanup_queue.close()
+
+        self._docker.sync.close()
+        self._docker_executor.shutdown(wait=False)
+        self._staging_executor.shutdown(wait=False)
 
     @property
     def environments(self):
         return self._containers
 
+    @property
+    def resources(self):
+        return {"memory": self._memory}
+
     async def _watch_docker_events(self):
         """ Get raw docker events and convert them to more readable objects, and then give them to self._docker_events_subscriber """
         try:
@@ -138,6 +202,11 @@ class DockerAgent(Agent):
                         self._create_safe_task(self.handle_job_closing(container_id, retval))
                     elif container_id in self._student_containers_running:
                         self._create_safe_task(self.handle_student_job_closing(container_id, retval))
+                    else:
+                        container_path = self._container_pool.discard(container_id)
+                        if container_path is not None:
+                            self._logger.warning("Warm container %s died, removing it", container_id)
+                            self._create_safe_task(self._remove_warm_containers([(container_id, container_path)]))
                 elif i["Type"] == "container" and i["status"] == "oom":
                     container_id = i["id"]
                     if container_id in self._containers_running or container_id in self._student_containers_running:
@@ -156,8 +225,12 @@ class DockerAgent(Agent):
         except:
             self._logger.exception("Exception in _watch_docker_events")
 
-    def __new_job_sync(self, message: BackendNewJob, future_results):
-        """ Synchronous part of _new_job. Creates needed directories, copy files, and starts the container. """
+    def __stage_job_sync(self, message: BackendNewJob):
+        """
+        First synchronous part of new_job: checks the job, takes a warm container or creates the directories of a new
+        one, and copies the files of the task in them.
+        :return: a dict describing the job, for __start_job_sync
+        """
         course_id = message.course_id
         task_id = message.task_id
 
@@ -185,10 +258,10 @@ class DockerAgent(Agent):
         # Check for realistic memory limit value
         if mem_limit < 20:
             mem_limit = 20
-        elif mem_limit > self._max_memory_per_slot:
+        elif mem_limit > self._memory:
             self._logger.warning("Task %s/%s ask for too much memory (%dMB)! Available: %dMB", course_id, task_id,
-                                 mem_limit, self._max_memory_per_slot)
-            raise CannotCreateJobException('Not enough memory on agent (available: %dMB). Please contact your course administrator.' % self._max_memory_per_slot)
+                                 mem_limit, self._memory)
+            raise CannotCreateJobException('Not enough memory on agent (available: %dMB). Please contact your course administrator.' % self._memory)
 
         if environment_name not in self._containers:
             self._logger.warning("Task %s/%s ask for an unknown environment %s (not in aliases)", course_id, task_id,
@@ -212,65 +285,102 @@ class DockerAgent(Agent):
                 raise CannotCreateJobException('No ports are available right now. Please retry later.')
             ports[p] = self._external_ports.pop()
 
-        # Create directories for storing all the data for the job
-        try:
-            container_path = tempfile.mkdtemp(dir=self._tmp_dir)
-        except Exception as e:
-            self._logger.error("Cannot make container temp directory! %s", str(e), exc_info=True)
-            for p in ports:
-                self._external_ports.add(ports[p])
-            raise CannotCreateJobException('Cannot make container temp directory.')
-
-        task_path = path_join(container_path, 'task')  # tmp_dir/id/task/
-        course_path = path_join(container_path, 'course')
+        # Take a warm container if possible. Their directories are already created, and mounted in the container.
+        warm_container = self._container_pool.take((environment, mem_limit, enable_network)) if not ports else None
+        if warm_container is not None:
+            container_id, container_path = warm_container
+        else:
+            # Create directories for storing all the data for the job
+            try:
+                container_path = self._create_container_directories()
+            except Exception as e:
+                self._logger.error("Cannot make container temp directory! %s", str(e), exc_info=True)
+                for p in ports:
+                    self._external_ports.add(ports[p])
+                raise CannotCreateJobException('Cannot make container temp directory.')
 
-        sockets_path = path_join(container_path, 'sockets')  # tmp_dir/id/socket/
+        task_path, sockets_path, course_common_path, course_common_student_path = _container_directories(container_path)
         student_path = path_join(task_path, 'student')  # tmp_dir/id/task/student/
         systemfiles_path = path_join(task_path, 'systemfiles')  # tmp_dir/id/task/systemfiles/
 
-        course_common_path = path_join(course_path, 'common')
-        course_common_student_path = path_join(course_path, 'common', 'student')
-
-        # Create the needed directories
-        os.mkdir(sockets_path)
-        os.chmod(container_path, 0o777)
-        os.chmod(sockets_path, 0o777)
-        os.mkdir(course_path)
-
-        # TODO: avoid copy
-        task_fs.copy_from(None, task_path)
-        os.chmod(task_path, 0o777)
-
-        if not os.path.exists(student_path):
-            os.mkdir(student_path)
-            os.chmod(student_path, 0o777)
-
-        # Copy common and common/student if needed
-        # TODO: avoid copy
-        if course_fs.from_subfolder("$common").exists():
-            course_fs.from_subfolder("$common").copy_from(None, course_common_path)
-        else:
-            os.mkdir(course_common_path)
+        cached_common = None
+        try:
+            self._stage(task_fs, task_path)
+            os.chmod(task_path, 0o777)
+
+            if not os.path.exists(student_path):
+                os.mkdir(student_path)
+                os.chmod(student_path, 0o777)
+
+            # Copy common and common/student if needed
+            common_fs = course_fs.from_subfolder("$common")
+            if self._task_cache is not None and warm_container is None and common_fs.exists():
+                # These directories are mounted read-only: they can be mounted from the cache
+                cached_common = self._task_cache.acquire(common_fs)
+                course_common_path = cached_common
+                if os.path.isdir(path_join(cached_common, "student")):
+                    course_common_student_path = path_join(cached_common, "student")
+            elif self._task_cache is not None and common_fs.exists():
+                self._stage(common_fs, course_common_path)  # includes common/student
+            else:
+                if common_fs.exists():
+                    common_fs.copy_from(None, course_common_path)
+                if common_fs.from_subfolder("student").exists():
+                    common_fs.from_subfolder("student").copy_from(None, course_common_student_path)
+        except Exception as e:
+            self._logger.warning("Cannot copy the task files of %s/%s! %s", course_id, task_id, str(e), exc_info=True)
+            if cached_common is not None:
+                self._task_cache.release(cached_common)
+            for p in ports:
+                self._external_ports.add(ports[p])
+            if warm_container is not None:
+                # the container is not in the pool anymore: it must be removed, with its directories
+                self._loop.call_soon_threadsafe(self._create_safe_task, self._remove_warm_containers([warm_container]))
+            else:
+                shutil.rmtree(container_path, ignore_errors=True)
+            raise CannotCreateJobException('Cannot copy the task files.')
+
+        return {"message": message, "container_id": warm_container[0] if warm_container is not None else None,
+                "container_path": container_path, "environment": environment, "environment_name": environment_name,
+                "enable_network": enable_network, "mem_limit": mem_limit, "time_limit": time_limit,
+                "hard_time_limit": hard_time_limit, "run_cmd": run_cmd, "ports": ports, "task_path": task_path,
+                "sockets_path": sockets_path, "student_path": student_path, "systemfiles_path": systemfiles_path,
+                "course_common_path": course_common_path, "course_common_student_path": course_common_student_path,
+                "cached_common": cached_common}
+
+    def __start_job_sync(self, job, future_results):
+        """
+        Second synchronous part of new_job: creates and starts the container of a job staged by __stage_job_sync (if it
+        did not take a warm container).
+        :return: the arguments of handle_running_container
+        """
+        message, container_path, ports, cached_common = job["message"], job["container_path"], job["ports"], job["cached_common"]
 
-        if course_fs.from_subfolder("$common").from_subfolder("student").exists():
-            course_fs.from_subfolder("$common").from_subfolder("student").copy_from(None, course_common_student_path)
-        else:
-            os.mkdir(course_common_student_path)
+        if job["container_id"] is not None:
+            # The container is already started, and waits for the start message
+            self._containers_running[job["container_id"]] = message, container_path, future_results
+            self._container_for_job[message.job_id] = job["container_id"]
+            self._student_containers_for_job[message.job_id] = set()
+            return self.__new_job_info(job, job["container_id"])
 
         # Run the container
         try:
-            container_id = self._docker.sync.create_container(environment, enable_network, mem_limit, task_path,
-                                                              sockets_path, course_common_path,
-                                                              course_common_student_path, ports)
+            container_id = self._docker.sync.create_container(job["environment"], job["enable_network"], job["mem_limit"],
+                                                              job["task_path"], job["sockets_path"], job["course_common_path"],
+                                                              job["course_common_student_path"], ports)
         except Exception as e:
             self._logger.warning("Cannot create container! %s", str(e), exc_info=True)
             shutil.rmtree(container_path)
+            if cached_common is not None:
+                self._task_cache.release(cached_common)
             for p in ports:
                 self._external_ports.add(ports[p])
             raise CannotCreateJobException('Cannot create container.')
 
         # Store info
         self._containers_running[container_id] = message, container_path, future_results
+        if cached_common is not None:
+            self._cached_for_container[container_id] = cached_common
         self._container_for_job[message.job_id] = container_id
         self._student_containers_for_job[message.job_id] = set()
 
@@ -283,35 +393,162 @@ class DockerAgent(Agent):
         except Exception as e:
             self._logger.warning("Cannot start container! %s", str(e), exc_info=True)
             shutil.rmtree(container_path)
+            if container_id in self._cached_for_container:
+                self._task_cache.release(self._cached_for_container.pop(container_id))
             for p in ports:
                 self._external_ports.add(ports[p])
 
             raise CannotCreateJobException('Cannot start container')
 
+        return self.__new_job_info(job, container_id)
+
+    def __new_job_info(self, job, container_id):
+        """ Returns the arguments of handle_running_container for a job whose container is started """
         return {
-            "job_id": message.job_id,
+            "job_id": job["message"].job_id,
             "container_id": container_id,
-            "inputdata": message.inputdata,
-            "debug": debug,
-            "ports": ports,
-            "orig_env": environment_name,
-            "orig_memory_limit": mem_limit,
-            "orig_time_limit": time_limit,
-            "orig_hard_time_limit": hard_time_limit,
-            "sockets_path": sockets_path,
-            "student_path": student_path,
-            "systemfiles_path": systemfiles_path,
-            "course_common_student_path": course_common_student_path,
-            "run_cmd": run_cmd
+            "inputdata": job["message"].inputdata,
+            "debug": job["message"].debug,
+            "ports": job["ports"],
+            "orig_env": job["environment_name"],
+            "orig_memory_limit": job["mem_limit"],
+            "orig_time_limit": job["time_limit"],
+            "orig_hard_time_limit": job["hard_time_limit"],
+            "sockets_path": job["sockets_path"],
+            "student_path": job["student_path"],
+            "systemfiles_path": job["systemfiles_path"],
+            "course_common_student_path": job["course_common_student_path"],
+            "run_cmd": job["run_cmd"]
         }
 
+    def _stage(self, fs, dest):
+        """ Puts the files of a FileSystemProvider in dest: copied from it, or cloned from the task cache """
+        if self._task_cache is None:
+            fs.copy_from(None, dest)
+            return
+        cached = self._task_cache.acquire(fs)
+        try:
+            self._task_cache.clone_tree(cached, dest)
+        finally:
+            self._task_cache.release(cached)
+
+    def _create_container_directories(self):
+        """ Creates the directories mounted in a grading container (see _container_directories), and returns their parent """
+        container_path = tempfile.mkdtemp(dir=self._tmp_dir)
+        task_path, sockets_path, course_common_path, course_common_student_path = _container_directories(container_path)
+        os.mkdir(sockets_path)
+        os.chmod(container_path, 0o777)
+        os.chmod(sockets_path, 0o777)
+        os.mkdir(task_path)
+        os.makedirs(course_common_student_path)
+        return container_path
+
+    def _create_warm_container_sync(self, key):
+        """ Creates and starts a grading container for the pool. Synchronous. """
+        environment, mem_limit, enable_network = key
+        container_path = None
+        try:
+            container_path = self._create_container_directories()
+            task_path, sockets_path, course_common_path, course_common_student_path = _container_directories(container_path)
+            container_id = self._docker.sync.create_container(environment, enable_network, mem_limit, task_path,
+                                                              sockets_path, course_common_path,
+                                                              course_common_student_path)
+        except:
+            self._logger.warning("Cannot create warm container!", exc_info=True)
+            self._container_pool.creation_failed(key)
+            if container_path is not None:
+                shutil.rmtree(container_path, ignore_errors=True)
+            return
+
+        try:
+            self._docker.sync.start_container(container_id)
+        except:
+            self._logger.warning("Cannot start warm container!", exc_info=True)
+            self._container_pool.creation_failed(key)
+            self._remove_warm_container_sync(container_id, container_path)
+            return
+        self._container_pool.add(key, container_id, container_path)
+
+    def _remove_container_sync(self, container_id):
+        """ Removes a container. Synchronous. """
+        try:
+            self._docker.sync.remove_container(container_id)
+        except:
+            pass  # ignore
+
+    def _remove_job_container_sync(self, container_id, container_path, cached_path):
+        """ Removes the grading container of a finished job, its directories, and releases its cached files. Synchronous. """
+        self._remove_container_sync(container_id)
+        try:
+            shutil.rmtree(container_path)
+        except PermissionError:
+            self._logger.debug("Cannot remove old container path!")
+            pass  # todo: run a docker container to force removal
+        if cached_path is not None:
+            self._task_cache.release(cached_path)
+
+    def _remove_warm_container_sync(self, container_id, container_path):
+        """ Removes a container that was in the pool, and its directories. Synchronous. """
+        self._remove_container_sync(container_id)
+        shutil.rmtree(container_path, ignore_errors=True)
+
+    async def _remove_warm_containers(self, containers):
+        """ Removes containers that were in the pool """
+        for container_id, container_path in containers:
+            await self._cleanup_queue.put(self._remove_warm_container_sync, container_id, container_path)
+
+    async def _maintain_container_pool(self):
+        """ Fills the pool of warm containers according to the demand, and empties it when memory is scarce """
+        last_report = time.time()
+        while True:
+            memory = psutil.virtual_memory()
+            missing_memory = (memory.total * self._warm_min_free_memory - memory.available) / 1024 / 1024
+            if missing_memory > 0:
+                evicted = self._container_pool.evict_for_memory(missing_memory)
+                if evicted:
+                    self._logger.info("Removing %i warm containers, as memory is scarce", len(evicted))
+            else:
+                evicted = self._container_pool.surplus()
+                for key in self._container_pool.to_create():
+                    self._loop.run_in_executor(self._docker_executor, self._create_warm_container_sync, key)
+            await self._remove_warm_containers(evicted)
+
+            if time.time() - last_report > 60:
+                last_report = time.time()
+                stats = self._container_pool.stats()
+                self._logger.info("Warm containers: %i hits, %i misses, %i evictions, %i warm. Job start latency: "
+                                  "p50 %.0f ms, p99 %.0f ms", stats["hits"], stats["misses"], stats["evictions"],
+                                  stats["warm"], stats["start_latency_p50"] * 1000, stats["start_latency_p99"] * 1000)
+            await asyncio.sleep(self._container_pool.refill_interval)
+
+    async def _report_executors(self):
+        """ Logs, every minute, how long the calls waited for a thread in each thread pool """
+        executors = [self._docker_executor, self._staging_executor, self._cleanup_executor]
+        calls = {executor.name: 0 for executor in executors}
+        while True:
+            await asyncio.sleep(60)
+            for executor in executors:
+                stats = executor.stats()
+                if stats["calls"] != calls[executor.name]:
+                    calls[executor.name] = stats["calls"]
+                    self._logger.info("Thread pool %s (%i threads): %i calls queued, wait p50 %.0f ms, p99 %.0f ms, "
+                                      "max %.0f ms", executor.name, executor.size, stats["queued"],
+                                      stats["wait_p50"] * 1000, stats["wait_p99"] * 1000, stats["wait_max"] * 1000)
+
     async def new_job(self, message: BackendNewJob):
         """
         Handles a new job: starts the grading container
         """
         self._logger.info("Received request for jobid %s", message.job_id)
         future_results = asyncio.Future()
-        out = await self._loop.run_in_executor(None, lambda: self.__new_job_sync(message, future_results))
+        start = time.time()
+        with self._cleanup_queue.job_starting():
+            job = await self._loop.run_in_executor(self._staging_executor, self.__stage_job_sync, message)
+            if job["container_id"] is None:
+                out = await self._loop.run_in_executor(self._docker_executor, self.__start_job_sync, job, future_results)
+            else:  # the warm container is already started
+                out = self.__start_job_sync(job, future_results)
+        self._container_pool.record_start_latency(time.time() - start)
         self._create_safe_task(self.handle_running_container(**out, future_results=future_results))
         await self._timeout_watcher.register_container(out["container_id"], out["orig_time_limit"], out["orig_hard_time_limit"])
 
@@ -334,9 +571,10 @@ class DockerAgent(Agent):
 
             try:
                 socket_path = path_join(sockets_path, str(socket_id) + ".sock")
-                container_id = await self._docker.create_container_student(parent_container_id, environment, share_network,
-                                                                           memory_limit, student_path, socket_path,
-                                                                           systemfiles_path, course_common_student_path)
+                with self._cleanup_queue.job_starting():
+                    container_id = await self._docker.create_container_student(parent_container_id, environment, share_network,
+                                                                               memory_limit, student_path, socket_path,
+                                                                               systemfiles_path, course_common_student_path)
             except Exception as e:
                 self._logger.exception("Cannot create student container!")
                 await self._write_to_container_stdin(write_stream, {"type": "run_student_retval", "retval": 254, "socket_id": socket_id})
@@ -396,31 +634,28 @@ class DockerAgent(Agent):
             return None
 
         # Send hello msg
-        hello_msg = {"type": "start", "input": inputdata, "debug": debug}
+        hello_msg = {"type": "start", "input": inputdata, "debug": debug, "binary_archive": True}
         if run_cmd is not None:
             hello_msg["run_cmd"] = run_cmd
         await self._write_to_container_stdin(write_stream, hello_msg)
         result = None
 
-        buffer = bytearray()
+        parser = ContainerOutputParser(container_id, self._max_message_size)
         try:
             while not read_stream.at_eof():
                 msg_header = await read_stream.readexactly(8)
                 outtype, length = struct.unpack_from('>BxxxL', msg_header)  # format imposed by docker in the attach endpoint
                 if length != 0:
                     content = await read_stream.readexactly(length)
+                    messages = []
                     if outtype == 1:  # stdout
-                        buffer += content
+                        messages = parser.feed(content)
 
                     if outtype == 2:  # stderr
                         self._logger.debug("Received stderr from containers:\n%s", content)
 
-                    # 4 first bytes are the length of the message. If we have a complete message...
-                    while len(buffer) > 4 and len(buffer) >= 4+struct.unpack('I',buffer[0:4])[0]:
-                        msg_encoded = buffer[4:4 + struct.unpack('I', buffer[0:4])[0]]  # ... get it
-                        buffer = buffer[4 + struct.unpack('I', buffer[0:4])[0]:]  # ... withdraw it from the buffer
+                    for msg in messages:
                         try:
-                            msg = msgpack.unpackb(msg_encoded, use_list=False)
                             self._logger.debug("Received msg %s from container %s", msg["type"], container_id)
                             if msg["type"] == "run_student":
                                 # start a new student container
@@ -499,12 +734,7 @@ class DockerAgent(Agent):
                 pass  # parent container closed
 
             # Do not forget to remove the container
-            try:
-                await self._docker.remove_container(container_id)
-            except asyncio.CancelledError:
-                raise
-            except:
-                pass  # ignore
+            await self._cleanup_queue.put(self._remove_container_sync, container_id)
         except asyncio.CancelledError:
             raise
         except:
@@ -573,7 +803,7 @@ class DockerAgent(Agent):
 
                     # Accepted types for return dict
                     accepted_types = {"stdout": str, "stderr": str, "result": str, "text": str, "grade": float,
-                                      "problems": dict, "custom": dict, "tests": dict, "state": str, "archive": str}
+                                      "problems": dict, "custom": dict, "tests": dict, "state": str, "archive": (bytes, str)}
 
                     keys_fct = {"problems": id_checker, "custom": id_checker, "tests": id_checker_tests}
 
@@ -597,7 +827,7 @@ class DockerAgent(Agent):
                     tests = return_value.get("tests", {})
                     state = return_value.get("state", "")
                     archive = return_value.get("archive", None)
-                    if archive is not None:
+                    if isinstance(archive, str):  # containers that do not support binary_archive
                         archive = base64.b64decode(archive)
                 except Exception as e:
                     self._logger.exception("Cannot get back output of container %s! (%s)", container_id, str(e))
@@ -613,26 +843,15 @@ class DockerAgent(Agent):
                 else:
                     grade = 0.0
 
-            # Remove container
-            try:
-                await self._docker.remove_container(container_id)
-            except asyncio.CancelledError:
-                raise
-            except:
-                pass
-
-            # Delete folders
-            try:
-                await self._ashutil.rmtree(container_path)
-            except PermissionError:
-                self._logger.debug("Cannot remove old container path!")
-                pass  # todo: run a docker container to force removal
-
             # Return!
             await self.send_job_result(message.job_id, result, error_msg, grade, problems, tests, custom, state, archive, stdout, stderr)
 
             # Do not forget to remove data from internal state
             del self._container_for_job[message.job_id]
+
+            # Remove the container and its folders
+            await self._cleanup_queue.put(self._remove_job_container_sync, container_id, container_path,
+                                          self._cached_for_container.pop(container_id, None))
         except asyncio.CancelledError:
             raise
         except:
@@ -665,3 +884,24 @@ class DockerAgent(Agent):
         except:
             await self._end_clean()
             raise
+
+
+def _move_leftovers(tmp_dir):
+    """
+    Moves the files left in tmp_dir by a previous run of the agent to a new directory of tmp_dir, to be deleted
+    :return: the path of this directory, or None if there was nothing to move
+    """
+    entries = os.listdir(tmp_dir)
+    if not entries:
+        return None
+    leftovers = tempfile.mkdtemp(dir=tmp_dir, prefix="leftovers-")
+    for entry in entries:
+        os.rename(path_join(tmp_dir, entry), path_join(leftovers, entry))
+    return leftovers
+
+
+def _container_directories(container_path):
+    """ Returns the paths of the directories mounted in a grading container: task, sockets, course common and course common student """
+    course_common_path = path_join(container_path, 'course', 'common')
+    return (path_join(container_path, 'task'), path_join(container_path, 'sockets'), course_common_path,
+            path_join(course_common_path, 'student'))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Background removal of the containers and directories of the docker agent
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CleanupQueue(object):
+    """
+        Runs the cleanup of the finished jobs (removal of their containers and of their directories) in the background,
+        after their result was sent.
+
+        The cleanup operations are synchronous functions, run by `workers` threads of their own, so that they never take
+        all the threads doing the calls to Docker. They also give way to the creation of the jobs: while a job is being
+        created (see job_starting), the workers wait before starting a new operation, for at most `max_delay` seconds.
+
+        The queue holds at most `max_size` operations: when it is full, put waits for a free place. The counters of the
+        queue (see stats) are logged every `report_interval` seconds while it is used.
+    """
+
+    def __init__(self, workers=2, max_size=1000, max_delay=5.0, report_interval=60.0, executor=None):
+        """
+        :param workers: number of threads running the cleanup operations
+        :param max_size: maximum number of operations waiting in the queue
+        :param max_delay: maximum time, in seconds, an operation waits for the end of the job creations
+        :param report_interval: minimal interval between two logs of the counters, in seconds
+        :param executor: executor of `workers` threads running the operations. By default, the queue creates its own.
+        """
+        self._logger = logging.getLogger("inginious.agent.docker")
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cleanup")
+        self._max_delay = max_delay
+        self._jobs_starting = 0
+        self._no_job_starting = asyncio.Event()
+        self._no_job_starting.set()
+        self._waiting = []  # operations taken by the workers, waiting for the end of the job creations
+        self._running = 0
+        self._done = 0
+        self._failed = 0
+        self._report_interval = report_interval
+        self._last_report = time.monotonic()
+        self._workers = [self._loop.create_task(self._work()) for _ in range(workers)]
+
+    async def put(self, function, *args):
+        """ Queues a call to a synchronous cleanup function """
+        if self._queue.full():
+            self._logger.warning("The cleanup queue is full (%i operations), waiting for a free place", self._queue.maxsize)
+        await self._queue.put((function, args))
+
+    @contextlib.contextmanager
+    def job_starting(self):
+        """ Context manager around the creation of a job, during which the cleanup waits """
+        self._jobs_starting += 1
+        self._no_job_starting.clear()
+        try:
+            yield
+        finally:
+            self._jobs_starting -= 1
+            if not self._jobs_starting:
+                self._no_job_starting.set()
+
+    def stats(self):
+        """ Returns the number of operations waiting in the queue, being run, done and failed """
+        return {"queued": self._queue.qsize() + len(self._waiting), "running": self._running, "done": self._done, "failed": self._failed}
+
+    async def close(self):
+        """ Stops the workers, and runs the operations left in the queue """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for operation in self._waiting + [self._queue.get_nowait() for _ in range(self._queue.qsize())]:
+            await self._run(*operation)
+        self._waiting = []
+        self._executor.shutdown(wait=False)
+
+    async def _work(self):
+        while True:
+            operation = await self._queue.get()
+            self._waiting.append(operation)
+            try:
+                await asyncio.wait_for(self._no_job_starting.wait(), self._max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._waiting.remove(operation)
+            await self._run(*operation)
+
+    async def _run(self, function, args):
+        self._running += 1
+        try:
+            await self._loop.run_in_executor(self._executor, function, *args)
+            self._done += 1
+        except asyncio.CancelledError:
+            raise
+        except:
+            self._failed += 1
+            self._logger.warning("Exception while cleaning up after a job", exc_info=True)
+        finally:
+            self._running -= 1
+
+        if time.monotonic() - self._last_report > self._report_interval:
+            self._last_report = time.monotonic()
+            self._logger.info("Cleanup queue: %(queued)i queued, %(running)i running, %(done)i done, %(failed)i failed",
+                              self.stats())
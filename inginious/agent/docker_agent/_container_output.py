@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Parser of the messages sent by the grading containers on their stdout
+"""
+
+import logging
+import struct
+
+import msgpack
+
+#: length of a message, written before it by the containers
+HEADER = struct.Struct('I')
+
+
+class ContainerOutputParser(object):
+    """
+        Splits the stdout of a grading container into its messages: msgpack objects, each preceded by its length (HEADER).
+
+        The data is appended to a single buffer, from which the messages are decoded in place, through a memoryview. The
+        consumed bytes are removed from the buffer once per call to feed, so that many small messages or a large one
+        are parsed in linear time.
+
+        Messages larger than max_size bytes are dropped without being buffered, as are messages that cannot be decoded.
+    """
+
+    def __init__(self, container_id, max_size):
+        """
+        :param container_id: id of the container, for the logs
+        :param max_size: maximum size of a message, in bytes
+        """
+        self._container_id = container_id
+        self._max_size = max_size
+        self._logger = logging.getLogger("inginious.agent.docker")
+        self._buffer = bytearray()
+        self._skip = 0  # number of bytes of a dropped message that are still to come
+
+    def feed(self, data):
+        """
+        Adds data read from the stdout of the container
+        :return: the list of the messages completed by data, decoded
+        """
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = memoryview(data)[skipped:]
+        self._buffer += data
+
+        messages = []
+        start = 0
+        with memoryview(self._buffer) as view:
+            while len(view) - start >= HEADER.size:
+                length, = HEADER.unpack_from(view, start)
+                if length > self._max_size:
+                    self._logger.error("Dropping a message of %i bytes sent by container %s: the maximum is %i bytes",
+                                       length, self._container_id, self._max_size)
+                    dropped = min(length, len(view) - start - HEADER.size)
+                    self._skip = length - dropped
+                    start += HEADER.size + dropped
+                    continue
+                end = start + HEADER.size + length
+                if end > len(view):
+                    break
+                try:
+                    messages.append(msgpack.unpackb(view[start + HEADER.size:end], use_list=False))
+                except Exception:
+                    self._logger.exception("Received incorrect message from container %s", self._container_id)
+                start = end
+        del self._buffer[:start]
+        return messages
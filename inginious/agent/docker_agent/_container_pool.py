@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Pool of warm grading containers for the docker agent
+"""
+
+import collections
+import math
+import threading
+import time
+
+from inginious.common.base import percentile
+
+
+class ContainerPool(object):
+    """
+        Keeps track of the warm containers of the docker agent: grading containers that are created and started in
+        advance, and that wait on their stdin for the start of a job. The directories mounted in a warm container are
+        created with it, and filled with the files of the task when a job takes the container.
+
+        Containers are pooled by key (environment id, memory limit, network enabled), as these cannot be changed once
+        a container is created. The number of containers wanted for a key follows the demand: it is the largest number
+        of jobs that asked for a container of this key during one refill interval, over the last `window` seconds.
+        The total number of warm containers is bounded by `max_size`.
+
+        This class does no call to Docker: the agent creates and removes the containers, and tells the pool. It can be
+        used from several threads.
+    """
+
+    def __init__(self, max_size, refill_interval=2.0, window=120.0, clock=time.monotonic):
+        """
+        :param max_size: maximum number of warm containers. 0 disables the pool.
+        :param refill_interval: interval, in seconds, between two refills of the pool (see to_create)
+        :param window: duration, in seconds, over which the demand is measured
+        :param clock: function returning the current time, in seconds
+        """
+        self._max_size = max_size
+        self._refill_interval = refill_interval
+        self._nb_buckets = max(1, int(math.ceil(window / refill_interval)))
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._idle = {}  # key -> deque of (container_id, container_path), oldest first
+        self._creating = collections.Counter()  # key -> number of containers being created
+        self._demand = {}  # key -> deque of [bucket number, number of requests], oldest first
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._start_latencies = collections.deque(maxlen=1000)
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    @property
+    def refill_interval(self):
+        return self._refill_interval
+
+    def __len__(self):
+        """ Number of warm containers """
+        with self._lock:
+            return sum(len(containers) for containers in self._idle.values())
+
+    def take(self, key):
+        """
+        Takes a warm container for a job
+        :return: (container_id, container_path), or None if there is no warm container for this key
+        """
+        with self._lock:
+            self._record_demand(key)
+            containers = self._idle.get(key)
+            if containers:
+                self._hits += 1
+                return containers.pop()
+            self._misses += 1
+            return None
+
+    def record_start_latency(self, latency):
+        """ Records the time taken to start the container of a job, in seconds """
+        self._start_latencies.append(latency)
+
+    def to_create(self):
+        """
+        Returns the list of the keys of the containers to create to fill the pool, one entry per container. These
+        containers are counted as being created until add or creation_failed is called for them.
+        """
+        with self._lock:
+            wanted = self._targets()
+            keys = []
+            for key, target in wanted.items():
+                missing = target - len(self._idle.get(key, ())) - self._creating[key]
+                keys += [key] * max(0, missing)
+            for key in keys:
+                self._creating[key] += 1
+            return keys
+
+    def add(self, key, container_id, container_path):
+        """ Adds a container that was created for the pool (see to_create) """
+        with self._lock:
+            self._creating[key] -= 1
+            self._idle.setdefault(key, collections.deque()).append((container_id, container_path))
+
+    def creation_failed(self, key):
+        """ Tells that a container returned by to_create could not be created """
+        with self._lock:
+            self._creating[key] -= 1
+
+    def discard(self, container_id):
+        """
+        Removes a warm container that is no longer usable (e.g. it died)
+        :return: the path of the directory of the container, or None if the container is not in the pool
+        """
+        with self._lock:
+            for containers in self._idle.values():
+                for container in containers:
+                    if container[0] == container_id:
+                        containers.remove(container)
+                        self._evictions += 1
+                        return container[1]
+            return None
+
+    def surplus(self):
+        """
+        Removes from the pool the containers that are no longer wanted, the oldest first.
+        :return: the list of (container_id, container_path) to remove
+        """
+        with self._lock:
+            wanted = self._targets()
+            evicted = []
+            for key, containers in self._idle.items():
+                while len(containers) > wanted.get(key, 0):
+                    evicted.append(containers.popleft())
+            self._evictions += len(evicted)
+            return evicted
+
+    def evict_for_memory(self, memory):
+        """
+        Removes from the pool containers whose memory limits add up to at least `memory` MB (or all the containers),
+        those with the largest memory limit first.
+        :return: the list of (container_id, container_path) to remove
+        """
+        with self._lock:
+            evicted = []
+            for key in sorted(self._idle, key=lambda key: key[1], reverse=True):
+                containers = self._idle[key]
+                while containers and memory > 0:
+                    evicted.append(containers.popleft())
+                    memory -= key[1]
+            self._evictions += len(evicted)
+            return evicted
+
+    def remove_all(self):
+        """
+        Empties the pool
+        :return: the list of (container_id, container_path) to remove
+        """
+        with self._lock:
+            evicted = [container for containers in self._idle.values() for container in containers]
+            self._idle = {}
+            return evicted
+
+    def stats(self):
+        """ Returns the hit/miss/eviction counters, the number of warm containers and the p50/p99 start latencies (in s) """
+        latencies = list(self._start_latencies)
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+                    "warm": sum(len(containers) for containers in self._idle.values()),
+                    "start_latency_p50": percentile(latencies, 50), "start_latency_p99": percentile(latencies, 99)}
+
+    def _record_demand(self, key):
+        bucket = int(self._clock() / self._refill_interval)
+        demand = self._demand.setdefault(key, collections.deque())
+        if demand and demand[-1][0] == bucket:
+            demand[-1][1] += 1
+        else:
+            demand.append([bucket, 1])
+
+    def _targets(self):
+        """ Returns the number of containers wanted for each key """
+        if not self.enabled:
+            return {}
+        oldest_bucket = int(self._clock() / self._refill_interval) - self._nb_buckets
+        targets = {}
+        for key, demand in list(self._demand.items()):
+            while demand and demand[0][0] <= oldest_bucket:
+                demand.popleft()
+            if demand:
+                targets[key] = max(count for _, count in demand)
+            else:
+                del self._demand[key]
+
+        # Share the pool between the keys, the most demanded first
+        remaining = self._max_size
+        for key in sorted(targets, key=targets.get, reverse=True):
+            targets[key] = min(targets[key], remaining)
+            remaining -= targets[key]
+        return targets
@@ -7,6 +7,7 @@
     (not asyncio) Interface to Docker
 """
 import os
+import threading
 from datetime import datetime
 import docker
 import logging
@@ -19,12 +20,37 @@ class DockerInterface(object):  # pragma: no cover
 
         We do not test coverage here, as it is a bit complicated to interact with docker in tests.
         Docker-py itself is already well tested.
+
+        All the calls share the same Docker client, that keeps a pool of connections to the Docker daemon. The pool
+        should be at least as large as the number of threads doing calls at the same time, plus the number of
+        streams (events, stats) opened.
     """
 
+    def __init__(self, pool_size=docker.constants.DEFAULT_MAX_POOL_SIZE):
+        """
+        :param pool_size: maximum number of connections to the Docker daemon that are kept open
+        """
+        self._pool_size = pool_size
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._one_shot_stats = True  # False once the daemon is known not to support one-shot stats
+
     @property
     def _docker(self):
-        return docker.from_env()
-    
+        # The client is created at first use, as it contacts the daemon to know its API version
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = docker.from_env(max_pool_size=self._pool_size)
+        return self._client
+
+    def close(self):
+        """ Closes the connections to the Docker daemon """
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
     def get_containers(self):
         """
         :return: a dict of available containers in the form
@@ -183,6 +209,23 @@ class DockerInterface(object):  # pragma: no cover
         """
         return self._docker.containers.get(container_id).stats(decode=True)
 
+    def get_cpu_usage(self, container_id):
+        """
+        :param container_id:
+        :return: the CPU time used by the container since it started, in nanoseconds
+        """
+        container = self._docker.containers.get(container_id)
+        stats = None
+        if self._one_shot_stats:
+            try:
+                stats = container.stats(stream=False, one_shot=True)
+            except docker.errors.InvalidVersion:
+                # API < 1.41: one_shot is not supported, and the daemon waits for a second sample
+                self._one_shot_stats = False
+        if stats is None:
+            stats = container.stats(stream=False)
+        return stats['cpu_stats']['cpu_usage']['total_usage']
+
     def remove_container(self, container_id):
         """
         Removes a container (with fire)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Local cache of the task directories, used by the docker agent to stage the files of the jobs
+"""
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+#: ioctl cloning a file (reflink), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+class TaskCache(object):
+    """
+        Keeps, in a local directory, a copy of each version of the directories (tasks, course common files) used by the
+        jobs. A version is identified by a fingerprint of the directory: the paths and modification times of its
+        files. Each version is copied from its FileSystemProvider once; the jobs then either mount it read-only, or
+        get a clone of it (see clone_tree).
+
+        A version is deleted when it is no longer used and a newer version of the same directory was cached.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the cache. It is created if needed.
+        """
+        self._directory = directory
+        self._logger = logging.getLogger("inginious.agent.docker")
+        self._lock = threading.Lock()
+        self._version_locks = {}  # fingerprint -> lock held while the version is copied
+        self._users = {}  # fingerprint -> number of users of the version
+        self._latest = {}  # prefix of the FileSystemProvider -> fingerprint of its latest version
+        self._reflink = True  # False once the filesystem refused a reflink
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, fs):
+        """
+        Returns the path of the cached copy of the current version of the directory of a FileSystemProvider, copying it
+        if needed. The copy must not be modified. It is kept until release is called with this path.
+        """
+        fingerprint = _fingerprint(fs)
+        path = os.path.join(self._directory, fingerprint)
+        with self._lock:
+            self._users[fingerprint] = self._users.get(fingerprint, 0) + 1
+            previous = self._latest.get(fs.prefix)
+            self._latest[fs.prefix] = fingerprint
+            version_lock = self._version_locks.setdefault(fingerprint, threading.Lock())
+            deleted = self._forget(previous) if previous not in (None, fingerprint) and not self._users.get(previous) else None
+        if deleted is not None:
+            shutil.rmtree(deleted, ignore_errors=True)
+
+        with version_lock:
+            if not os.path.exists(path):
+                try:
+                    temp_path = tempfile.mkdtemp(dir=self._directory, prefix="tmp-")
+                    os.chmod(temp_path, 0o755)  # readable by the users of the containers
+                    fs.copy_from(None, temp_path)
+                    os.rename(temp_path, path)
+                except:
+                    self.release(path)
+                    raise
+        return path
+
+    def release(self, path):
+        """ Tells that a path returned by acquire is no longer used """
+        fingerprint = os.path.basename(path)
+        with self._lock:
+            self._users[fingerprint] -= 1
+            unused = not self._users[fingerprint] and fingerprint not in self._latest.values()
+            deleted = self._forget(fingerprint) if unused else None
+        if deleted is not None:
+            shutil.rmtree(deleted, ignore_errors=True)
+
+    def clone_tree(self, src, dest):
+        """
+        Recreates the tree src in dest (that may already exist). The files are cloned (reflink) when the filesystem
+        allows it, so that their data is shared until it is modified, and copied otherwise.
+        """
+        os.makedirs(dest, exist_ok=True)
+        for entry in os.scandir(src):
+            dest_path = os.path.join(dest, entry.name)
+            if entry.is_symlink():
+                if os.path.lexists(dest_path):
+                    os.unlink(dest_path)
+                os.symlink(os.readlink(entry.path), dest_path)
+            elif entry.is_dir():
+                self.clone_tree(entry.path, dest_path)
+            else:
+                self._clone_file(entry.path, dest_path)
+
+    def _clone_file(self, src, dest):
+        if self._reflink:
+            with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+                try:
+                    fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+                    return
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                        raise
+                    self._logger.info("The filesystem of %s does not support reflinks, the task files will be copied", dest)
+                    self._reflink = False
+        shutil.copyfile(src, dest, follow_symlinks=False)
+
+    def _forget(self, fingerprint):
+        """
+        Removes a version from the cache. Must be called with self._lock held.
+        :return: the path where the version was moved, to be deleted, or None if it was not copied
+        """
+        self._users.pop(fingerprint, None)
+        self._version_locks.pop(fingerprint, None)
+        path = os.path.join(self._directory, fingerprint)
+        if not os.path.exists(path):
+            return None
+        deleted = path + ".deleted-" + os.urandom(4).hex()
+        os.rename(path, deleted)
+        return deleted
+
+
+def _fingerprint(fs):
+    """ Returns a fingerprint of the current version of the directory of a FileSystemProvider """
+    digest = hashlib.sha256(fs.prefix.encode())
+    for path in sorted(fs.list(folders=True, files=True, recursive=True)):
+        digest.update(b"\0" + path.encode())
+        if not path.endswith("/"):
+            digest.update(b"\0" + str(fs.get_last_modification_time(path)).encode())
+    return digest.hexdigest()
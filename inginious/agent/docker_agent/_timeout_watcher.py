@@ -9,31 +9,73 @@
 
 import asyncio
 import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+#: files giving the CPU time used by a container, relative to the cgroup root, for the cgroup v2 and v1 hierarchies
+#: and the systemd and cgroupfs cgroup drivers of Docker. The files of cgroup v2 give it in microseconds, the others in
+#: nanoseconds.
+CGROUP_CPU_FILES = [("system.slice/docker-{}.scope/cpu.stat", 1000), ("docker/{}/cpu.stat", 1000),
+                    ("cpuacct/docker/{}/cpuacct.usage", 1), ("cpu,cpuacct/docker/{}/cpuacct.usage", 1),
+                    ("cpuacct/system.slice/docker-{}.scope/cpuacct.usage", 1),
+                    ("cpu,cpuacct/system.slice/docker-{}.scope/cpuacct.usage", 1)]
 
-from inginious.common.asyncio_utils import AsyncIteratorWrapper
 
 class TimeoutWatcher(object):
-    """ Looks for container timeouts """
-    def __init__(self, docker_interface):
-        """ docker_interface is an ASYNC interface to docker """
+    """
+        Looks for container timeouts.
+
+        The CPU time used by all the containers is read by a single thread, every `interval` seconds, from the files
+        of their cgroup. For the containers whose cgroup cannot be found (e.g. the Docker daemon is on another host),
+        it is asked to the Docker daemon, by the same thread.
+
+        The hard timeouts (wall time) are kept in a TimerWheel, advanced by another task every `interval` seconds: a
+        container is killed at most `interval` seconds after its hard timeout, even when reading the CPU times takes
+        longer, and its deadline is cancelled when was_killed is called.
+    """
+    def __init__(self, docker_interface, cgroup_root="/sys/fs/cgroup", interval=1.0):
+        """
+        :param docker_interface: an ASYNC interface to docker
+        :param cgroup_root: mount point of the cgroup filesystem of the host of the Docker daemon
+        :param interval: interval between two checks of the CPU time used by the containers, in seconds
+        """
 
         self._logger = logging.getLogger("inginious.agent.docker")
         self._loop = asyncio.get_event_loop()
         self._container_had_error = set()
         self._watching = set()
         self._docker_interface = docker_interface
-        self._running_asyncio_tasks = set()
+        self._cgroup_root = cgroup_root
+        self._interval = interval
+        self._cpu_limits = {}  # container_id -> maximum CPU time, in nanoseconds
+        self._cpu_files = {}  # container_id -> (path of the file giving its CPU time, unit in ns), or None to ask Docker
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timeout-watcher")
+        self._poll_task = None
+        self._cpu_poll_task = None
+        self._hard_timeouts = TimerWheel()
+        self._start_time = None  # loop time of the tick 0 of the wheel
+
+    @property
+    def pending_deadlines(self):
+        """ Number of hard timeouts that are waiting to expire """
+        return len(self._hard_timeouts)
 
     async def clean(self):
-        """ Close all the running tasks watching for a container timeout. All references to
+        """ Stops watching for the container timeouts, and stops the thread reading the CPU times. All references to
             containers are removed: any attempt to was_killed after a call to clean() will return None.
         """
-        for x in self._running_asyncio_tasks:
-            x.cancel()
+        for task in (self._poll_task, self._cpu_poll_task):
+            if task is not None:
+                task.cancel()
+        self._poll_task = None
+        self._cpu_poll_task = None
+        self._executor.shutdown(wait=False)
         self._container_had_error = set()
         self._watching = set()
-        self._running_asyncio_tasks = set()
-
+        self._cpu_limits = {}
+        self._cpu_files = {}
+        self._hard_timeouts = TimerWheel()
 
     async def was_killed(self, container_id):
         """
@@ -43,46 +85,111 @@ class TimeoutWatcher(object):
         """
         if container_id in self._watching:
             self._watching.remove(container_id)
+        self._cpu_limits.pop(container_id, None)
+        self._cpu_files.pop(container_id, None)
+        self._hard_timeouts.cancel(container_id)
         if container_id in self._container_had_error:
             self._container_had_error.remove(container_id)
             return "timeout"
         return None
 
     async def register_container(self, container_id, timeout, hard_timeout):
+        """
+        Watches a container
+        :param timeout: maximum CPU time, in seconds
+        :param hard_timeout: maximum wall time, in seconds
+        """
         self._watching.add(container_id)
-        task = self._loop.create_task(self._handle_container_timeout(container_id, timeout))
-        self._running_asyncio_tasks.add(task)
-        task.add_done_callback(self._remove_safe_task)
+        self._cpu_limits[container_id] = timeout * (10 ** 9)
+        if self._poll_task is None:
+            self._start_time = self._loop.time()
+            self._poll_task = self._loop.create_task(self._poll())
+            self._cpu_poll_task = self._loop.create_task(self._poll_cpu())
 
-        self._loop.call_later(hard_timeout, asyncio.ensure_future, self._handle_container_hard_timeout(container_id, hard_timeout))
+        # The deadline is rounded up to the next tick: the container is never killed before its hard timeout
+        deadline = self._loop.time() + hard_timeout - self._start_time
+        ticks = max(1, math.ceil(deadline / self._interval) - self._hard_timeouts.current_tick)
+        self._hard_timeouts.schedule(container_id, ticks, hard_timeout)
 
-    async def _handle_container_timeout(self, container_id, timeout):
+    async def _poll(self):
+        """ Every `interval` seconds, kills the containers that reached their hard timeout """
+        while True:
+            await asyncio.sleep(self._interval)
+            await self._expire_hard_timeouts()
+
+    async def _poll_cpu(self):
         """
-        Check timeout with docker stats
-        :param container_id:
-        :param timeout: in seconds (cpu time)
+        Kills the containers that reached their CPU time limit, checked `interval` seconds after the end of the previous
+        check. When the CPU times are asked to Docker, a check can take much longer than `interval`.
         """
+        while True:
+            await asyncio.sleep(self._interval)
+            if self._cpu_limits:
+                await self._check_cpu_usages()
+
+    async def _expire_hard_timeouts(self):
+        """ Advances the wheel up to the current time, and kills all the containers whose hard timeout expired """
+        expired = []
+        now_tick = int((self._loop.time() - self._start_time) / self._interval)
+        while self._hard_timeouts.current_tick < now_tick:
+            expired += self._hard_timeouts.advance()
+        if expired:
+            await asyncio.gather(*[self._handle_container_hard_timeout(container_id, hard_timeout)
+                                   for container_id, hard_timeout in expired])
+
+    async def _check_cpu_usages(self):
+        """ Kills the containers that used more CPU time than allowed """
+        # The files are looked up here, so that the thread does not modify _cpu_files while was_killed removes them
+        cpu_files = {}
+        for container_id in self._cpu_limits:
+            if container_id not in self._cpu_files:
+                self._cpu_files[container_id] = self._find_cpu_file(container_id)
+            cpu_files[container_id] = self._cpu_files[container_id]
+
         try:
-            docker_stats = await self._docker_interface.get_stats(container_id)
-            source = AsyncIteratorWrapper(docker_stats)
-            nano_timeout = timeout * (10 ** 9)
-            async for upd in source:
-                if upd is None:
-                    await self._kill_it_with_fire(container_id)
-                self._logger.debug("%i", upd['cpu_stats']['cpu_usage']['total_usage'])
-                if upd['cpu_stats']['cpu_usage']['total_usage'] > nano_timeout:
-                    self._logger.info("Killing container %s as it used %i CPU seconds (max was %i)",
-                                      container_id, int(upd['cpu_stats']['cpu_usage']['total_usage'] / (10 ** 9)), timeout)
-                    await self._kill_it_with_fire(container_id)
-                    return
+            usages = await self._loop.run_in_executor(self._executor, self._read_cpu_usages, cpu_files)
         except asyncio.CancelledError:
-            pass
+            raise
         except:
-            self._logger.exception("Exception in _handle_container_timeout")
+            self._logger.exception("Exception while reading the CPU time used by the containers")
+            return
+
+        for container_id, usage in usages.items():
+            timeout = self._cpu_limits.get(container_id)  # None if the container was killed during the read
+            if timeout is not None and usage > timeout:
+                self._logger.info("Killing container %s as it used %i CPU seconds (max was %i)",
+                                  container_id, int(usage / (10 ** 9)), int(timeout / (10 ** 9)))
+                await self._kill_it_with_fire(container_id)
+
+    def _read_cpu_usages(self, cpu_files):
+        """
+        Returns the CPU time used by each of the given containers, in nanoseconds. Synchronous.
+        :param cpu_files: dict container_id -> (path of the file giving its CPU time, unit in ns), or None to ask Docker
+        """
+        usages = {}
+        for container_id, cpu_file in cpu_files.items():
+            try:
+                if cpu_file is not None:
+                    usages[container_id] = _read_cpu_file(*cpu_file)
+                else:
+                    usages[container_id] = self._docker_interface.sync.get_cpu_usage(container_id)
+            except (OSError, ValueError) as e:
+                self._logger.debug("Cannot read the CPU time used by container %s: %s", container_id, str(e))
+            except:
+                self._logger.debug("Cannot get the CPU time used by container %s", container_id, exc_info=True)
+        return usages
+
+    def _find_cpu_file(self, container_id):
+        """ Returns the file giving the CPU time used by a container and its unit, or None if it cannot be found """
+        for path, unit in CGROUP_CPU_FILES:
+            path = os.path.join(self._cgroup_root, path.format(container_id))
+            if os.path.exists(path):
+                return path, unit
+        return None
 
     async def _handle_container_hard_timeout(self, container_id, hard_timeout):
         """
-        Kills a container (should be called with loop.call_later(hard_timeout, ...)) and displays a message on the log
+        Kills a container whose hard timeout expired and displays a message on the log
         :param container_id:
         :param hard_timeout:
         :return:
@@ -98,15 +205,73 @@ class TimeoutWatcher(object):
         """
         if container_id in self._watching:
             self._watching.remove(container_id)
+            self._cpu_limits.pop(container_id, None)
+            self._hard_timeouts.cancel(container_id)
             self._container_had_error.add(container_id)
             try:
                 await self._docker_interface.kill_container(container_id)
             except:
                 pass #is ok
 
-    def _remove_safe_task(self, task):
-        """ Remove a task from _running_asyncio_tasks """
-        try:
-            self._running_asyncio_tasks.remove(task)
-        except:
-            pass
\ No newline at end of file
+
+class TimerWheel(object):
+    """
+        Hashed timer wheel keeping the deadlines of keys, in ticks. Scheduling and cancelling a deadline are O(1), and
+        advancing the wheel by one tick only visits the deadlines of one slot. Deadlines further than `nb_slots` ticks
+        stay in their slot for several turns of the wheel.
+    """
+
+    def __init__(self, nb_slots=512):
+        self._slots = [{} for _ in range(nb_slots)]  # key -> [remaining turns, data]
+        self._slot_of = {}  # key -> index of its slot
+        self._current_tick = 0
+
+    @property
+    def current_tick(self):
+        return self._current_tick
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, key, ticks, data=None):
+        """ Makes key expire `ticks` (>= 1) ticks after the current one, replacing its previous deadline, if any """
+        self.cancel(key)
+        tick = self._current_tick + ticks
+        index = tick % len(self._slots)
+        self._slots[index][key] = [(ticks - 1) // len(self._slots), data]
+        self._slot_of[key] = index
+
+    def cancel(self, key):
+        """ Cancels the deadline of key, if any """
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self):
+        """
+        Moves the wheel to the next tick
+        :return: the list of (key, data) that expire at this tick
+        """
+        self._current_tick += 1
+        slot = self._slots[self._current_tick % len(self._slots)]
+        expired = []
+        for key, deadline in slot.items():
+            if deadline[0] == 0:
+                expired.append((key, deadline[1]))
+            else:
+                deadline[0] -= 1
+        for key, _ in expired:
+            del slot[key]
+            del self._slot_of[key]
+        return expired
+
+
+def _read_cpu_file(path, unit):
+    """ Returns the CPU time, in nanoseconds, given by a cpuacct.usage (v1) or cpu.stat (v2) cgroup file """
+    with open(path) as cpu_file:
+        if unit == 1:
+            return int(cpu_file.read())
+        for line in cpu_file:
+            if line.startswith("usage_usec "):
+                return int(line.split()[1]) * unit
+    raise ValueError("No CPU usage in %s" % path)
\ No newline at end of file
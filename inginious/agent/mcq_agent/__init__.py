@@ -8,9 +8,62 @@ import gettext
 
 from inginious.agent import Agent, CannotCreateJobException
 from inginious import get_root_path
+from inginious.common.filesystems.provider import NotFoundException
 from inginious.common.messages import BackendNewJob, BackendKillJob
 import os.path
-import builtins
+
+
+def load_translations():
+    """ Returns the translations of the messages of the MCQ checks, by language """
+    translations = {"en": gettext.NullTranslations()}
+    available_translations = [x for x in os.listdir(get_root_path() + '/agent/mcq_agent/i18n') if os.path.isdir(os.path.join(get_root_path() + '/agent/mcq_agent/i18n', x))]
+    translations.update({
+        lang: gettext.translation('messages', get_root_path() + '/agent/mcq_agent/i18n', [lang]) for lang in available_translations
+    })
+    return translations
+
+
+def check_mcq_answers(task, inputdata, translations):
+    """
+    Checks the answers to a task made only of problems that are checked without running any code (multiple choice,
+    match, ...)
+    :param task: the task
+    :param inputdata: the input of the job
+    :param translations: the translations returned by load_translations
+    :return: a tuple (result, text, grade, problems), as given to Agent.send_job_result
+    :raises CannotCreateJobException: if some problems of the task need to be run in a container
+    """
+    language = inputdata.get("@lang", "")
+    _ = translations.get(language, gettext.NullTranslations()).gettext
+
+    result, need_emul, text, problems, error_count, mcq_error_count = task.check_answer(inputdata, language)
+
+    internal_messages = {
+        "_wrong_answer_multiple": _("Wrong answer. Make sure to select all the valid possibilities"),
+        "_wrong_answer": _("Wrong answer"),
+        "_correct_answer": _("Correct answer"),
+    }
+
+    for key, (p_result, messages) in problems.items():
+        messages = [internal_messages[message] if message in internal_messages else message for message in messages]
+        problems[key] = (p_result, "\n\n".join(messages))
+
+    if need_emul:
+        raise CannotCreateJobException("Task wrongly configured as a MCQ")
+
+    if error_count != 0:
+        text.append(_("You have {} wrong answer(s).").format(error_count))
+    if mcq_error_count != 0:
+        text.append("\n\n" + _("Among them, you have {} invalid answers in the multiple choice questions").format(mcq_error_count))
+
+    nb_subproblems = len(task.get_problems())
+    if nb_subproblems == 0:
+        text.append("No subproblems defined")
+        return "crashed", "\n".join(text), 0.0, problems
+
+    grade = 100.0 * float(nb_subproblems - error_count) / float(nb_subproblems)
+    return ("success" if result else "failed"), "\n".join(text), grade, problems
+
 
 class MCQAgent(Agent):
     def __init__(self, context, backend_addr, friendly_name, concurrency, tasks_filesystem, course_factory):
@@ -18,6 +71,8 @@ class MCQAgent(Agent):
         :param context: ZeroMQ context for this process
         :param backend_addr: address of the backend (for example, "tcp://127.0.0.1:2222")
         :param friendly_name: a string containing a friendly name to identify agent
+        :param concurrency: number of jobs sent at once by the backend. The jobs are checked one after the other, but
+            a concurrency larger than 1 avoids waiting for the backend between two jobs.
         :param tasks_filesystem: FileSystemProvider to the course/tasks
         :param course_factory: Course factory used to get course/tasks
         """
@@ -25,62 +80,53 @@ class MCQAgent(Agent):
         self._logger = logging.getLogger("inginious.agent.mcq")
         self.course_factory = course_factory
 
+        # (course_id, task_id) -> (descriptor name, modification time of the descriptor, task)
+        self._tasks = {}
+
         # Init gettext
-        self._translations = {"en": gettext.NullTranslations()}
-        available_translations = [x for x in os.listdir(get_root_path() + '/agent/mcq_agent/i18n') if os.path.isdir(os.path.join(get_root_path() + '/agent/mcq_agent/i18n', x))]
-        self._translations.update({
-            lang: gettext.translation('messages', get_root_path() + '/agent/mcq_agent/i18n', [lang]) for lang in available_translations
-        })
+        self._translations = load_translations()
 
     @property
     def environments(self):
         return {"mcq": {"id": "mcq", "created": 0, "type": "mcq"}}
 
     async def new_job(self, msg: BackendNewJob):
-        language = msg.inputdata.get("@lang", "")
-        translation = self._translations.get(language, gettext.NullTranslations())
-        # TODO: this would probably require a refactor.
-        # This may pose problem with apps that start multiple MCQAgents in the same process...
-        builtins.__dict__['_'] = translation.gettext
-
         try:
             self._logger.info("Received request for jobid %s", msg.job_id)
-            task = self.course_factory.get_task(msg.course_id, msg.task_id)
+            task = self._get_task(msg.course_id, msg.task_id)
         except asyncio.CancelledError:
             raise
         except Exception as e:
             self._logger.error("Task %s/%s not available on this agent", msg.course_id, msg.task_id)
             raise CannotCreateJobException("Task is not available on this agent")
 
-        result, need_emul, text, problems, error_count, mcq_error_count = task.check_answer(msg.inputdata, language)
-
-        internal_messages = {
-            "_wrong_answer_multiple": _("Wrong answer. Make sure to select all the valid possibilities"),
-            "_wrong_answer": _("Wrong answer"),
-            "_correct_answer": _("Correct answer"),
-        }
-
-        for key, (p_result, messages) in problems.items():
-            messages = [internal_messages[message] if message in internal_messages else message for message in messages]
-            problems[key] = (p_result, "\n\n".join(messages))
-
-        if need_emul:
+        try:
+            result, text, grade, problems = check_mcq_answers(task, msg.inputdata, self._translations)
+        except CannotCreateJobException:
             self._logger.warning("Task %s/%s is not a pure MCQ but has env=MCQ", msg.course_id, msg.task_id)
-            raise CannotCreateJobException("Task wrongly configured as a MCQ")
-
-        if error_count != 0:
-            text.append(_("You have {} wrong answer(s).").format(error_count))
-        if mcq_error_count != 0:
-            text.append("\n\n" + _("Among them, you have {} invalid answers in the multiple choice questions").format(mcq_error_count))
-
-        nb_subproblems = len(task.get_problems())
-        if nb_subproblems == 0:
-            grade = 0.0
-            text.append("No subproblems defined")
-            await self.send_job_result(msg.job_id, "crashed", "\n".join(text), grade, problems, {}, {}, "", None)
-        else:
-            grade = 100.0 * float(nb_subproblems - error_count) / float(nb_subproblems)
-            await self.send_job_result(msg.job_id, ("success" if result else "failed"), "\n".join(text), grade, problems, {}, {}, "", None)
+            raise
+        await self.send_job_result(msg.job_id, result, text, grade, problems, {}, {}, "", None)
 
     async def kill_job(self, message: BackendKillJob):
         pass
+
+    def _get_task(self, course_id, task_id):
+        """
+        Returns a task, with its problems. The task is only asked again to the course factory, which checks all the
+        files it was read from, when its descriptor was modified.
+        """
+        cached = self._tasks.get((course_id, task_id))
+        if cached is not None:
+            descriptor, mtime, task = cached
+            try:
+                if task.get_fs().get_last_modification_time(descriptor) == mtime:
+                    return task
+            except NotFoundException:
+                pass
+
+        task_factory = self.course_factory.get_task_factory()
+        descriptor = "task" + task_factory.get_task_descriptor_extension(course_id, task_id)
+        mtime = task_factory.get_task_fs(course_id, task_id).get_last_modification_time(descriptor)
+        task = self.course_factory.get_task(course_id, task_id)
+        self._tasks[(course_id, task_id)] = (descriptor, mtime, task)
+        return task
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import asyncio
+import threading
+
+from inginious.agent.docker_agent._cleanup_queue import CleanupQueue
+
+
+def fail():
+    raise OSError("cannot remove")
+
+
+class TestCleanupQueue(object):
+    def test_run_operations(self):
+        async def run():
+            queue = CleanupQueue(workers=2, max_size=10)
+            done = []
+            for i in range(5):
+                await queue.put(done.append, i)
+            await queue.put(fail)
+            while queue.stats()["done"] + queue.stats()["failed"] < 6:
+                await asyncio.sleep(0.01)
+            assert sorted(done) == [0, 1, 2, 3, 4]
+            assert queue.stats() == {"queued": 0, "running": 0, "done": 5, "failed": 1}
+            await queue.close()
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+    def test_wait_for_job_creations(self):
+        async def run():
+            queue = CleanupQueue(workers=1, max_delay=10)
+            done = threading.Event()
+            with queue.job_starting():
+                await queue.put(done.set)
+                await asyncio.sleep(0.05)
+                assert not done.is_set()
+                assert queue.stats()["queued"] == 1
+            await asyncio.sleep(0.05)
+            assert done.is_set()
+            await queue.close()
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+    def test_close_runs_the_queued_operations(self):
+        async def run():
+            queue = CleanupQueue(workers=1, max_delay=10)
+            done = []
+            with queue.job_starting():
+                for i in range(3):
+                    await queue.put(done.append, i)
+                await queue.close()
+            assert done == [0, 1, 2]
+
+        asyncio.get_event_loop().run_until_complete(run())
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import struct
+
+import msgpack
+
+from inginious.agent.docker_agent._container_output import ContainerOutputParser
+
+
+def encode(message):
+    data = msgpack.dumps(message, use_bin_type=True)
+    return struct.pack('I', len(data)) + data
+
+
+class TestContainerOutputParser(object):
+    def test_split_messages(self):
+        parser = ContainerOutputParser("container", 1024)
+        data = encode({"type": "ssh_key", "ssh_key": "key"}) + encode({"type": "result", "result": [1, 2]})
+        assert parser.feed(data[:2]) == []
+        assert parser.feed(data[2:10]) == []
+        assert parser.feed(data[10:]) == [{"type": "ssh_key", "ssh_key": "key"}, {"type": "result", "result": (1, 2)}]
+        assert parser.feed(b"") == []
+
+    def test_oversized_message(self):
+        parser = ContainerOutputParser("container", 100)
+        big = encode({"type": "result", "result": "x" * 1000})
+        small = encode({"type": "result", "result": "ok"})
+        assert parser.feed(small + big[:300]) == [{"type": "result", "result": "ok"}]
+        assert parser.feed(big[300:600]) == []
+        assert parser.feed(big[600:] + small) == [{"type": "result", "result": "ok"}]
+
+    def test_incorrect_message(self):
+        parser = ContainerOutputParser("container", 1024)
+        assert parser.feed(struct.pack('I', 1) + b"\xc1" + encode("next")) == ["next"]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+from inginious.agent.docker_agent._container_pool import ContainerPool
+
+SMALL = ("env", 100, False)
+LARGE = ("env", 500, False)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fill(pool):
+    for key in pool.to_create():
+        pool.add(key, "%s-%i-%i" % (key[0], key[1], len(pool)), "/tmp/path")
+
+
+class TestContainerPool(object):
+    def test_disabled(self):
+        pool = ContainerPool(0)
+        assert pool.take(SMALL) is None
+        assert pool.to_create() == []
+
+    def test_follows_demand(self):
+        clock = Clock()
+        pool = ContainerPool(10, refill_interval=2, window=10, clock=clock)
+        for _ in range(3):
+            assert pool.take(SMALL) is None
+        assert pool.to_create() == [SMALL] * 3
+        assert pool.to_create() == []  # already being created
+        for i in range(3):
+            pool.add(SMALL, "c%i" % i, "/tmp/c%i" % i)
+        assert pool.take(SMALL) == ("c2", "/tmp/c2")
+        assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 3
+
+        # Without demand, the containers are evicted after the window
+        clock.now += 5
+        assert pool.surplus() == []
+        clock.now += 10
+        assert pool.surplus() == [("c0", "/tmp/c0"), ("c1", "/tmp/c1")]
+        assert pool.to_create() == [] and len(pool) == 0
+
+    def test_max_size(self):
+        pool = ContainerPool(4, clock=Clock())
+        for _ in range(3):
+            pool.take(SMALL)
+        for _ in range(5):
+            pool.take(LARGE)
+        assert pool.to_create() == [LARGE] * 4
+
+    def test_evict_for_memory(self):
+        pool = ContainerPool(10, clock=Clock())
+        for key in (SMALL, SMALL, LARGE, LARGE):
+            pool.take(key)
+        fill(pool)
+        evicted = pool.evict_for_memory(600)
+        assert len(evicted) == 2 and len(pool) == 2
+        assert pool.take(LARGE) is None and pool.take(SMALL) is not None
+
+    def test_discard(self):
+        pool = ContainerPool(10, clock=Clock())
+        pool.take(SMALL)
+        pool.to_create()
+        pool.add(SMALL, "dead", "/tmp/dead")
+        assert pool.discard("other") is None
+        assert pool.discard("dead") == "/tmp/dead"
+        assert pool.take(SMALL) is None
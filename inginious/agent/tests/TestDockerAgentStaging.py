@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import asyncio
+import errno
+import logging
+import os
+import tempfile
+
+from inginious.agent import CannotCreateJobException
+from inginious.agent.docker_agent import DockerAgent
+from inginious.agent.docker_agent._container_pool import ContainerPool
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.messages import BackendNewJob
+
+KEY = ("env-id", 100, False)
+
+
+class TestDockerAgentStaging(object):
+    """ Failures while the files of a job are staged must not leak the resources taken for it """
+
+    def setup_method(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.dir.name, "tasks", "course", "task"))
+        os.makedirs(os.path.join(self.dir.name, "tmp"))
+        self.loop = asyncio.new_event_loop()
+
+        # The agent is not started: only what __stage_job_sync uses is set
+        agent = DockerAgent.__new__(DockerAgent)
+        agent._logger = logging.getLogger("inginious.agent.docker")
+        agent._loop = self.loop
+        agent.tasks_fs = LocalFSProvider(os.path.join(self.dir.name, "tasks"))
+        agent._tmp_dir = os.path.join(self.dir.name, "tmp")
+        agent._memory = 1000
+        agent._containers = {"env": {"id": "env-id", "ports": []}}
+        agent._external_ports = {1234}
+        agent._container_pool = ContainerPool(4)
+        agent._task_cache = None
+        agent._create_safe_task = self.loop.create_task
+        self.removed = []
+
+        async def remove_warm_containers(containers):
+            self.removed += containers
+        agent._remove_warm_containers = remove_warm_containers
+
+        def stage(fs, dest):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        agent._stage = stage
+        self.agent = agent
+
+    def teardown_method(self):
+        self.loop.close()
+        self.dir.cleanup()
+
+    def _stage_job(self):
+        message = BackendNewJob(("client", "job"), "course", "task", {}, "env", {"limits": {"memory": 100}}, None)
+        try:
+            self.agent._DockerAgent__stage_job_sync(message)  # pylint: disable=no-member
+            assert False
+        except CannotCreateJobException:
+            pass
+
+    def test_new_container_directories_removed(self):
+        self._stage_job()
+        assert os.listdir(os.path.join(self.dir.name, "tmp")) == []
+        assert self.agent._external_ports == {1234}
+
+    def test_warm_container_removed(self):
+        warm_path = self.agent._create_container_directories()
+        self.agent._container_pool.take(KEY)  # records the demand, so that the container is accepted
+        self.agent._container_pool.to_create()
+        self.agent._container_pool.add(KEY, "warm", warm_path)
+
+        self._stage_job()
+        self.loop.run_until_complete(asyncio.sleep(0))  # the removal is scheduled on the loop
+        self.loop.run_until_complete(asyncio.sleep(0))
+        assert self.removed == [("warm", warm_path)]
+        assert self.agent._container_pool.take(KEY) is None
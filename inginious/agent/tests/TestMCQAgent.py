@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import asyncio
+import builtins
+import os
+import tempfile
+
+from zmq.asyncio import Context
+
+from inginious.agent.mcq_agent import MCQAgent
+from inginious.common.course_factory import create_factories
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.messages import BackendNewJob
+from inginious.common.tasks_problems import MatchProblem, MultipleChoiceProblem
+
+TASK = """name: Quiz
+environment_id: mcq
+environment_type: mcq
+problems:
+    mc:
+        type: multiple_choice
+        multiple: true
+        choices:
+          - text: A
+            valid: true
+          - text: B
+          - text: C
+            valid: true
+    match:
+        type: match
+        answer: '42'
+"""
+
+
+class TestMCQAgent(object):
+    def setup_method(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.dir.name, "course", "quiz"))
+        with open(os.path.join(self.dir.name, "course", "course.yaml"), "w") as f:
+            f.write("name: Course\nadmins: []\naccessible: true\n")
+        with open(os.path.join(self.dir.name, "course", "quiz", "task.yaml"), "w") as f:
+            f.write(TASK)
+        fs = LocalFSProvider(self.dir.name)
+        course_factory, _ = create_factories(fs, {"multiple_choice": MultipleChoiceProblem, "match": MatchProblem})
+        self.context = Context()
+        self.agent = MCQAgent(self.context, "inproc://mcq", "mcq", 8, fs, course_factory)
+        self.results = []
+
+        async def send_job_result(job_id, result, text, grade, problems, *args):
+            self.results.append((job_id, result, text, grade, problems))
+        self.agent.send_job_result = send_job_result
+
+    def teardown_method(self):
+        self.context.destroy(0)
+        self.dir.cleanup()
+
+    def _job(self, job_id, inputdata):
+        return BackendNewJob((b"client", job_id), "course", "quiz", inputdata, "mcq", {}, None)
+
+    def test_check_answers(self):
+        async def run():
+            await asyncio.gather(self.agent.new_job(self._job("1", {"mc": ["0", "2"], "match": "42", "@lang": "fr"})),
+                                 self.agent.new_job(self._job("2", {"mc": ["1"], "match": "41", "@lang": "en"})))
+        underscore = builtins.__dict__.get("_")
+        asyncio.get_event_loop().run_until_complete(run())
+        assert builtins.__dict__.get("_") is underscore
+
+        results = {job_id[1]: (result, grade, problems) for job_id, result, _, grade, problems in self.results}
+        assert results["1"][0] == "success" and results["1"][1] == 100.0
+        assert results["2"][0] == "failed" and results["2"][1] == 0.0
+        assert results["2"][2]["match"] == ("failed", "Wrong answer")
+
+    def test_task_reloaded_when_modified(self):
+        task = self.agent._get_task("course", "quiz")  # pylint: disable=protected-access
+        assert self.agent._get_task("course", "quiz") is task  # pylint: disable=protected-access
+
+        descriptor = os.path.join(self.dir.name, "course", "quiz", "task.yaml")
+        with open(descriptor, "w") as f:
+            f.write(TASK.replace("'42'", "'43'"))
+        mtime = os.stat(descriptor).st_mtime + 10
+        os.utime(descriptor, (mtime, mtime))
+        reloaded = self.agent._get_task("course", "quiz")  # pylint: disable=protected-access
+        assert reloaded is not task
+        assert reloaded.check_answer({"mc": ["0", "2"], "match": "43"}, "en")[0]
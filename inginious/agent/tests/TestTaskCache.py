@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import os
+import tempfile
+
+from inginious.agent.docker_agent._task_cache import TaskCache
+from inginious.common.filesystems.local import LocalFSProvider
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class TestTaskCache(object):
+    def test_versions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write(os.path.join(directory, "task", "run"), "v1")
+            write(os.path.join(directory, "task", "data", "input"), "data")
+            cache = TaskCache(os.path.join(directory, "cache"))
+            task_fs = LocalFSProvider(os.path.join(directory, "task"))
+
+            first = cache.acquire(task_fs)
+            assert read(os.path.join(first, "run")) == "v1" and read(os.path.join(first, "data", "input")) == "data"
+            assert cache.acquire(task_fs) == first  # copied once per version
+
+            write(os.path.join(directory, "task", "run"), "v2")
+            os.utime(os.path.join(directory, "task", "run"), (0, 0))
+            second = cache.acquire(task_fs)
+            assert second != first and read(os.path.join(second, "run")) == "v2"
+
+            # The old version is deleted once unused
+            cache.release(first)
+            assert os.path.exists(first)
+            cache.release(first)
+            assert not os.path.exists(first)
+            cache.release(second)
+            assert os.path.exists(second)
+
+    def test_clone_tree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write(os.path.join(directory, "task", "run"), "run")
+            write(os.path.join(directory, "task", "student", "file"), "student")
+            os.symlink("run", os.path.join(directory, "task", "link"))
+            cache = TaskCache(os.path.join(directory, "cache"))
+            cached = cache.acquire(LocalFSProvider(os.path.join(directory, "task")))
+
+            dest = os.path.join(directory, "job", "task")
+            os.makedirs(dest)
+            cache.clone_tree(cached, dest)
+            assert sorted(os.listdir(dest)) == ["link", "run", "student"]
+            assert read(os.path.join(dest, "student", "file")) == "student"
+            assert os.readlink(os.path.join(dest, "link")) == "run"
+
+            # The clone is independent from the cache
+            write(os.path.join(dest, "run"), "modified")
+            assert read(os.path.join(cached, "run")) == "run"
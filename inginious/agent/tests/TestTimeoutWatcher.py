@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import asyncio
+import os
+import tempfile
+import time
+
+from inginious.agent.docker_agent._timeout_watcher import TimeoutWatcher, TimerWheel
+
+
+class FakeDockerInterface(object):
+    """ Async interface to docker that only records the killed containers. Containers without cgroup use no CPU. """
+    def __init__(self):
+        self.killed = []
+        self.sync = self
+
+    def get_cpu_usage(self, container_id):
+        return 0
+
+    async def kill_container(self, container_id):
+        self.killed.append(container_id)
+
+
+def write_usage(cgroup_root, container_id, usage):
+    """ Writes the CPU time of a container, in seconds, in a cgroup v2 cpu.stat file """
+    path = os.path.join(cgroup_root, "system.slice", "docker-%s.scope" % container_id)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "cpu.stat"), "w") as f:
+        f.write("usage_usec %i\nuser_usec 0\nsystem_usec 0\n" % (usage * 10 ** 6))
+
+
+class TestTimeoutWatcher(object):
+    def test_cpu_timeout(self):
+        async def run(cgroup_root):
+            docker_interface = FakeDockerInterface()
+            watcher = TimeoutWatcher(docker_interface, cgroup_root, interval=0.01)
+            write_usage(cgroup_root, "slow", 1)
+            write_usage(cgroup_root, "fast", 1)
+            for container_id in ("slow", "fast", "remote"):
+                await watcher.register_container(container_id, 2, 60)
+            await asyncio.sleep(0.05)
+            assert docker_interface.killed == []
+
+            write_usage(cgroup_root, "slow", 3)
+            await asyncio.sleep(0.05)
+            assert docker_interface.killed == ["slow"]
+            assert await watcher.was_killed("slow") == "timeout"
+            assert await watcher.was_killed("fast") is None
+            assert await watcher.was_killed("remote") is None
+            await watcher.clean()
+
+        with tempfile.TemporaryDirectory() as cgroup_root:
+            asyncio.get_event_loop().run_until_complete(run(cgroup_root))
+
+
+    def test_hard_timeout(self):
+        async def run(cgroup_root):
+            docker_interface = FakeDockerInterface()
+            watcher = TimeoutWatcher(docker_interface, cgroup_root, interval=0.01)
+            await watcher.register_container("short", 60, 0.03)
+            await watcher.register_container("done", 60, 0.03)
+            await watcher.register_container("long", 60, 60)
+            assert watcher.pending_deadlines == 3
+
+            assert await watcher.was_killed("done") is None
+            assert watcher.pending_deadlines == 2
+            await asyncio.sleep(0.1)
+            assert docker_interface.killed == ["short"]
+            assert watcher.pending_deadlines == 1
+            assert await watcher.was_killed("short") == "timeout"
+            assert await watcher.was_killed("long") is None
+            assert watcher.pending_deadlines == 0
+            await watcher.clean()
+
+        with tempfile.TemporaryDirectory() as cgroup_root:
+            asyncio.get_event_loop().run_until_complete(run(cgroup_root))
+
+    def test_hard_timeout_not_delayed_by_docker(self):
+        async def run(cgroup_root):
+            docker_interface = FakeDockerInterface()
+
+            def get_cpu_usage(container_id):
+                time.sleep(0.1)  # the CPU times of the containers without cgroup are slow to get from Docker
+                return 0
+            docker_interface.get_cpu_usage = get_cpu_usage
+            watcher = TimeoutWatcher(docker_interface, cgroup_root, interval=0.01)
+            for i in range(5):
+                await watcher.register_container("remote%i" % i, 60, 60)
+            await watcher.register_container("short", 60, 0.05)
+
+            await asyncio.sleep(0.15)  # a whole round of CPU checks takes 0.5 s
+            assert docker_interface.killed == ["short"]
+            await watcher.clean()
+            assert watcher._executor._shutdown  # pylint: disable=protected-access
+
+        with tempfile.TemporaryDirectory() as cgroup_root:
+            asyncio.get_event_loop().run_until_complete(run(cgroup_root))
+
+    def test_container_removed_during_read(self):
+        async def run(cgroup_root):
+            docker_interface = FakeDockerInterface()
+
+            def get_cpu_usage(container_id):
+                time.sleep(0.1)
+                return 0
+            docker_interface.get_cpu_usage = get_cpu_usage
+            watcher = TimeoutWatcher(docker_interface, cgroup_root, interval=0.01)
+            await watcher.register_container("remote0", 60, 60)
+            await watcher.register_container("remote1", 60, 60)
+
+            await asyncio.sleep(0.05)  # while the CPU time of remote0 is read
+            assert await watcher.was_killed("remote0") is None
+            assert await watcher.was_killed("remote1") is None
+            await asyncio.sleep(0.2)
+            assert watcher._cpu_files == {}  # pylint: disable=protected-access
+            await watcher.clean()
+
+        with tempfile.TemporaryDirectory() as cgroup_root:
+            asyncio.get_event_loop().run_until_complete(run(cgroup_root))
+
+
+class TestTimerWheel(object):
+    def test_expiration(self):
+        wheel = TimerWheel(nb_slots=4)
+        wheel.schedule("a", 1, "data a")
+        wheel.schedule("b", 2)
+        wheel.schedule("c", 2)
+        wheel.schedule("d", 9)  # more than two turns of the wheel
+        assert len(wheel) == 4
+        assert wheel.advance() == [("a", "data a")]
+        assert sorted(wheel.advance()) == [("b", None), ("c", None)]
+        assert [wheel.advance() for _ in range(6)] == [[]] * 6
+        assert wheel.advance() == [("d", None)]
+        assert len(wheel) == 0
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(nb_slots=4)
+        wheel.schedule("a", 1)
+        wheel.schedule("b", 1)
+        wheel.cancel("a")
+        wheel.cancel("unknown")
+        wheel.schedule("b", 3)
+        assert len(wheel) == 1
+        assert wheel.advance() == []
+        assert wheel.advance() == []
+        assert wheel.advance() == [("b", None)]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+from collections import OrderedDict
+
+
+class AgentLocality:
+    """
+        Keeps, for each agent, the set of the (course_id, task_id, environment) it ran most recently. An agent that ran
+        a task recently is "warm" for it: the task files and the environment image are most likely still in its caches.
+    """
+
+    def __init__(self, size=32):
+        """
+        :param size: number of (course_id, task_id, environment) remembered per agent
+        """
+        self._size = size
+        self._recent = {}  # agent_addr -> OrderedDict of keys, the most recent last
+        self._agents = {}  # key -> set of agents that ran it recently
+
+    def job_started(self, agent_addr, key):
+        """ Indicates that a job for `key` was sent to an agent """
+        recent = self._recent.setdefault(agent_addr, OrderedDict())
+        if key in recent:
+            recent.move_to_end(key)
+            return
+        recent[key] = None
+        self._agents.setdefault(key, set()).add(agent_addr)
+        if len(recent) > self._size:
+            old_key, _ = recent.popitem(last=False)
+            self._forget(agent_addr, old_key)
+
+    def remove_agent(self, agent_addr):
+        """ Forgets everything about an agent """
+        for key in self._recent.pop(agent_addr, ()):
+            self._forget(agent_addr, key)
+
+    def recent(self, agent_addr):
+        """ Returns the keys for which an agent is warm, the most recent first """
+        return list(reversed(self._recent.get(agent_addr, ())))
+
+    def warm_agents(self, key):
+        """ Returns the set of agents that are warm for a key """
+        return self._agents.get(key, set())
+
+    def _forget(self, agent_addr, key):
+        agents = self._agents[key]
+        agents.discard(agent_addr)
+        if not agents:
+            del self._agents[key]
@@ -3,17 +3,25 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 import asyncio
+import itertools
 import logging
 import queue
 import time
 import zmq
-from zmq.asyncio import Poller
-
-from inginious.backend.topic_priority_queue import TopicPriorityQueue
-from inginious.common.message_meta import ZMQUtils
+from zmq.asyncio import Context, Poller
+
+from inginious.backend.agent_locality import AgentLocality
+from inginious.backend.free_slot_index import FreeSlotIndex
+from inginious.backend.job_time_estimator import JobTimeEstimator, estimate_waiting_times
+from inginious.backend.router import shard_identity, shard_addr
+from inginious.backend.journal import BackendJournal
+from inginious.backend.scheduling_policies import FIFOPolicy, create_scheduling_policy
+from inginious.common.message_meta import MessageMeta, ZMQUtils
 from inginious.common.messages import BackendNewJob, AgentJobStarted, AgentJobDone, AgentJobSSHDebug, \
     BackendJobDone, BackendJobStarted, BackendJobSSHDebug, ClientNewJob, ClientKillJob, BackendKillJob, AgentHello, ClientHello, \
-    BackendUpdateEnvironments, Unknown, Ping, Pong, ClientGetQueue, BackendGetQueue
+    BackendUpdateEnvironments, Unknown, Ping, Pong, ClientGetQueue, BackendGetQueue, BackendNewJobBatch, BackendJobDoneBatch, \
+    ClientSubscribeQueue, BackendKnownJobs, BackendQueueSnapshot, BackendQueueDelta, BackendQueueDeltaBatch, BackendQueueWaitTimes, \
+    BackendShardStealJobs, BackendShardGiveJobs
 
 
 class Backend(object):
@@ -22,15 +30,45 @@ class Backend(object):
         Schedule jobs on agents.
     """
 
-    def __init__(self, context, agent_addr, client_addr):
+    def __init__(self, context, agent_addr, client_addr, scheduling_policy=None, locality_delay=0.0, journal=None,
+                 recovery_delay=30, shard=None):
+        """
+        :param context: ZeroMQ context for this process
+        :param agent_addr: address to which the agents will connect
+        :param client_addr: address to which the clients will connect
+        :param scheduling_policy: a TopicPriorityQueue giving the order in which waiting jobs are run.
+                                  See inginious.backend.scheduling_policies. Defaults to a FIFOPolicy.
+        :param locality_delay: maximum time, in seconds, during which a new job may wait for an agent that recently
+                               ran the same task, while other agents are free. 0 disables the delay; a free agent
+                               that recently ran the task is still preferred.
+        :param journal: a BackendJournal in which the changes of the job queue are logged, and from which the queue is
+                        restored when the backend starts. None to disable.
+        :param recovery_delay: time, in seconds, given to the agents to announce the jobs they were running when the
+                               backend stopped. The jobs that were not announced are then run again.
+        :param shard: a tuple (index, nb_shards) if this backend is a shard of a sharded backend, None else.
+                      agent_addr and client_addr are then the internal addresses of the BackendRouter, to which the
+                      shard connects. See inginious.backend.router.
+        """
         self._content = context
         self._loop = asyncio.get_event_loop()
         self._agent_addr = agent_addr
         self._client_addr = client_addr
 
-        self._agent_socket = context.socket(zmq.ROUTER)
-        self._client_socket = context.socket(zmq.ROUTER)
         self._logger = logging.getLogger("inginious.backend")
+        self._shard = shard
+        if shard is None:
+            self._agent_socket = context.socket(zmq.ROUTER)
+            self._client_socket = context.socket(zmq.ROUTER)
+
+            # Clients keep their identity when they reconnect, see Client
+            self._client_socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
+        else:
+            # The router prefixes the messages with the address of the agent or client, like a ROUTER socket does
+            self._logger = logging.getLogger("inginious.backend.shard-%i" % shard[0])
+            self._agent_socket = context.socket(zmq.DEALER)
+            self._client_socket = context.socket(zmq.DEALER)
+            self._agent_socket.identity = shard_identity(shard[0])
+            self._client_socket.identity = shard_identity(shard[0])
 
         # Enable support for ipv6
         self._agent_socket.ipv6 = True
@@ -47,25 +85,68 @@ class Backend(object):
         self._environments = {}
         self._registered_clients = set()  # addr of registered clients
 
+        self._batch_clients = set()  # addr of registered clients that support batches
+
         # Dict of registered agents
         # {
-        #     agent_address: {"name": "friendly_name", "environments": environment_dict}
+        #     agent_address: {"name": "friendly_name", "environments": environment_dict, "supports_batches": bool}
         # } environment_dict is a described in AgentHello.
         self._registered_agents = {}
 
-        # addr of available agents. May contain multiple times the same agent, because some agent can
-        # manage multiple jobs at once!
-        self._available_agents = []
+        # free job slots of the agents, indexed by environment
+        self._available_agents = FreeSlotIndex()
+
+        # agents whose free slots have not been matched against the waiting jobs yet. See update_queue.
+        self._agents_to_update = {}
+
+        # agents that received no job at their last update, as they wait for their running jobs to free enough
+        # resources for the first waiting job they can run. See update_queue.
+        self._reserved_agents = {}
 
         # ping count per addr of agents
         self._ping_count = {}
 
         # These two share the same objects! Tuples should never be recreated.
-        self._waiting_jobs_pq = TopicPriorityQueue() # priority queue for waiting jobs
+        self._waiting_jobs_pq = scheduling_policy if scheduling_policy is not None else FIFOPolicy() # priority queue for waiting jobs, with the same keys as _waiting_jobs
         self._waiting_jobs = {}  # mapping job to job message, with key: [(client_addr_as_bytes, ClientNewJob])]
 
         self._job_running = {}  # indicates on which agent which job is running. format: {BackendJobId:(addr_as_bytes,ClientNewJob,start_time)}
 
+        # Locality-aware placement: (course_id, task_id, environment) recently run by each agent
+        self._locality = AgentLocality()
+        self._locality_delay = locality_delay
+        # jobs waiting for an agent that recently ran the same task. They are in _waiting_jobs, but not in _waiting_jobs_pq.
+        # format: {(course_id, task_id, environment): {(client_addr, job_id): (job, timer_handle)}}
+        self._held_jobs = {}
+
+        # Run times of the previous jobs, used to estimate the waiting time of the jobs
+        self._job_time_estimator = JobTimeEstimator()
+
+        # clients subscribed to the changes of the job queue. format: {client_addr: next sequence number}
+        self._queue_subscribers = {}
+        self._queue_wait_times_interval = 10  # seconds between two BackendQueueWaitTimes
+        self._queue_wait_times_timer = None
+
+        # Journal of the job queue, and jobs that were running when the backend stopped, waiting for their agent to
+        # announce them. format: {BackendJobId: (priority, insert_time, client_addr, client_job_id, ClientNewJob)}
+        self._journal = journal
+        self._recovery_delay = recovery_delay
+        self._recovering_jobs = {}
+
+        # Sharded backend: addresses of the other shards, jobs they asked for because they have free agent slots, and
+        # last request we sent them. format of the requests: {shard_addr: (environments, nb_jobs)}
+        self._shard_peers = {shard_addr(index) for index in range(shard[1]) if index != shard[0]} if shard else set()
+        self._steal_requests = {}
+        self._steal_request_sent = ((), 0)
+        self._shards_update_scheduled = False
+
+        # maximum number of messages read from a socket before giving the hand to the other tasks
+        self._max_messages_per_poll = 64
+
+        # messages to be sent at the next iteration of the event loop. format: {(socket, addr): [message]}
+        self._outgoing_messages = {}
+        self._outgoing_flush_scheduled = False
+
     async def handle_agent_message(self, agent_addr, message):
         """Dispatch messages received from agents to the right handlers"""
         message_handlers = {
@@ -84,9 +165,16 @@ class Backend(object):
     async def handle_client_message(self, client_addr, message):
         """Dispatch messages received from clients to the right handlers"""
 
-        # Verify that the client is registered
-        if message.__class__ != ClientHello and client_addr not in self._registered_clients:
-            await ZMQUtils.send_with_addr(self._client_socket, client_addr, Unknown())
+        if client_addr in self._shard_peers:
+            await self.handle_shard_message(client_addr, message)
+            return
+
+        # Verify that the client is registered. A ClientHello registers the client immediately, so that the messages
+        # sent just after it are accepted even if they are received before the ClientHello is handled.
+        if message.__class__ == ClientHello:
+            self._registered_clients.add(client_addr)
+        elif client_addr not in self._registered_clients:
+            self._send_to_client(client_addr, Unknown())
             return
 
         message_handlers = {
@@ -94,6 +182,7 @@ class Backend(object):
             ClientNewJob: self.handle_client_new_job,
             ClientKillJob: self.handle_client_kill_job,
             ClientGetQueue: self.handle_client_get_queue,
+            ClientSubscribeQueue: self.handle_client_subscribe_queue,
             Ping: self.handle_client_ping
         }
         try:
@@ -102,123 +191,382 @@ class Backend(object):
             raise TypeError("Unknown message type %s" % message.__class__)
         self._create_safe_task(func(client_addr, message))
 
+    async def handle_shard_message(self, shard, message):
+        """Dispatch messages received from the other shards to the right handlers"""
+        message_handlers = {
+            BackendShardStealJobs: self.handle_shard_steal_jobs,
+            BackendShardGiveJobs: self.handle_shard_give_jobs
+        }
+        try:
+            func = message_handlers[message.__class__]
+        except:
+            raise TypeError("Unknown message type %s" % message.__class__)
+        self._create_safe_task(func(shard, message))
+
     async def send_environment_update_to_client(self, client_addrs):
         """ :param client_addrs: list of clients to which we should send the update """
         self._logger.debug("Sending environments updates...")
         available_environments = {idx: environment[3] for idx, environment in self._environments.items()}
         msg = BackendUpdateEnvironments(available_environments)
         for client in client_addrs:
-            await ZMQUtils.send_with_addr(self._client_socket, client, msg)
+            self._send_to_client(client, msg)
 
-    async def handle_client_hello(self, client_addr, _: ClientHello):
+    async def handle_client_hello(self, client_addr, message: ClientHello):
         """ Handle an ClientHello message. Send available environments to the client """
         self._logger.info("New client connected %s", client_addr)
         self._registered_clients.add(client_addr)
+        self._queue_subscribers.pop(client_addr, None)  # the client restarted
+        if message.supports_batches:
+            self._batch_clients.add(client_addr)
+        else:
+            self._batch_clients.discard(client_addr)
         await self.send_environment_update_to_client([client_addr])
 
+        # Tell the client which of its jobs are still alive, e.g. after a restart of the backend
+        job_ids = [job_id for jobs in (self._waiting_jobs, self._job_running, self._recovering_jobs)
+                   for job_client_addr, job_id in jobs if job_client_addr == client_addr]
+        self._send_to_client(client_addr, BackendKnownJobs(job_ids))
+
     async def handle_client_ping(self, client_addr, _: Ping):
         """ Handle an Ping message. Pong the client """
-        await ZMQUtils.send_with_addr(self._client_socket, client_addr, Pong())
+        self._send_to_client(client_addr, Pong())
 
     async def handle_client_new_job(self, client_addr, message: ClientNewJob):
         """ Handle an ClientNewJob message. Add a job to the queue and triggers an update """
         self._logger.info("Adding a new job %s %s to the queue", client_addr, message.job_id)
+        self._add_job(client_addr, message, time.time())
+        await self.update_queue()
 
-        job = (message.priority, time.time(), client_addr, message.job_id, message)
+    def _add_job(self, client_addr, message: ClientNewJob, insert_time):
+        """ Adds a job to the waiting jobs. update_queue must be called afterwards. """
+        job = (message.priority, insert_time, client_addr, message.job_id, message)
         self._waiting_jobs[(client_addr, message.job_id)] = job
-        self._waiting_jobs_pq.put(message.environment, job)
+        self._write_journal("job_queued", client_addr, job[0], job[1], message)
+        if self._queue_subscribers:
+            expected_time = self._job_time_estimator.run_time(message.course_id, message.task_id,
+                                                              self._get_time_limit_estimate(message))
+            self._notify_queue_subscribers("queued", client_addr, self._waiting_job_info(client_addr, job, expected_time, -1))
+
+        # Prefer a free agent that recently ran the same task.
+        locality_key = (message.course_id, message.task_id, message.environment)
+        warm_agents = self._locality.warm_agents(locality_key)
+        demand = self._get_resource_demand(message)
+        agent_addr = next((agent for agent in warm_agents if self._available_agents.fits(agent, demand)), None)
+        if agent_addr is None and warm_agents and self._locality_delay > 0 \
+                and self._available_agents.find_agent(message.environment) is not None:
+            # Other agents are free, but wait a little for one of the warm agents
+            timer = self._loop.call_later(self._locality_delay, self._release_held_job, locality_key, (client_addr, message.job_id))
+            self._held_jobs.setdefault(locality_key, {})[(client_addr, message.job_id)] = (job, timer)
+            return
 
-        await self.update_queue()
+        self._waiting_jobs_pq.put(message.environment, (client_addr, message.job_id), job)
+
+        # If an agent has a free slot for this environment, no job it can run was waiting before this one
+        if agent_addr is None:
+            agent_addr = self._find_agent_to_update(message.environment)
+        if agent_addr is not None:
+            self._agents_to_update[agent_addr] = None
+
+    def _find_agent_to_update(self, environment):
+        """
+        Returns an agent that has a free slot for the environment, preferably one that is not reserved for a waiting
+        job (see update_queue), or None
+        """
+        agents = self._available_agents.find_agents(environment)
+        return next((agent for agent in agents if agent not in self._reserved_agents), agents[0] if agents else None)
+
+    def _release_held_job(self, locality_key, job_key):
+        """ Called when a job has waited locality_delay seconds for a warm agent. Allows any agent to run it. """
+        held_jobs = self._held_jobs.get(locality_key, {})
+        if job_key not in held_jobs:
+            return
+        job, _ = held_jobs.pop(job_key)
+        if not held_jobs:
+            del self._held_jobs[locality_key]
+
+        environment = locality_key[2]
+        self._waiting_jobs_pq.put(environment, job_key, job)
+        agent_addr = self._find_agent_to_update(environment)
+        if agent_addr is not None:
+            self._agents_to_update[agent_addr] = None
+            self._create_safe_task(self.update_queue())
 
     async def handle_client_kill_job(self, client_addr, message: ClientKillJob):
         """ Handle an ClientKillJob message. Remove a job from the waiting list or send the kill message to the right agent. """
         # Check if the job is not in the queue
         if (client_addr, message.job_id) in self._waiting_jobs:
 
-            # Erase the job reference in priority queue
+            # Erase the job reference in priority queue (or in the jobs waiting for a warm agent)
             job = self._waiting_jobs.pop((client_addr, message.job_id))
-            job[-1] = None
+            locality_key = (job[-1].course_id, job[-1].task_id, job[-1].environment)
+            if (client_addr, message.job_id) in self._held_jobs.get(locality_key, {}):
+                _, timer = self._held_jobs[locality_key].pop((client_addr, message.job_id))
+                timer.cancel()
+                if not self._held_jobs[locality_key]:
+                    del self._held_jobs[locality_key]
+            else:
+                self._waiting_jobs_pq.remove((client_addr, message.job_id))
+
+            self._notify_queue_subscribers("killed", client_addr, (message.job_id, True))
+            self._write_journal("job_ended", client_addr, message.job_id)
 
             # Do not forget to send a JobDone
-            await ZMQUtils.send_with_addr(self._client_socket, client_addr, BackendJobDone(message.job_id, ("killed", "You killed the job"),
-                                                                                           0.0, {}, {}, {}, "", None, "", ""))
+            self._send_to_client(client_addr, BackendJobDone(message.job_id, ("killed", "You killed the job"),
+                                                             0.0, {}, {}, {}, "", None, "", ""))
         # If the job is running, transmit the info to the agent
         elif (client_addr, message.job_id) in self._job_running:
             agent_addr = self._job_running[(client_addr, message.job_id)][0]
-            await ZMQUtils.send_with_addr(self._agent_socket, agent_addr, BackendKillJob((client_addr, message.job_id)))
-        else:
+            self._send_to_agent(agent_addr, BackendKillJob((client_addr, message.job_id)))
+        # If the job was running when the backend stopped, its agent will be asked to kill it when it says hello
+        elif (client_addr, message.job_id) in self._recovering_jobs:
+            del self._recovering_jobs[(client_addr, message.job_id)]
+            self._write_journal("job_ended", client_addr, message.job_id)
+            self._send_to_client(client_addr, BackendJobDone(message.job_id, ("killed", "You killed the job"),
+                                                             0.0, {}, {}, {}, "", None, "", ""))
+        elif self._shard is None:
             self._logger.warning("Client %s attempted to kill unknown job %s", str(client_addr), str(message.job_id))
 
     async def handle_client_get_queue(self, client_addr, _: ClientGetQueue):
         """ Handles a ClientGetQueue message. Send back info about the job queue"""
-        #jobs_running: a list of tuples in the form
-        #(job_id, is_current_client_job, agent_name, info, launcher, started_at, max_time)
-        jobs_running = list()
+        jobs_running, jobs_waiting = self._get_queue_snapshot(client_addr)
+        self._send_to_client(client_addr, BackendGetQueue(jobs_running, jobs_waiting))
 
-        for backend_job_id, content in self._job_running.items():
-            agent_friendly_name = self._registered_agents[content[0]]["name"]
-            jobs_running.append((content[1].job_id, backend_job_id[0] == client_addr, agent_friendly_name,
-                                 content[1].course_id+"/"+content[1].task_id,
-                                 content[1].launcher, int(content[2]), self._get_time_limit_estimate(content[1])))
+    async def handle_client_subscribe_queue(self, client_addr, _: ClientSubscribeQueue):
+        """
+        Handles a ClientSubscribeQueue message. Send a snapshot of the job queue, followed by the changes of the queue
+        (BackendQueueDelta) and regular estimations of the waiting times of the jobs of the client (BackendQueueWaitTimes).
+        A new subscription (e.g. after a gap in the sequence numbers) restarts with a new snapshot.
+        """
+        jobs_running, jobs_waiting = self._get_queue_snapshot(client_addr)
+        self._queue_subscribers[client_addr] = 0
+        self._send_to_queue_subscriber(client_addr, BackendQueueSnapshot, jobs_running, jobs_waiting)
+        if self._queue_wait_times_timer is None:
+            self._queue_wait_times_timer = self._loop.call_later(self._queue_wait_times_interval, self._send_queue_wait_times)
+
+    def _get_queue_snapshot(self, client_addr):
+        """ Returns the lists (jobs_running, jobs_waiting) describing the job queue, as sent in BackendGetQueue """
+        #jobs_running: a list of tuples in the form
+        #(job_id, is_current_client_job, agent_name, info, launcher, started_at, max_time, expected_time)
+        jobs_running = [self._running_job_info(client_addr, backend_job_id) for backend_job_id in self._job_running]
 
         #jobs_waiting: a list of tuples in the form
-        #(job_id, is_current_client_job, info, launcher, max_time)
-        jobs_waiting = list()
+        #(job_id, is_current_client_job, info, launcher, max_time, expected_time, wait_time)
+        jobs_waiting = [self._waiting_job_info(client_addr, job, expected_time, wait_time)
+                        for job, expected_time, wait_time in self._estimate_waiting_times()]
+        return jobs_running, jobs_waiting
+
+    def _running_job_info(self, client_addr, backend_job_id):
+        """ Returns the tuple describing a running job in BackendGetQueue """
+        agent_addr, job_msg, started_at = self._job_running[backend_job_id]
+        max_time = self._get_time_limit_estimate(job_msg)
+        elapsed = time.time() - started_at
+        remaining = self._job_time_estimator.remaining_time(job_msg.course_id, job_msg.task_id, elapsed, max_time)
+        known = max_time >= 0 or self._job_time_estimator.run_time(job_msg.course_id, job_msg.task_id, None) is not None
+        return (job_msg.job_id, backend_job_id[0] == client_addr, self._registered_agents[agent_addr]["name"],
+                job_msg.course_id+"/"+job_msg.task_id, job_msg.launcher, int(started_at), max_time,
+                int(round(elapsed + remaining)) if known else -1)
+
+    def _waiting_job_info(self, client_addr, job, expected_time, wait_time):
+        """ Returns the tuple describing a waiting job in BackendGetQueue """
+        msg = job[-1]
+        return (msg.job_id, job[2] == client_addr, msg.course_id+"/"+msg.task_id, msg.launcher,
+                self._get_time_limit_estimate(msg), int(round(expected_time)), int(round(wait_time)))
+
+    def _estimate_waiting_times(self):
+        """ Returns a list of (job, expected_run_time, wait_time) for all the waiting jobs, in the order in which they will be run """
+        now = time.time()
+
+        remaining_times = {agent_addr: [] for agent_addr in self._registered_agents}
+        for agent_addr, job_msg, started_at in self._job_running.values():
+            remaining_times[agent_addr].append(self._job_time_estimator.remaining_time(
+                job_msg.course_id, job_msg.task_id, now - started_at, self._get_time_limit_estimate(job_msg)))
+
+        # Waiting jobs, in the order in which they will be run. Jobs waiting for a warm agent come last.
+        waiting_jobs = [job for _, job in self._waiting_jobs_pq.items()]
+        waiting_jobs += sorted((job for held_jobs in self._held_jobs.values() for job, _ in held_jobs.values()),
+                               key=lambda job: job[1])
+
+        expected_times = [self._job_time_estimator.run_time(job[-1].course_id, job[-1].task_id,
+                                                            self._get_time_limit_estimate(job[-1]))
+                          for job in waiting_jobs]
+
+        # Simulates the dispatch of the waiting jobs on the slots of the agents
+        agents = [(self._available_agents.environments(agent_addr),
+                   [0.0] * self._available_agents.free_slots(agent_addr) + remaining_times[agent_addr])
+                  for agent_addr in self._registered_agents]
+        waiting_times = estimate_waiting_times(agents, [(job[-1].environment, max(expected_time, 0))
+                                                        for job, expected_time in zip(waiting_jobs, expected_times)])
+        return list(zip(waiting_jobs, expected_times, waiting_times))
+
+    def _send_to_queue_subscriber(self, client_addr, message_class, *args):
+        """ Sends a message with the next sequence number of a subscriber of the job queue """
+        sequence = self._queue_subscribers[client_addr]
+        self._queue_subscribers[client_addr] = sequence + 1
+        self._send_to_client(client_addr, message_class(sequence, *args))
+
+    def _notify_queue_subscribers(self, event, job_client_addr, job_info):
+        """
+        Sends a BackendQueueDelta to the subscribers of the job queue.
+        :param job_info: the tuple describing the job, whose second element (is_current_client_job) is set for each subscriber
+        """
+        for client_addr in self._queue_subscribers:
+            self._send_to_queue_subscriber(client_addr, BackendQueueDelta, event,
+                                           (job_info[0], client_addr == job_client_addr) + job_info[2:])
+
+    def _send_queue_wait_times(self):
+        """ Sends to each subscriber of the job queue the estimated waiting time of its waiting jobs """
+        self._queue_wait_times_timer = None
+        if not self._queue_subscribers:
+            return
 
-        for job_client_addr, job in self._waiting_jobs.items():
-            msg = job[-1]
-            if isinstance(msg, ClientNewJob):
-                jobs_waiting.append((msg.job_id, job_client_addr[0] == client_addr, msg.course_id+"/"+msg.task_id, msg.launcher,
-                                     self._get_time_limit_estimate(msg)))
+        wait_times = {}
+        if self._waiting_jobs:
+            for job, _, wait_time in self._estimate_waiting_times():
+                wait_times.setdefault(job[2], {})[job[3]] = int(round(wait_time))
+        for client_addr in self._queue_subscribers:
+            if client_addr in wait_times:
+                self._send_to_queue_subscriber(client_addr, BackendQueueWaitTimes, wait_times[client_addr])
 
-        await ZMQUtils.send_with_addr(self._client_socket, client_addr, BackendGetQueue(jobs_running, jobs_waiting))
+        self._queue_wait_times_timer = self._loop.call_later(self._queue_wait_times_interval, self._send_queue_wait_times)
 
     async def update_queue(self):
         """
-        Send waiting jobs to available agents
-        """
+        Send waiting jobs to available agents.
 
-        jobs_ignored = []
+        Only the agents that had a slot freed, or that may run a newly arrived job, since the last call are considered
+        (see _agents_to_update). Any other free slot cannot run any of the waiting jobs.
 
-        available_agents = list(self._available_agents) # do a copy to avoid bad things
-
-        # Loop on available agents to maximize running jobs, and break if priority queue empty
-        for agent_addr in available_agents:
-            if self._waiting_jobs_pq.empty():
-                break  # nothing to do
+        An agent that gives its resources (see AgentHello) receives the first waiting job that it can run, skipping
+        the jobs that are too large for it but not for another agent. When this job does not fit in the resources left
+        by its running jobs, the agent is reserved for it: it receives no other job until enough resources are freed,
+        so that large jobs are not delayed forever by smaller ones. The other free agents of the environment of this
+        job are then updated too, as they may run the jobs waiting behind it.
+        """
+        while self._agents_to_update:
+            agent_addr = next(iter(self._agents_to_update))
+            del self._agents_to_update[agent_addr]
+            self._reserved_agents.pop(agent_addr, None)
+
+            # First, give the agent the jobs that are waiting for it because it recently ran the same task
+            if self._held_jobs:
+                for locality_key in self._locality.recent(agent_addr):
+                    held_jobs = self._held_jobs.get(locality_key, {})
+                    while held_jobs:
+                        job_key, (job, timer) = next(iter(held_jobs.items()))
+                        if not self._available_agents.fits(agent_addr, self._get_resource_demand(job[-1])):
+                            break
+                        del held_jobs[job_key]
+                        timer.cancel()
+                        self._dispatch_job(agent_addr, job)
+                    if not held_jobs:
+                        self._held_jobs.pop(locality_key, None)
+
+            environments = self._available_agents.environments(agent_addr)
+            skip = self._too_large_for(agent_addr) if self._available_agents.resources(agent_addr) else None
+
+            # Loop on the free slots of the agent, and break if there is no job for it
+            while self._available_agents.free_slots(agent_addr) > 0:
+                try:
+                    job = self._waiting_jobs_pq.peek(environments, skip)
+                except queue.Empty:
+                    break  # skip agent, nothing to do!
+                demand = self._get_resource_demand(job[-1])
+                if not self._available_agents.fits(agent_addr, demand) and self._available_agents.could_fit(agent_addr, demand):
+                    # wait for the running jobs to free enough resources
+                    self._reserved_agents[agent_addr] = None
+                    for other_agent in self._available_agents.find_agents(job[-1].environment):
+                        if other_agent != agent_addr and other_agent not in self._reserved_agents:
+                            self._agents_to_update[other_agent] = None
+                    break
+                # Jobs that fit in no agent are sent anyway: the agent tells the client that it cannot run them
+                self._dispatch_job(agent_addr, self._waiting_jobs_pq.get(environments, skip))
+
+        if self._shard_peers and not self._shards_update_scheduled:
+            self._shards_update_scheduled = True
+            self._loop.call_soon(self._update_shards)
+
+    def _update_shards(self):
+        """
+        Sharded backend: gives the waiting jobs that our agents cannot run to the shards that asked for them, and tells
+        the other shards when our number of free agent slots changed
+        """
+        self._shards_update_scheduled = False
+        self._give_jobs()
+
+        request = (tuple(sorted(self._available_agents.free_environments())), len(self._available_agents))
+        if request[1] == 0:
+            request = ((), 0)
+        if request != self._steal_request_sent:
+            self._steal_request_sent = request
+            for shard in self._shard_peers:
+                self._send_to_client(shard, BackendShardStealJobs(list(request[0]), request[1]))
+
+    def _give_jobs(self):
+        """ Gives waiting jobs to the shards that asked for them. The jobs in the queue cannot run on our agents now. """
+        for shard, (environments, nb_jobs) in list(self._steal_requests.items()):
+            jobs = []
+            while len(jobs) < nb_jobs:
+                try:
+                    jobs.append(self._waiting_jobs_pq.get(environments))
+                except queue.Empty:
+                    break
+            if not jobs:
+                continue
+
+            self._steal_requests[shard] = (environments, nb_jobs - len(jobs))
+            for _, _, client_addr, job_id, _ in jobs:
+                self._logger.info("Giving job %s %s to shard %s", client_addr, job_id, shard)
+                del self._waiting_jobs[(client_addr, job_id)]
+                self._notify_queue_subscribers("done", client_addr, (job_id, True))
+                self._write_journal("job_ended", client_addr, job_id)
+            self._send_to_client(shard, BackendShardGiveJobs([(job[2], job[1], job[-1].dump()) for job in jobs]))
+
+    async def handle_shard_steal_jobs(self, shard, message: BackendShardStealJobs):
+        """ Handles a BackendShardStealJobs message: the shard has free agent slots. Give it waiting jobs, now or later. """
+        if message.nb_jobs > 0:
+            self._steal_requests[shard] = (message.environments, message.nb_jobs)
+            self._give_jobs()
+        else:
+            self._steal_requests.pop(shard, None)
+
+    async def handle_shard_give_jobs(self, shard, message: BackendShardGiveJobs):
+        """ Handles a BackendShardGiveJobs message: adds the jobs given by another shard to the queue """
+        for client_addr, insert_time, job_msg in message.jobs:
+            job_msg = MessageMeta.load(job_msg)
+            self._logger.info("Adding job %s %s given by shard %s to the queue", client_addr, job_msg.job_id, shard)
+            self._add_job(client_addr, job_msg, insert_time)
+        await self.update_queue()
 
-            try:
-                job = None
-                while job is None:
-                    # keep the object, do not unzip it directly! It's sometimes modified when a job is killed.
-                    job = self._waiting_jobs_pq.get(self._registered_agents[agent_addr]["environments"].keys())
-                    priority, insert_time, client_addr, job_id, job_msg = job
-
-                    # Killed job, removing it from the mapping
-                    if not job_msg:
-                        del self._waiting_jobs[(client_addr, job_id)]
-                        job = None  # repeat the while loop. we need a job
-            except queue.Empty:
-                continue  # skip agent, nothing to do!
-
-            # We have found a job, let's remove the agent from the available list
-            self._available_agents.remove(agent_addr)
-
-            # Remove the job from the queue
-            del self._waiting_jobs[(client_addr, job_id)]
-
-            # Send the job to agent
-            job_id = (client_addr, job_msg.job_id)
-            self._job_running[job_id] = (agent_addr, job_msg, time.time())
-            self._logger.info("Sending job %s %s to agent %s", client_addr, job_msg.job_id, agent_addr)
-            await ZMQUtils.send_with_addr(self._agent_socket, agent_addr, BackendNewJob(job_id, job_msg.course_id, job_msg.task_id,
-                                                                                        job_msg.inputdata, job_msg.environment,
-                                                                                        job_msg.environment_parameters,
-                                                                                        job_msg.debug))
-
-        # Let's not forget to add again the ignored jobs to the PQ.
-        for entry in jobs_ignored:
-            self._waiting_jobs_pq.put(entry)
+    def _too_large_for(self, agent_addr):
+        """ Returns a function telling if a waiting job must not be sent to an agent, as it can only run on other agents """
+        def too_large(job):
+            demand = self._get_resource_demand(job[-1])
+            return not self._available_agents.could_fit(agent_addr, demand) \
+                and self._available_agents.could_fit_somewhere(job[-1].environment, demand)
+        return too_large
+
+    def _dispatch_job(self, agent_addr, job):
+        """ Sends a waiting job to a free slot of an agent """
+        priority, insert_time, client_addr, job_id, job_msg = job
+
+        # We have found a job, let's remove the slot of the agent from the available list
+        self._available_agents.acquire(agent_addr, self._get_resource_demand(job_msg))
+
+        # Remove the job from the queue
+        del self._waiting_jobs[(client_addr, job_id)]
+
+        # Send the job to agent
+        job_id = (client_addr, job_msg.job_id)
+        self._job_running[job_id] = (agent_addr, job_msg, time.time())
+        self._locality.job_started(agent_addr, (job_msg.course_id, job_msg.task_id, job_msg.environment))
+        self._write_journal("job_started", client_addr, job_msg.job_id)
+        if self._queue_subscribers:
+            self._notify_queue_subscribers("started", client_addr, self._running_job_info(client_addr, job_id))
+        self._logger.info("Sending job %s %s to agent %s", client_addr, job_msg.job_id, agent_addr)
+        self._send_to_agent(agent_addr, BackendNewJob(job_id, job_msg.course_id, job_msg.task_id,
+                                                      job_msg.inputdata, job_msg.environment,
+                                                      job_msg.environment_parameters,
+                                                      job_msg.debug))
 
     async def handle_agent_hello(self, agent_addr, message: AgentHello):
         """
@@ -226,12 +574,34 @@ class Backend(object):
         """
         self._logger.info("Agent %s (%s) said hello", agent_addr, message.friendly_name)
 
+        # Jobs that the agent is still running, e.g. because the agent or the backend reconnected
+        running_jobs = {}
+        for job_id in message.running_jobs:
+            job_id = tuple(job_id)
+            if job_id in self._job_running and self._job_running[job_id][0] == agent_addr:
+                running_jobs[job_id] = self._job_running.pop(job_id)
+            elif job_id in self._recovering_jobs:
+                job = self._recovering_jobs.pop(job_id)
+                running_jobs[job_id] = (agent_addr, job[-1], job[1])
+            else:
+                self._logger.warning("Agent %s (%s) runs unknown job %s %s, killing it", agent_addr, message.friendly_name, *job_id)
+                self._send_to_agent(agent_addr, BackendKillJob(job_id))
+
         if agent_addr in self._registered_agents:
             # Delete previous instance of this agent, if any
             await self._delete_agent(agent_addr)
 
-        self._registered_agents[agent_addr] = {"name": message.friendly_name, "environments": message.available_environments}
-        self._available_agents.extend([agent_addr for _ in range(0, message.available_job_slots)])
+        self._registered_agents[agent_addr] = {"name": message.friendly_name, "environments": message.available_environments,
+                                               "supports_batches": message.supports_batches}
+        self._available_agents.add_agent(agent_addr, message.available_environments.keys(), message.available_job_slots,
+                                         message.resources)
+        self._agents_to_update[agent_addr] = None
+        for job_id, (_, job_msg, started_at) in running_jobs.items():
+            self._logger.info("Job %s %s is still running on agent %s", job_id[0], job_id[1], agent_addr)
+            self._job_running[job_id] = (agent_addr, job_msg, started_at)
+            if self._available_agents.free_slots(agent_addr) > 0:
+                self._available_agents.acquire(agent_addr, self._get_resource_demand(job_msg))
+            self._notify_queue_subscribers("started", job_id[0], self._running_job_info(job_id[0], job_id))
         self._ping_count[agent_addr] = 0
 
         # update information about available environments
@@ -279,30 +649,43 @@ class Backend(object):
     async def handle_agent_job_started(self, agent_addr, message: AgentJobStarted):
         """Handle an AgentJobStarted message. Send the data back to the client"""
         self._logger.debug("Job %s %s started on agent %s", message.job_id[0], message.job_id[1], agent_addr)
-        await ZMQUtils.send_with_addr(self._client_socket, message.job_id[0], BackendJobStarted(message.job_id[1]))
+        self._send_to_client(message.job_id[0], BackendJobStarted(message.job_id[1]))
 
     async def handle_agent_job_done(self, agent_addr, message: AgentJobDone):
         """Handle an AgentJobDone message. Send the data back to the client, and start new job if needed"""
 
-        if agent_addr in self._registered_agents:
-
-
+        if message.job_id in self._recovering_jobs:
+            # A job that was running when the backend stopped, whose agent did not say hello yet
+            self._logger.info("Recovered job %s %s finished on agent %s", message.job_id[0], message.job_id[1], agent_addr)
+            del self._recovering_jobs[message.job_id]
+            self._write_journal("job_ended", *message.job_id)
+            self._send_to_client(message.job_id[0], BackendJobDone(message.job_id[1], message.result,
+                                                                   message.grade, message.problems,
+                                                                   message.tests, message.custom,
+                                                                   message.state, message.archive,
+                                                                   message.stdout, message.stderr))
+        elif agent_addr in self._registered_agents:
             if message.job_id in self._job_running:
                 self._logger.info("Job %s %s finished on agent %s", message.job_id[0], message.job_id[1], agent_addr)
                 # Remove the job from the list of running jobs
-                del self._job_running[message.job_id]
+                _, job_msg, started_at = self._job_running.pop(message.job_id)
+                self._notify_queue_subscribers("done", message.job_id[0], (message.job_id[1], True))
+                self._write_journal("job_ended", *message.job_id)
+                if message.result[0] not in ("killed", "crash"):
+                    self._job_time_estimator.job_done(job_msg.course_id, job_msg.task_id, time.time() - started_at)
                 # The agent is available now
-                self._available_agents.append(agent_addr)
+                self._available_agents.release(agent_addr, self._get_resource_demand(job_msg))
+                self._agents_to_update[agent_addr] = None
             else:
                 self._logger.warning("Job result %s %s from agent %s was not running", message.job_id[0], message.job_id[1], agent_addr)
 
             # Sent the data back to the client, even if we didn't know the job. This ensure everything can recover
             # in case of problems.
-            await ZMQUtils.send_with_addr(self._client_socket, message.job_id[0], BackendJobDone(message.job_id[1], message.result,
-                                                                                                 message.grade, message.problems,
-                                                                                                 message.tests, message.custom,
-                                                                                                 message.state, message.archive,
-                                                                                                 message.stdout, message.stderr))
+            self._send_to_client(message.job_id[0], BackendJobDone(message.job_id[1], message.result,
+                                                                   message.grade, message.problems,
+                                                                   message.tests, message.custom,
+                                                                   message.state, message.archive,
+                                                                   message.stdout, message.stderr))
         else:
             self._logger.warning("Job result %s %s from non-registered agent %s", message.job_id[0], message.job_id[1], agent_addr)
 
@@ -311,13 +694,22 @@ class Backend(object):
 
     async def handle_agent_job_ssh_debug(self, _, message: AgentJobSSHDebug):
         """Handle an AgentJobSSHDebug message. Send the data back to the client"""
-        await ZMQUtils.send_with_addr(self._client_socket, message.job_id[0], BackendJobSSHDebug(message.job_id[1], message.host, message.port,
-                                                                                                 message.password))
+        self._send_to_client(message.job_id[0], BackendJobSSHDebug(message.job_id[1], message.host, message.port,
+                                                                   message.password))
 
     async def run(self):
         self._logger.info("Backend started")
-        self._agent_socket.bind(self._agent_addr)
-        self._client_socket.bind(self._client_addr)
+        if self._journal is not None:
+            self._restore_from_journal()
+        if self._shard is None:
+            self._agent_socket.bind(self._agent_addr)
+            self._client_socket.bind(self._client_addr)
+        else:
+            # Connect to the router, and tell it we are ready with an empty address
+            self._agent_socket.connect(self._agent_addr)
+            self._client_socket.connect(self._client_addr)
+            await ZMQUtils.send_with_addr(self._agent_socket, b"", Ping())
+            await ZMQUtils.send_with_addr(self._client_socket, b"", Ping())
         self._loop.call_later(1, self._create_safe_task, self._do_ping())
 
         try:
@@ -325,15 +717,21 @@ class Backend(object):
                 socks = await self._poller.poll()
                 socks = dict(socks)
 
-                # New message from agent
+                # New message from agent. The messages already received are handled at once, so that the answers can be batched
                 if self._agent_socket in socks:
-                    agent_addr, message = await ZMQUtils.recv_with_addr(self._agent_socket)
-                    await self.handle_agent_message(agent_addr, message)
+                    for _ in range(self._max_messages_per_poll):
+                        agent_addr, message = await ZMQUtils.recv_with_addr(self._agent_socket, keep_payloads=True)
+                        await self.handle_agent_message(agent_addr, message)
+                        if not self._agent_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                            break
 
                 # New message from client
                 if self._client_socket in socks:
-                    client_addr, message = await ZMQUtils.recv_with_addr(self._client_socket)
-                    await self.handle_client_message(client_addr, message)
+                    for _ in range(self._max_messages_per_poll):
+                        client_addr, message = await ZMQUtils.recv_with_addr(self._client_socket, keep_payloads=True)
+                        await self.handle_client_message(client_addr, message)
+                        if not self._client_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                            break
 
         except asyncio.CancelledError:
             return
@@ -375,7 +773,10 @@ class Backend(object):
 
     async def _delete_agent(self, agent_addr):
         """ Deletes an agent """
-        self._available_agents = [agent for agent in self._available_agents if agent != agent_addr]
+        self._available_agents.remove_agent(agent_addr)
+        self._agents_to_update.pop(agent_addr, None)
+        self._reserved_agents.pop(agent_addr, None)
+        self._locality.remove_agent(agent_addr)
         del self._registered_agents[agent_addr]
         await self._recover_jobs()
 
@@ -383,13 +784,88 @@ class Backend(object):
         """ Recover the jobs sent to a crashed agent """
         for (client_addr, job_id), (agent_addr, job_msg, _) in reversed(list(self._job_running.items())):
             if agent_addr not in self._registered_agents:
-                await ZMQUtils.send_with_addr(self._client_socket, client_addr,
-                                              BackendJobDone(job_id, ("crash", "Agent restarted"),
-                                                             0.0, {}, {}, {}, "", None, None, None))
+                self._send_to_client(client_addr, BackendJobDone(job_id, ("crash", "Agent restarted"),
+                                                                 0.0, {}, {}, {}, "", None, None, None))
                 del self._job_running[(client_addr, job_id)]
+                self._notify_queue_subscribers("done", client_addr, (job_id, True))
+                self._write_journal("job_ended", client_addr, job_id)
 
         await self.update_queue()
 
+    def _restore_from_journal(self):
+        """ Restores the job queue from the journal """
+        jobs, running = self._journal.load()
+        for (client_addr, job_id), (priority, insert_time, message) in jobs.items():
+            job = (priority, insert_time, client_addr, job_id, message)
+            if (client_addr, job_id) in running:
+                self._recovering_jobs[(client_addr, job_id)] = job
+            else:
+                self._waiting_jobs[(client_addr, job_id)] = job
+                self._waiting_jobs_pq.put(message.environment, (client_addr, job_id), job)
+        self._logger.info("Restored %i waiting jobs and %i running jobs from the journal", len(self._waiting_jobs),
+                          len(self._recovering_jobs))
+        if self._recovering_jobs:
+            self._loop.call_later(self._recovery_delay, self._requeue_recovering_jobs)
+
+    def _requeue_recovering_jobs(self):
+        """ Runs again the jobs that were running when the backend stopped, and that no agent announced """
+        for (client_addr, job_id), job in self._recovering_jobs.items():
+            self._logger.warning("Job %s %s was not announced by any agent, running it again", client_addr, job_id)
+            self._waiting_jobs[(client_addr, job_id)] = job
+            self._waiting_jobs_pq.put(job[-1].environment, (client_addr, job_id), job)
+            agent_addr = self._find_agent_to_update(job[-1].environment)
+            if agent_addr is not None:
+                self._agents_to_update[agent_addr] = None
+        self._recovering_jobs = {}
+        self._create_safe_task(self.update_queue())
+
+    def _write_journal(self, entry, *args):
+        """ Logs a change of the job queue in the journal, if any, and compacts the journal when needed """
+        if self._journal is None:
+            return
+        getattr(self._journal, entry)(*args)
+        if self._journal.needs_compaction():
+            jobs = [(job[2], job[0], job[1], job[-1]) for job in self._waiting_jobs.values()]
+            jobs += [(job[2], job[0], job[1], job[-1]) for job in self._recovering_jobs.values()]
+            jobs += [(client_addr, job_msg.priority, started_at, job_msg)
+                     for (client_addr, _), (_, job_msg, started_at) in self._job_running.items()]
+            self._journal.compact(jobs, list(self._job_running) + list(self._recovering_jobs))
+
+    def _send_to_agent(self, agent_addr, message):
+        """ Sends a message to an agent. See _send """
+        self._send(self._agent_socket, agent_addr, message)
+
+    def _send_to_client(self, client_addr, message):
+        """ Sends a message to a client. See _send """
+        self._send(self._client_socket, client_addr, message)
+
+    def _send(self, socket, addr, message):
+        """
+        Queues a message to be sent at the next iteration of the event loop. Messages sent to the same peer during
+        the same iteration are sent in order, grouped in batch messages if the peer supports it.
+        """
+        self._outgoing_messages.setdefault((socket, addr), []).append(message)
+        if not self._outgoing_flush_scheduled:
+            self._outgoing_flush_scheduled = True
+            self._loop.call_soon(self._create_safe_task, self._flush_outgoing_messages())
+
+    async def _flush_outgoing_messages(self):
+        """ Sends the messages queued by _send """
+        try:
+            while self._outgoing_messages:
+                outgoing_messages, self._outgoing_messages = self._outgoing_messages, {}
+                for (socket, addr), messages in outgoing_messages.items():
+                    if socket is self._agent_socket:
+                        supports_batches = self._registered_agents.get(addr, {}).get("supports_batches", False)
+                    else:
+                        supports_batches = addr in self._batch_clients
+                    if supports_batches:
+                        messages = _group_in_batches(messages)
+                    for message in messages:
+                        await ZMQUtils.send_with_addr(socket, addr, message)
+        finally:
+            self._outgoing_flush_scheduled = False
+
     def _create_safe_task(self, coroutine):
         """ Calls self._loop.create_task with a safe (== with logged exception) coroutine """
         task = self._loop.create_task(coroutine)
@@ -409,4 +885,79 @@ class Backend(object):
         try:
             return int(job_info.environment_parameters["limits"]["time"])
         except:
-            return -1 # unknown
\ No newline at end of file
+            return -1 # unknown
+
+    def _get_resource_demand(self, job_info: ClientNewJob):
+        """
+            Returns the resources demanded by a job, to be compared with the resources given by the agents.
+            Only the memory limit of the environment (["limits"]["memory"], in MB) is known.
+        """
+        try:
+            return {"memory": int(job_info.environment_parameters.get("limits", {}).get("memory", 200))}
+        except:
+            return {}
+
+
+#: batch message class for each message class that can be batched
+_BATCH_MESSAGES = {BackendNewJob: BackendNewJobBatch, BackendJobDone: BackendJobDoneBatch, BackendQueueDelta: BackendQueueDeltaBatch}
+
+
+def _group_in_batches(messages):
+    """
+    Groups consecutive messages that can be batched together (see _BATCH_MESSAGES), keeping the order of the messages.
+    The messages that carry large payloads are sent alone, so that their payloads are not copied in the batch.
+    """
+    grouped = []
+    for (message_class, batchable), group in itertools.groupby(messages, _batch_key):
+        group = list(group)
+        if len(group) > 1 and batchable:
+            grouped.append(_BATCH_MESSAGES[message_class]([message.dump() for message in group]))
+        else:
+            grouped.extend(group)
+    return grouped
+
+
+def _batch_key(message):
+    batchable = message.__class__ in _BATCH_MESSAGES and not MessageMeta.has_payloads(message, ZMQUtils.PAYLOAD_THRESHOLD)
+    return message.__class__, batchable
+
+
+def run_shard(index, nb_shards, shard_agent_addr, shard_client_addr, log_level=logging.INFO, scheduling_policy="fifo",
+              course_weights=None, journal_dir=None, journal_fsync=False, **backend_kwargs):
+    """
+    Runs a shard of a sharded backend in the current process, until it is interrupted. Meant to be the target of a
+    multiprocessing.Process. See inginious.backend.router.
+
+    Only plain values are given, and the scheduling policy and the journal are created in the process of the shard: the
+    arguments of a spawned process are pickled.
+    :param index: index of the shard
+    :param nb_shards: number of shards
+    :param shard_agent_addr: internal address of the BackendRouter for the messages of the agents
+    :param shard_client_addr: internal address of the BackendRouter for the messages of the clients and of the shards
+    :param log_level: logging level of the shard, if logging is not configured in this process
+    :param scheduling_policy: name of the scheduling policy, see create_scheduling_policy
+    :param course_weights: dict of course weights, for the "fair-course" policy
+    :param journal_dir: directory of the journal of the shard, or None to disable it
+    :param journal_fsync: True to fsync the journal after each change of the job queue
+    :param backend_kwargs: other arguments given to Backend
+    """
+    logger = logging.getLogger("inginious")
+    if not logger.handlers:
+        logger.setLevel(log_level)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    context = Context()
+    journal = BackendJournal(journal_dir, fsync=journal_fsync) if journal_dir else None
+    backend = Backend(context, shard_agent_addr, shard_client_addr, create_scheduling_policy(scheduling_policy, course_weights),
+                      journal=journal, shard=(index, nb_shards), **backend_kwargs)
+    try:
+        loop.run_until_complete(backend.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+        context.destroy(1000)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+
+class FreeSlotIndex:
+    """
+        Keeps track of the free job slots of the agents, indexed by environment, and of their free resources.
+
+        Finding an agent that has a free slot for a given environment is in O(1). Acquiring/releasing a slot is in
+        O(1), except when the agent goes from/to zero free slots, in which case it is in O(m), m being the number
+        of environments of the agent.
+
+        The resources (e.g. {"memory": 1024}) of an agent are shared by its jobs: a job that demands them fits in an
+        agent if the agent has a free slot and enough of each of the resources it gives. The resources that the agent
+        does not give are not limited.
+    """
+
+    def __init__(self):
+        self._free_slots = {}  # agent_addr -> number of free slots
+        self._total_free_slots = 0
+        self._environments = {}  # agent_addr -> list of environments of the agent
+        self._capacities = {}  # agent_addr -> resources of the agent
+        self._free_resources = {}  # agent_addr -> resources of the agent not used by its jobs
+        # environment -> agents that have at least one free slot and this environment.
+        # dicts are used as ordered sets: agents that were freed first are used first.
+        self._by_environment = {}
+
+    def __len__(self):
+        """ Total number of free slots """
+        return self._total_free_slots
+
+    def __contains__(self, agent_addr):
+        return agent_addr in self._free_slots
+
+    def add_agent(self, agent_addr, environments, slots, resources=None):
+        """
+        Registers an agent that has `slots` free slots, able to run jobs for the given environments
+        :param resources: dict of the resources shared by the jobs of the agent, all free. None if they are not limited.
+        """
+        if agent_addr in self._free_slots:
+            self.remove_agent(agent_addr)
+        self._free_slots[agent_addr] = 0
+        self._environments[agent_addr] = list(environments)
+        self._capacities[agent_addr] = dict(resources or {})
+        self._free_resources[agent_addr] = dict(resources or {})
+        for _ in range(slots):
+            self.release(agent_addr)
+
+    def remove_agent(self, agent_addr):
+        """ Removes an agent and all its free slots """
+        free_slots = self._free_slots.pop(agent_addr, 0)
+        self._total_free_slots -= free_slots
+        if free_slots > 0:
+            for environment in self._environments[agent_addr]:
+                self._by_environment[environment].pop(agent_addr, None)
+        self._environments.pop(agent_addr, None)
+        self._capacities.pop(agent_addr, None)
+        self._free_resources.pop(agent_addr, None)
+
+    def environments(self, agent_addr):
+        """ Returns the list of environments of an agent """
+        return self._environments[agent_addr]
+
+    def resources(self, agent_addr):
+        """ Returns the resources of an agent, used or not (an empty dict if they are not limited) """
+        return self._capacities[agent_addr]
+
+    def free_slots(self, agent_addr):
+        """ Returns the number of free slots of an agent (0 if the agent is unknown) """
+        return self._free_slots.get(agent_addr, 0)
+
+    def free_environments(self):
+        """ Returns the list of environments for which at least one agent has a free slot """
+        return [environment for environment, agents in self._by_environment.items() if agents]
+
+    def find_agent(self, environment):
+        """ Returns an agent that has a free slot for the given environment, or None """
+        return next(iter(self._by_environment.get(environment, ())), None)
+
+    def find_agents(self, environment):
+        """ Returns the agents that have a free slot for the given environment, in the order in which they are used """
+        return list(self._by_environment.get(environment, ()))
+
+    def fits(self, agent_addr, demand):
+        """ Returns True if a job demanding the given resources can be run now by the agent """
+        if self._free_slots.get(agent_addr, 0) <= 0:
+            return False
+        free_resources = self._free_resources[agent_addr]
+        return all(demand.get(resource, 0) <= free for resource, free in free_resources.items())
+
+    def could_fit(self, agent_addr, demand):
+        """ Returns True if a job demanding the given resources could be run by the agent, once its jobs are done """
+        return all(demand.get(resource, 0) <= capacity for resource, capacity in self._capacities[agent_addr].items())
+
+    def could_fit_somewhere(self, environment, demand):
+        """
+        Returns True if a job demanding the given resources could be run by one of the agents having the environment.
+        This operation is in O(a), a being the number of agents.
+        """
+        return any(environment in environments and self.could_fit(agent_addr, demand)
+                   for agent_addr, environments in self._environments.items())
+
+    def acquire(self, agent_addr, demand=None):
+        """ Marks a free slot of the given agent, and the resources demanded by the job, as used """
+        if self._free_slots[agent_addr] <= 0:
+            raise ValueError("Agent %s has no free slot" % str(agent_addr))
+        self._free_slots[agent_addr] -= 1
+        self._total_free_slots -= 1
+        if self._free_slots[agent_addr] == 0:
+            for environment in self._environments[agent_addr]:
+                del self._by_environment[environment][agent_addr]
+        free_resources = self._free_resources[agent_addr]
+        for resource in free_resources:
+            free_resources[resource] -= (demand or {}).get(resource, 0)
+
+    def release(self, agent_addr, demand=None):
+        """
+        Marks a slot of the given agent, and the resources demanded by its job, as free. Does nothing if the agent is
+        unknown (it has been removed)
+        """
+        if agent_addr not in self._free_slots:
+            return
+        self._free_slots[agent_addr] += 1
+        self._total_free_slots += 1
+        if self._free_slots[agent_addr] == 1:
+            for environment in self._environments[agent_addr]:
+                self._by_environment.setdefault(environment, {})[agent_addr] = None
+        free_resources = self._free_resources[agent_addr]
+        for resource in free_resources:
+            free_resources[resource] += (demand or {}).get(resource, 0)
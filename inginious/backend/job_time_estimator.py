@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Estimates of the run time of the jobs, learned from the jobs that ran previously, and estimates of the time
+    the waiting jobs will wait before running.
+"""
+
+import heapq
+import math
+
+
+class RunTimeSketch:
+    """
+        Streaming statistics of the run time of the jobs of a task: an exponentially weighted moving average, and
+        a log-scale histogram giving quantiles with a relative error of at most `accuracy`. The histogram counts are
+        halved each time `max_count` jobs are reached, so that old jobs are progressively forgotten.
+    """
+
+    def __init__(self, alpha=0.2, accuracy=0.05, max_count=1000):
+        self._alpha = alpha
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_count = max_count
+        self._buckets = {}  # bucket index -> count
+        self._count = 0
+        self.nb_samples = 0
+        self.mean = 0.0
+
+    def add(self, value):
+        """ Adds the run time of a job, in seconds """
+        self.mean = value if self.nb_samples == 0 else self.mean + self._alpha * (value - self.mean)
+        self.nb_samples += 1
+
+        index = math.ceil(math.log(max(value, 1e-3)) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self._count += 1
+        if self._count >= self._max_count:
+            self._buckets = {index: count // 2 for index, count in self._buckets.items() if count >= 2}
+            self._count = sum(self._buckets.values())
+
+    def quantile(self, q):
+        """ Returns the q-quantile (0 <= q <= 1) of the run times, or None if no job was added """
+        if not self._count:
+            return None
+        rank = q * (self._count - 1)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen > rank:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+
+class JobTimeEstimator:
+    """ Keeps a RunTimeSketch for each task, and estimates from them the run time of the jobs """
+
+    def __init__(self, min_samples=3, high_quantile=0.9):
+        """
+        :param min_samples: number of jobs of a task that must have run before using the sketch of the task
+        :param high_quantile: quantile of the run time used for the jobs that have run longer than usual
+        """
+        self._min_samples = min_samples
+        self._high_quantile = high_quantile
+        self._sketches = {}  # (course_id, task_id) -> RunTimeSketch
+
+    def job_done(self, course_id, task_id, run_time):
+        """ Indicates that a job of a task ran for `run_time` seconds """
+        self._sketches.setdefault((course_id, task_id), RunTimeSketch()).add(run_time)
+
+    def run_time(self, course_id, task_id, default):
+        """ Returns the expected run time of a job of a task, or `default` if the task has not run enough yet """
+        sketch = self._sketches.get((course_id, task_id))
+        if sketch is None or sketch.nb_samples < self._min_samples:
+            return default
+        return sketch.mean
+
+    def remaining_time(self, course_id, task_id, elapsed, default):
+        """
+        Returns the expected remaining run time of a job that has been running for `elapsed` seconds.
+        Jobs that already ran longer than the average are expected to end at the `high_quantile` of the run times.
+        """
+        expected = self.run_time(course_id, task_id, None)
+        if expected is None:
+            return max(0.0, default - elapsed) if default >= 0 else 0.0
+        if elapsed < expected:
+            return expected - elapsed
+        return max(0.0, self._sketches[(course_id, task_id)].quantile(self._high_quantile) - elapsed)
+
+
+def estimate_waiting_times(agents, waiting_jobs):
+    """
+    Simulates the dispatch of the waiting jobs on the slots of the agents, to estimate the time before each job starts.
+    :param agents: a list of tuples (environments, slots_available_in), where slots_available_in is the list of the
+                   times (in seconds from now) after which each slot of the agent is available, 0 for free slots
+    :param waiting_jobs: a list of tuples (environment, expected_run_time), in the order in which the jobs will be run
+    :return: a list with the estimated waiting time of each job, or -1 if no agent can run the job
+    """
+    slots = [list(slots_available_in) for _, slots_available_in in agents]
+    for agent_slots in slots:
+        heapq.heapify(agent_slots)
+
+    agents_by_environment = {}
+    for agent_idx, (environments, _) in enumerate(agents):
+        for environment in environments:
+            if slots[agent_idx]:
+                agents_by_environment.setdefault(environment, []).append(agent_idx)
+
+    waiting_times = []
+    for environment, run_time in waiting_jobs:
+        candidates = agents_by_environment.get(environment)
+        if not candidates:
+            waiting_times.append(-1)
+            continue
+        agent_slots = min((slots[agent_idx] for agent_idx in candidates), key=lambda agent_slots: agent_slots[0])
+        start = agent_slots[0]
+        heapq.heapreplace(agent_slots, start + max(run_time, 0))
+        waiting_times.append(start)
+    return waiting_times
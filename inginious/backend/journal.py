@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Journal of the job queue of the backend, allowing a restarted backend to recover its waiting and running jobs.
+
+    The journal is a directory containing two files, both made of a sequence of msgpack-encoded entries:
+
+    - ``snapshot``: the state of the queue at the last compaction
+    - ``journal``: the changes of the queue since the last compaction
+
+    Entries are in the form ("queued", client_addr, job_id, priority, insert_time, dumped ClientNewJob),
+    ("started", client_addr, job_id) or ("ended", client_addr, job_id).
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+import msgpack
+
+from inginious.common.message_meta import MessageMeta
+
+
+class BackendJournal:
+    """ Append-only journal of the job queue of the backend, with periodic compaction into a snapshot """
+
+    def __init__(self, directory, compact_every=10000, fsync=False):
+        """
+        :param directory: directory in which the journal is stored. Created if needed.
+        :param compact_every: number of entries appended to the journal before it is compacted into a new snapshot
+        :param fsync: whether to fsync the journal after each entry. Without it, the journal survives a crash of the
+                      backend, but not a crash of the machine.
+        """
+        self._logger = logging.getLogger("inginious.backend.journal")
+        self._directory = directory
+        self._journal_path = os.path.join(directory, "journal")
+        self._snapshot_path = os.path.join(directory, "snapshot")
+        self._compact_every = compact_every
+        self._fsync = fsync
+        self._journal_file = None
+        self._nb_entries = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """
+        Replays the snapshot and the journal, and opens the journal for appending.
+        :return: a tuple (jobs, running) where jobs is an OrderedDict {(client_addr, job_id): (priority, insert_time, ClientNewJob)}
+                 of the jobs that did not end, in the order in which they were queued, and running the set of the keys
+                 of the jobs that were sent to an agent.
+        """
+        jobs = OrderedDict()
+        running = set()
+        self._replay(self._snapshot_path, jobs, running)
+        self._nb_entries, valid_size = self._replay(self._journal_path, jobs, running)
+        self._journal_file = open(self._journal_path, "ab")
+        self._journal_file.truncate(valid_size)  # removes a partially written entry, if any
+        return OrderedDict((key, (priority, insert_time, MessageMeta.load(message)))
+                           for key, (priority, insert_time, message) in jobs.items()), running
+
+    def job_queued(self, client_addr, priority, insert_time, message):
+        """ Logs a new job """
+        self._append(("queued", client_addr, message.job_id, priority, insert_time, message.dump()))
+
+    def job_started(self, client_addr, job_id):
+        """ Logs that a job was sent to an agent """
+        self._append(("started", client_addr, job_id))
+
+    def job_ended(self, client_addr, job_id):
+        """ Logs that a job ended, or was killed """
+        self._append(("ended", client_addr, job_id))
+
+    def needs_compaction(self):
+        """ Returns True if the journal should be compacted (see compact) """
+        return self._nb_entries >= self._compact_every
+
+    def compact(self, jobs, running):
+        """
+        Writes a new snapshot of the queue, and empties the journal
+        :param jobs: an iterable of (client_addr, priority, insert_time, ClientNewJob) of the jobs that did not end
+        :param running: an iterable of the (client_addr, job_id) of the running jobs
+        """
+        tmp_path = self._snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as snapshot_file:
+            for client_addr, priority, insert_time, message in jobs:
+                snapshot_file.write(msgpack.dumps(("queued", client_addr, message.job_id, priority, insert_time, message.dump()),
+                                                  use_bin_type=True))
+            for client_addr, job_id in running:
+                snapshot_file.write(msgpack.dumps(("started", client_addr, job_id), use_bin_type=True))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+
+        # Replaying the old journal over the new snapshot gives the same state, so a crash here is harmless
+        self._journal_file.close()
+        self._journal_file = open(self._journal_path, "wb")
+        self._nb_entries = 0
+
+    def close(self):
+        """ Closes the journal """
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _append(self, entry):
+        self._journal_file.write(msgpack.dumps(entry, use_bin_type=True))
+        self._journal_file.flush()
+        if self._fsync:
+            os.fsync(self._journal_file.fileno())
+        self._nb_entries += 1
+
+    def _replay(self, path, jobs, running):
+        """
+        Applies the entries of a file to jobs and running.
+        :return: a tuple (number of entries read, size of the valid part of the file)
+        """
+        if not os.path.exists(path):
+            return 0, 0
+        nb_entries = 0
+        valid_size = 0
+        with open(path, "rb") as journal_file:
+            unpacker = msgpack.Unpacker(journal_file, raw=False, use_list=False)
+            try:
+                for entry in unpacker:
+                    key = (entry[1], entry[2])
+                    if entry[0] == "queued":
+                        jobs.setdefault(key, entry[3:])
+                    elif entry[0] == "started":
+                        if key in jobs:
+                            running.add(key)
+                    elif entry[0] == "ended":
+                        jobs.pop(key, None)
+                        running.discard(key)
+                    nb_entries += 1
+                    valid_size = unpacker.tell()
+            except (ValueError, IndexError, msgpack.UnpackException):
+                pass  # see below
+        if valid_size < os.path.getsize(path):
+            self._logger.warning("Ignoring a partially written entry at the end of %s", path)
+        return nb_entries, valid_size
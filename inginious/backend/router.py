@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Front router of a sharded backend.
+
+    A sharded backend is made of a BackendRouter, bound to the addresses to which the agents and the clients connect,
+    and of several Backend shards, usually running in their own process, that connect to the router. Each shard
+    owns a subset of the agents and of the jobs:
+
+    - each agent is assigned to the shard that has the fewest agents when it connects;
+    - each job is assigned to a shard by hashing the address of the client and the id of the job (see job_shard);
+    - a shard that has free agent slots asks the other shards for jobs (BackendShardStealJobs), and the shards
+      that have waiting jobs that none of their agents can run give them to it (BackendShardGiveJobs).
+
+    The router does not decode the messages of the agents, and only peeks at the type of the messages of the clients.
+    It merges the answers of the shards that describe the whole backend: the environments, the known jobs and the
+    job queue.
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+
+import zmq
+from zmq.asyncio import Poller
+
+from inginious.common.message_meta import MessageMeta
+from inginious.common.messages import ClientHello, ClientNewJob, ClientGetQueue, ClientSubscribeQueue, Ping, Pong, \
+    BackendUpdateEnvironments, BackendKnownJobs, BackendGetQueue, BackendQueueSnapshot, BackendQueueDelta, \
+    BackendQueueDeltaBatch, BackendQueueWaitTimes
+
+
+def shard_identity(index):
+    """ Identity of the sockets of a shard, connected to the router """
+    return b"shard-%i" % index
+
+
+def shard_addr(index):
+    """
+    Address used by the shards to send messages to each other through the router. Identities starting with a zero byte
+    are reserved by ZeroMQ, and the ones it generates are 5 bytes long, so that it cannot be the address of a client.
+    """
+    return b"\x00\x00shard-%i" % index
+
+
+def job_shard(client_addr, job_id, nb_shards):
+    """ Returns the index of the shard to which a new job is sent """
+    return zlib.crc32(client_addr + job_id.encode()) % nb_shards
+
+
+def _waiting_order(job):
+    """ Sort key of the waiting jobs of several shards: by estimated waiting time, unknown ones last """
+    return job[6] if job[6] >= 0 else float("inf")
+
+
+class QueueSubscription(object):
+    """
+        Merges the job queue messages sent by the shards to a subscriber of the job queue (see ClientSubscribeQueue):
+        the snapshots of all the shards are merged in a single snapshot, and the messages are renumbered.
+    """
+
+    def __init__(self, nb_shards):
+        self._snapshots = [None] * nb_shards
+        self._pending = []  # messages received from the shards whose snapshot was received, while waiting for the others
+        self._synchronized = False
+        self._sequence = 0
+
+    def add(self, shard, message):
+        """
+        Handles a message of a shard
+        :return: the list of the messages to send to the subscriber
+        """
+        if isinstance(message, BackendQueueSnapshot):
+            self._snapshots[shard] = message
+            if self._synchronized or None in self._snapshots:
+                return []
+            self._synchronized = True
+            jobs_running = [job for snapshot in self._snapshots for job in snapshot.jobs_running]
+            jobs_waiting = sorted((job for snapshot in self._snapshots for job in snapshot.jobs_waiting), key=_waiting_order)
+            messages = [self._renumber(BackendQueueSnapshot(0, jobs_running, jobs_waiting))]
+            messages += [self._renumber(pending) for pending in self._pending]
+            self._pending = []
+            return messages
+
+        if isinstance(message, BackendQueueDeltaBatch):
+            messages = [MessageMeta.load(dumped) for dumped in message.messages]
+        else:
+            messages = [message]
+        if not self._synchronized:
+            # The messages sent before the snapshot of the shard belong to a previous subscription
+            if self._snapshots[shard] is not None:
+                self._pending += messages
+            return []
+        return [self._renumber(message) for message in messages]
+
+    def _renumber(self, message):
+        """ Returns a copy of a message with the next sequence number """
+        sequence = self._sequence
+        self._sequence += 1
+        if isinstance(message, BackendQueueSnapshot):
+            return BackendQueueSnapshot(sequence, message.jobs_running, message.jobs_waiting)
+        if isinstance(message, BackendQueueDelta):
+            return BackendQueueDelta(sequence, message.event, message.job)
+        return BackendQueueWaitTimes(sequence, message.wait_times)
+
+
+class BackendRouter(object):
+    """
+        Front router of a sharded backend. Forwards the messages of the agents and of the clients to the shards.
+    """
+
+    def __init__(self, context, agent_addr, client_addr, shard_agent_addr, shard_client_addr, nb_shards):
+        """
+        :param context: ZeroMQ context for this process
+        :param agent_addr: address to which the agents will connect
+        :param client_addr: address to which the clients will connect
+        :param shard_agent_addr: address to which the shards will connect to exchange messages with the agents
+        :param shard_client_addr: address to which the shards will connect to exchange messages with the clients and
+                                  the other shards
+        :param nb_shards: number of shards. Shards are Backend instances created with shard=(index, nb_shards).
+        """
+        self._loop = asyncio.get_event_loop()
+        self._logger = logging.getLogger("inginious.backend.router")
+        self._agent_addr = agent_addr
+        self._client_addr = client_addr
+        self._shard_agent_addr = shard_agent_addr
+        self._shard_client_addr = shard_client_addr
+        self._nb_shards = nb_shards
+
+        self._agent_socket = context.socket(zmq.ROUTER)
+        self._client_socket = context.socket(zmq.ROUTER)
+        self._shard_agent_socket = context.socket(zmq.ROUTER)
+        self._shard_client_socket = context.socket(zmq.ROUTER)
+        self._agent_socket.ipv6 = True
+        self._client_socket.ipv6 = True
+        self._client_socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
+
+        self._shard_identities = [shard_identity(index) for index in range(nb_shards)]
+        self._shard_addrs = {shard_addr(index): index for index in range(nb_shards)}
+        self._shard_indexes = {identity: index for index, identity in enumerate(self._shard_identities)}
+
+        # shard of each agent, and last time a message was received from it
+        self._agent_shards = {}
+        self._agent_last_seen = {}
+        self._agent_timeout = 60
+
+        # environments available on each shard, as sent in BackendUpdateEnvironments
+        self._environments = [{} for _ in range(nb_shards)]
+
+        # answers of the shards, merged when all the shards answered. format: {client_addr: [nb answers, merged content]}
+        self._known_jobs = {}
+        self._queues = {}
+
+        # subscribers of the job queue. format: {client_addr: QueueSubscription}
+        self._queue_subscribers = {}
+
+        self._pong = Pong().dump()
+
+        # maximum number of messages read from a socket before giving the hand to the other sockets
+        self._max_messages_per_poll = 64
+
+    async def run(self):
+        """ Runs the router. Waits for all the shards to connect before accepting agents and clients. """
+        self._shard_agent_socket.bind(self._shard_agent_addr)
+        self._shard_client_socket.bind(self._shard_client_addr)
+        await self._wait_for_shards()
+        self._agent_socket.bind(self._agent_addr)
+        self._client_socket.bind(self._client_addr)
+        self._logger.info("Backend router started with %i shards", self._nb_shards)
+
+        # socket -> (handler, number of frames before the payloads of the messages)
+        handlers = {self._agent_socket: (self._handle_agent_frames, 2),
+                    self._client_socket: (self._handle_client_frames, 2),
+                    self._shard_agent_socket: (self._handle_shard_agent_frames, 3),
+                    self._shard_client_socket: (self._handle_shard_client_frames, 3)}
+        poller = Poller()
+        for socket in handlers:
+            poller.register(socket, zmq.POLLIN)
+
+        try:
+            while True:
+                for socket, _ in await poller.poll():
+                    for _ in range(self._max_messages_per_poll):
+                        handler, nb_header_frames = handlers[socket]
+                        # The payloads (see ZMQUtils) are kept in their frames, to be forwarded without copy
+                        frames = await socket.recv_multipart(copy=False)
+                        await handler([frame.bytes for frame in frames[:nb_header_frames]] + frames[nb_header_frames:])
+                        if not socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                            break
+        except asyncio.CancelledError:
+            return
+        except KeyboardInterrupt:
+            return
+
+    async def _wait_for_shards(self):
+        """ Waits for the shards to say they are ready on both their sockets. See Backend.run """
+        ready = {self._shard_agent_socket: set(), self._shard_client_socket: set()}
+        poller = Poller()
+        for socket in ready:
+            poller.register(socket, zmq.POLLIN)
+        while any(len(shards) < self._nb_shards for shards in ready.values()):
+            for socket, _ in await poller.poll():
+                frames = await socket.recv_multipart()
+                if frames[0] in self._shard_indexes and frames[1] == b"":
+                    ready[socket].add(frames[0])
+        self._logger.info("All the shards are connected")
+
+    async def _handle_agent_frames(self, frames):
+        """ Forwards a message of an agent to its shard """
+        agent_addr = frames[0]
+        shard = self._agent_shards.get(agent_addr)
+        if shard is None:
+            shard = self._assign_agent(agent_addr)
+        self._agent_last_seen[agent_addr] = time.time()
+        await self._shard_agent_socket.send_multipart([self._shard_identities[shard]] + frames, copy=len(frames) <= 2)
+
+    def _assign_agent(self, agent_addr):
+        """ Assigns a new agent to the shard that has the fewest agents. Forgets the agents that disappeared. """
+        now = time.time()
+        nb_agents = [0] * self._nb_shards
+        for other_addr, last_seen in list(self._agent_last_seen.items()):
+            if last_seen < now - self._agent_timeout:
+                del self._agent_last_seen[other_addr]
+                del self._agent_shards[other_addr]
+            else:
+                nb_agents[self._agent_shards[other_addr]] += 1
+        shard = nb_agents.index(min(nb_agents))
+        self._logger.info("Agent %s is assigned to shard %i", agent_addr, shard)
+        self._agent_shards[agent_addr] = shard
+        return shard
+
+    async def _handle_shard_agent_frames(self, frames):
+        """ Forwards a message of a shard to an agent """
+        if frames[1] != b"":  # else, a shard saying it is ready again
+            await self._agent_socket.send_multipart(frames[1:], copy=len(frames) <= 3)
+
+    async def _handle_client_frames(self, frames):
+        """ Forwards a message of a client to the shards concerned """
+        client_addr, payload, *payloads = frames
+        fields = MessageMeta.peek(payload, ("type", "job_id"))
+        msgtype = fields.get("type")
+
+        if msgtype == Ping.__msgtype__:  # pylint: disable=no-member
+            await self._client_socket.send_multipart([client_addr, self._pong])
+            return
+        if msgtype == ClientNewJob.__msgtype__:  # pylint: disable=no-member
+            await self._send_to_shard(job_shard(client_addr, fields["job_id"], self._nb_shards), client_addr, payload, payloads)
+            return
+
+        if msgtype == ClientHello.__msgtype__:  # pylint: disable=no-member
+            self._known_jobs[client_addr] = [0, []]
+            self._queue_subscribers.pop(client_addr, None)
+        elif msgtype == ClientGetQueue.__msgtype__:  # pylint: disable=no-member
+            if client_addr in self._queues:
+                return  # the answer to the previous request will do
+            self._queues[client_addr] = [0, [], []]
+        elif msgtype == ClientSubscribeQueue.__msgtype__:  # pylint: disable=no-member
+            self._queue_subscribers[client_addr] = QueueSubscription(self._nb_shards)
+        # Other messages (e.g. ClientKillJob) concern a job that may have been given to any shard
+        for shard in range(self._nb_shards):
+            await self._send_to_shard(shard, client_addr, payload)
+
+    async def _send_to_shard(self, shard, addr, payload, payloads=()):
+        await self._shard_client_socket.send_multipart([self._shard_identities[shard], addr, payload, *payloads],
+                                                       copy=not payloads)
+
+    async def _handle_shard_client_frames(self, frames):
+        """ Forwards a message of a shard to a client or to another shard """
+        identity, addr, payload, *payloads = frames
+        shard = self._shard_indexes[identity]
+        if addr == b"":  # a shard saying it is ready again
+            return
+        if addr in self._shard_addrs:
+            await self._send_to_shard(self._shard_addrs[addr], shard_addr(shard), payload, payloads)
+            return
+
+        msgtype = MessageMeta.peek(payload).get("type")
+        if msgtype == BackendUpdateEnvironments.__msgtype__:  # pylint: disable=no-member
+            self._environments[shard] = MessageMeta.load(payload).available_environments
+            environments = {}
+            for shard_environments in self._environments:
+                environments.update(shard_environments)
+            await self._send_to_client(addr, BackendUpdateEnvironments(environments))
+        elif msgtype == BackendKnownJobs.__msgtype__ and addr in self._known_jobs:  # pylint: disable=no-member
+            answers = self._known_jobs[addr]
+            answers[0] += 1
+            answers[1] += MessageMeta.load(payload).job_ids
+            if answers[0] == self._nb_shards:
+                del self._known_jobs[addr]
+                await self._send_to_client(addr, BackendKnownJobs(answers[1]))
+        elif msgtype == BackendGetQueue.__msgtype__ and addr in self._queues:  # pylint: disable=no-member
+            answers = self._queues[addr]
+            message = MessageMeta.load(payload)
+            answers[0] += 1
+            answers[1] += message.jobs_running
+            answers[2] += message.jobs_waiting
+            if answers[0] == self._nb_shards:
+                del self._queues[addr]
+                await self._send_to_client(addr, BackendGetQueue(answers[1], sorted(answers[2], key=_waiting_order)))
+        elif msgtype in _QUEUE_MESSAGES:
+            if addr in self._queue_subscribers:
+                for message in self._queue_subscribers[addr].add(shard, MessageMeta.load(payload)):
+                    await self._send_to_client(addr, message)
+        else:
+            await self._client_socket.send_multipart([addr, payload, *payloads], copy=not payloads)
+
+    async def _send_to_client(self, client_addr, message):
+        await self._client_socket.send_multipart([client_addr, message.dump()])
+
+
+#: msgtype of the messages sent to the subscribers of the job queue
+_QUEUE_MESSAGES = {message_class.__msgtype__ for message_class in  # pylint: disable=no-member
+                   (BackendQueueSnapshot, BackendQueueDelta, BackendQueueDeltaBatch, BackendQueueWaitTimes)}
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Scheduling policies of the backend, i.e. the order in which waiting jobs are given to the agents.
+
+    All the policies are TopicPriorityQueues whose topics are environments and whose items are the jobs of the backend,
+    in the form (priority, insert_time, client_addr, client_job_id, ClientNewJob). The priority of a job always comes
+    first: the policies only change the order of the jobs that have the same priority.
+"""
+
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+
+
+class FIFOPolicy(TopicPriorityQueue):
+    """ Jobs are run by order of arrival """
+
+    def _order(self, item):
+        priority, insert_time = item[0], item[1]
+        return priority, insert_time
+
+
+class FairSharePolicy(TopicPriorityQueue):
+    """
+        Shares the agents between flows of jobs (defined by _flow()), using start-time fair queueing.
+
+        Each job receives a start tag when it is queued: the maximum between the virtual time (the start tag of the last
+        job sent to an agent) and the finish tag of the previous job of the same flow. The finish tag of a job is its
+        start tag plus 1/weight of its flow. Jobs are run by increasing start tag; a flow that submits a large
+        number of jobs thus only delays the jobs of the other flows by (at most) one job per flow.
+    """
+
+    def __init__(self, weights=None, default_weight=1.0):
+        """
+        :param weights: dict of weights by flow. A flow with a weight of 2 receives twice as much agents as a flow
+                        with a weight of 1.
+        :param default_weight: weight of the flows that are not in `weights`
+        """
+        super().__init__()
+        self._weights = weights or {}
+        self._default_weight = default_weight
+        self._virtual_time = 0.0
+        self._flows = {}  # flow -> [finish tag of the last job, number of waiting jobs]
+
+    def _flow(self, item):
+        """ Returns the flow to which a job belongs """
+        raise NotImplementedError()
+
+    def _order(self, item):
+        flow = self._flow(item)
+        finish_tag, nb_waiting = self._flows.get(flow, (0.0, 0))
+        start_tag = max(self._virtual_time, finish_tag)
+        finish_tag = start_tag + 1.0 / self._weights.get(flow, self._default_weight)
+        self._flows[flow] = [finish_tag, nb_waiting + 1]
+        priority, insert_time = item[0], item[1]
+        return priority, start_tag, insert_time
+
+    def _on_get(self, order, item):
+        self._virtual_time = max(self._virtual_time, order[1])
+        self._job_left(item)
+
+    def _on_remove(self, order, item):
+        flow = self._flow(item)
+        # If this is the last job queued by the flow, give its share back
+        if self._flows[flow][0] == order[1] + 1.0 / self._weights.get(flow, self._default_weight):
+            self._flows[flow][0] = order[1]
+        self._job_left(item)
+
+    def _job_left(self, item):
+        """ Forgets about idle flows, once they cannot be in advance on the virtual time anymore """
+        flow = self._flow(item)
+        flow_info = self._flows[flow]
+        flow_info[1] -= 1
+        if flow_info[1] == 0 and flow_info[0] <= self._virtual_time:
+            del self._flows[flow]
+
+
+class CourseFairSharePolicy(FairSharePolicy):
+    """ Weighted fair share of the agents between the courses """
+
+    def _flow(self, item):
+        return item[-1].course_id
+
+
+class UserRoundRobinPolicy(FairSharePolicy):
+    """ Round-robin between the users (as given by the @username field of the input) """
+
+    def _flow(self, item):
+        try:
+            return item[-1].inputdata.get("@username")
+        except AttributeError:
+            return None
+
+
+#: Available policies, by name
+SCHEDULING_POLICIES = {
+    "fifo": FIFOPolicy,
+    "fair-course": CourseFairSharePolicy,
+    "round-robin-user": UserRoundRobinPolicy
+}
+
+
+def create_scheduling_policy(name, course_weights=None):
+    """
+    Creates a scheduling policy
+    :param name: name of the policy, one of the keys of SCHEDULING_POLICIES
+    :param course_weights: dict of course weights, for the "fair-course" policy
+    :return: a TopicPriorityQueue
+    """
+    if name not in SCHEDULING_POLICIES:
+        raise ValueError("Unknown scheduling policy %s" % name)
+    if name == "fair-course":
+        return CourseFairSharePolicy(course_weights)
+    return SCHEDULING_POLICIES[name]()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from inginious.backend.backend import _group_in_batches
+from inginious.common.message_meta import MessageMeta
+from inginious.common.messages import BackendJobDone, BackendJobStarted, BackendJobDoneBatch, Ping
+
+
+class TestGroupInBatches(object):
+    def _job_done(self, job_id):
+        return BackendJobDone(job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", "")
+
+    def test_single_message_not_batched(self):
+        grouped = _group_in_batches([self._job_done("1")])
+        assert len(grouped) == 1 and isinstance(grouped[0], BackendJobDone)
+
+    def test_order_is_kept(self):
+        messages = [BackendJobStarted("1"), self._job_done("1"), self._job_done("2"), Ping(), self._job_done("3")]
+        grouped = _group_in_batches(messages)
+        assert [x.__class__ for x in grouped] == [BackendJobStarted, BackendJobDoneBatch, Ping, BackendJobDone]
+        assert [MessageMeta.load(x).job_id for x in grouped[1].messages] == ["1", "2"]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import random
+
+from inginious.backend.job_time_estimator import RunTimeSketch, JobTimeEstimator, estimate_waiting_times
+
+
+class TestRunTimeSketch(object):
+    def test_quantiles(self):
+        sketch = RunTimeSketch(accuracy=0.01)
+        rand = random.Random(0)
+        values = sorted(rand.uniform(1, 100) for _ in range(500))
+        for value in values:
+            sketch.add(value)
+        for q in (0.1, 0.5, 0.9):
+            assert abs(sketch.quantile(q) - values[int(q * 499)]) / values[int(q * 499)] < 0.05
+
+    def test_mean_follows_changes(self):
+        sketch = RunTimeSketch()
+        for _ in range(50):
+            sketch.add(10.0)
+        assert abs(sketch.mean - 10.0) < 1e-9
+        for _ in range(50):
+            sketch.add(2.0)
+        assert abs(sketch.mean - 2.0) < 0.01
+
+    def test_forgets_old_values(self):
+        sketch = RunTimeSketch(max_count=100)
+        for _ in range(1000):
+            sketch.add(100.0)
+        for _ in range(1000):
+            sketch.add(1.0)
+        assert sketch.quantile(0.9) < 1.1
+        assert RunTimeSketch().quantile(0.5) is None
+
+
+class TestJobTimeEstimator(object):
+    def test_estimates(self):
+        estimator = JobTimeEstimator(min_samples=3)
+        assert estimator.run_time("course", "task", 30) == 30
+        assert estimator.remaining_time("course", "task", 10, 30) == 20
+        assert estimator.remaining_time("course", "task", 10, -1) == 0
+
+        for run_time in (1.0, 2.0, 3.0, 4.0, 10.0):
+            estimator.job_done("course", "task", run_time)
+        expected = estimator.run_time("course", "task", 30)
+        assert 1.0 < expected < 10.0
+        assert estimator.run_time("course", "other", 30) == 30
+        assert abs(estimator.remaining_time("course", "task", 1.0, 30) - (expected - 1.0)) < 1e-9
+        # Jobs that run longer than usual are expected to end at the high quantile
+        assert 0 < estimator.remaining_time("course", "task", expected + 0.1, 30) < 10.0
+
+
+class TestEstimateWaitingTimes(object):
+    def test_simulation(self):
+        agents = [(["env1"], [0.0, 5.0]), (["env1", "env2"], [2.0])]
+        jobs = [("env1", 10.0), ("env1", 10.0), ("env2", 1.0), ("env1", 10.0), ("env3", 1.0)]
+        assert estimate_waiting_times(agents, jobs) == [0.0, 2.0, 12.0, 5.0, -1]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import os
+import tempfile
+
+from inginious.backend.journal import BackendJournal
+from inginious.common.messages import ClientNewJob
+
+
+def new_job(job_id):
+    return ClientNewJob(job_id, 0, "course", "task", {"input": job_id}, "default", {}, False, "test")
+
+
+class TestBackendJournal(object):
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = BackendJournal(directory)
+            assert journal.load() == ({}, set())
+            for job_id in ("1", "2", "3"):
+                journal.job_queued(b"client", 0, 10.0, new_job(job_id))
+            journal.job_started(b"client", "1")
+            journal.job_started(b"client", "2")
+            journal.job_ended(b"client", "2")
+            journal.close()
+
+            jobs, running = BackendJournal(directory).load()
+            assert list(jobs) == [(b"client", "1"), (b"client", "3")]
+            assert jobs[(b"client", "3")][:2] == (0, 10.0)
+            assert jobs[(b"client", "3")][2].inputdata == {"input": "3"}
+            assert running == {(b"client", "1")}
+
+    def test_partial_entry(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = BackendJournal(directory)
+            journal.load()
+            journal.job_queued(b"client", 0, 10.0, new_job("1"))
+            journal.job_queued(b"client", 0, 10.0, new_job("2"))
+            journal.close()
+
+            # Simulates a crash while writing the second entry
+            path = os.path.join(directory, "journal")
+            with open(path, "r+b") as journal_file:
+                journal_file.truncate(os.path.getsize(path) - 5)
+
+            journal = BackendJournal(directory)
+            jobs, _ = journal.load()
+            assert list(jobs) == [(b"client", "1")]
+            journal.job_queued(b"client", 0, 10.0, new_job("3"))
+            journal.close()
+
+            jobs, _ = BackendJournal(directory).load()
+            assert list(jobs) == [(b"client", "1"), (b"client", "3")]
+
+    def test_compaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = BackendJournal(directory, compact_every=4)
+            journal.load()
+            for job_id in ("1", "2", "3"):
+                journal.job_queued(b"client", 0, 10.0, new_job(job_id))
+            assert not journal.needs_compaction()
+            journal.job_started(b"client", "1")
+            assert journal.needs_compaction()
+            journal.compact([(b"client", 0, 10.0, new_job("1")), (b"client", 0, 10.0, new_job("2")),
+                             (b"client", 0, 10.0, new_job("3"))], [(b"client", "1")])
+            assert not journal.needs_compaction()
+            assert os.path.getsize(os.path.join(directory, "journal")) == 0
+            journal.job_ended(b"client", "2")
+            journal.close()
+
+            jobs, running = BackendJournal(directory).load()
+            assert list(jobs) == [(b"client", "1"), (b"client", "3")]
+            assert running == {(b"client", "1")}
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from inginious.backend.router import QueueSubscription, job_shard
+from inginious.common.message_meta import MessageMeta
+from inginious.common.messages import BackendQueueSnapshot, BackendQueueDelta, BackendQueueDeltaBatch, BackendQueueWaitTimes, \
+    ClientNewJob
+
+
+class TestJobShard(object):
+    def test_spread(self):
+        shards = [job_shard(b"client", str(i), 4) for i in range(1000)]
+        assert all(shards.count(shard) > 150 for shard in range(4))
+        assert shards == [job_shard(b"client", str(i), 4) for i in range(1000)]
+
+    def test_peek_job_id(self):
+        message = ClientNewJob("42", 0, "course", "task", {"input": b"x" * 1000}, "default", {}, False, "test")
+        assert MessageMeta.peek(message.dump(), ("type", "job_id")) == {"type": "client_new_job", "job_id": "42"}
+
+
+class TestQueueSubscription(object):
+    def _waiting(self, job_id, wait_time):
+        return (job_id, True, "course/task", "test", -1, -1, wait_time)
+
+    def test_merge_snapshots(self):
+        subscription = QueueSubscription(2)
+        assert subscription.add(0, BackendQueueSnapshot(0, [], [self._waiting("a", 10), self._waiting("b", -1)])) == []
+        # sent after the snapshot of shard 0: kept until all the shards sent their snapshot
+        assert subscription.add(0, BackendQueueDelta(1, "queued", self._waiting("c", -1))) == []
+        # sent before the snapshot of shard 1: belongs to a previous subscription
+        assert subscription.add(1, BackendQueueWaitTimes(5, {"d": 3})) == []
+
+        messages = subscription.add(1, BackendQueueSnapshot(0, [], [self._waiting("d", 5)]))
+        assert [message.sequence for message in messages] == [0, 1]
+        assert [job[0] for job in messages[0].jobs_waiting] == ["d", "a", "b"]
+        assert messages[1].job[0] == "c"
+
+    def test_renumber(self):
+        subscription = QueueSubscription(1)
+        subscription.add(0, BackendQueueSnapshot(7, [], []))
+        batch = BackendQueueDeltaBatch([BackendQueueDelta(8, "done", ("a", True)).dump(),
+                                        BackendQueueDelta(9, "done", ("b", True)).dump()])
+        messages = subscription.add(0, batch) + subscription.add(0, BackendQueueWaitTimes(10, {}))
+        assert [message.sequence for message in messages] == [1, 2, 3]
+        assert [message.__class__ for message in messages] == [BackendQueueDelta, BackendQueueDelta, BackendQueueWaitTimes]
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import asyncio
+import queue
+
+from zmq.asyncio import Context
+
+from inginious.backend.agent_locality import AgentLocality
+from inginious.backend.backend import Backend
+from inginious.backend.free_slot_index import FreeSlotIndex
+from inginious.backend.scheduling_policies import FIFOPolicy, CourseFairSharePolicy, UserRoundRobinPolicy
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+from inginious.common.messages import AgentHello, ClientNewJob
+
+
+class TestTopicPriorityQueue(object):
+    def test_get_by_topics(self):
+        pq = TopicPriorityQueue()
+        pq.put("a", 1, (2, "a2"))
+        pq.put("b", 2, (1, "b1"))
+        pq.put("a", 3, (0, "a0"))
+        assert pq.get(["b"]) == (1, "b1")
+        assert pq.get(["a", "b"]) == (0, "a0")
+        assert pq.get() == (2, "a2")
+        assert pq.empty()
+
+    def test_get_empty_topic(self):
+        pq = TopicPriorityQueue()
+        pq.put("a", 1, (0, "a0"))
+        try:
+            pq.get(["b"])
+            assert False
+        except queue.Empty:
+            pass
+        assert pq.empty(["b"]) and not pq.empty(["a"])
+
+    def test_lazy_removal(self):
+        pq = TopicPriorityQueue()
+        for i in range(10):
+            pq.put("a", i, (i,))
+        assert pq.remove(0) == (0,)
+        assert pq.remove(5) == (5,)
+        assert len(pq) == 8 and 0 not in pq and 1 in pq
+        assert [pq.get(["a"])[0] for _ in range(8)] == [1, 2, 3, 4, 6, 7, 8, 9]
+        assert pq.empty(["a"])
+
+    def test_items(self):
+        pq = TopicPriorityQueue()
+        pq.put("a", 1, (2, "a2"))
+        pq.put("b", 2, (1, "b1"))
+        pq.put("a", 3, (0, "a0"))
+        pq.remove(2)
+        assert pq.items() == [("a", (0, "a0")), ("a", (2, "a2"))]
+
+    def test_skip(self):
+        pq = TopicPriorityQueue()
+        for i in range(6):
+            pq.put("a" if i % 2 else "b", i, (i,))
+        odd = lambda item: item[0] % 2 == 1
+        assert pq.peek(skip=odd) == (0,)
+        assert pq.get(skip=odd) == (0,)
+        try:
+            pq.get(["a"], skip=odd, max_skipped=2)
+            assert False
+        except queue.Empty:
+            pass
+        assert pq.get(["a"], skip=lambda item: item[0] == 1) == (3,)  # (1,) stays before it in its heap
+        assert len(pq) == 4 and 3 not in pq
+        assert [pq.get()[0] for _ in range(4)] == [1, 2, 4, 5]
+        assert pq.empty()
+
+
+class TestFreeSlotIndex(object):
+    def test_acquire_release(self):
+        index = FreeSlotIndex()
+        index.add_agent(b"agent1", ["default", "python"], 2)
+        index.add_agent(b"agent2", ["default"], 1)
+        assert len(index) == 3
+        assert index.find_agent("python") == b"agent1"
+        index.acquire(b"agent1")
+        index.acquire(b"agent1")
+        assert index.find_agent("python") is None
+        assert index.find_agent("default") == b"agent2"
+        index.release(b"agent1")
+        assert index.find_agent("python") == b"agent1"
+        assert len(index) == 2
+        assert sorted(index.free_environments()) == ["default", "python"]
+
+    def test_remove_agent(self):
+        index = FreeSlotIndex()
+        index.add_agent(b"agent1", ["default"], 4)
+        index.remove_agent(b"agent1")
+        assert len(index) == 0
+        assert index.find_agent("default") is None
+        index.release(b"agent1")  # a job that finishes on a removed agent
+        assert index.free_slots(b"agent1") == 0
+
+    def test_resources(self):
+        index = FreeSlotIndex()
+        index.add_agent(b"small", ["default"], 4, {"memory": 1000})
+        index.add_agent(b"large", ["default"], 4, {"memory": 4000})
+        index.add_agent(b"unlimited", ["other"], 1)
+        assert index.fits(b"small", {"memory": 600}) and not index.fits(b"small", {"memory": 2000})
+        assert index.could_fit_somewhere("default", {"memory": 2000})
+        assert not index.could_fit_somewhere("default", {"memory": 8000})
+        assert index.fits(b"unlimited", {"memory": 8000})
+
+        index.acquire(b"small", {"memory": 600})
+        assert not index.fits(b"small", {"memory": 600}) and index.fits(b"small", {"memory": 400})
+        assert index.could_fit(b"small", {"memory": 600})
+        index.release(b"small", {"memory": 600})
+        assert index.fits(b"small", {"memory": 1000})
+
+    def test_find_agents(self):
+        index = FreeSlotIndex()
+        index.add_agent(b"agent1", ["default"], 1)
+        index.add_agent(b"agent2", ["default", "python"], 1)
+        assert index.find_agents("default") == [b"agent1", b"agent2"]
+        index.acquire(b"agent1")
+        assert index.find_agents("default") == [b"agent2"] and index.find_agents("other") == []
+
+
+class TestAgentLocality(object):
+    def test_warm_agents(self):
+        locality = AgentLocality()
+        locality.job_started(b"a1", ("course", "task1", "env"))
+        locality.job_started(b"a2", ("course", "task1", "env"))
+        locality.job_started(b"a1", ("course", "task2", "env"))
+        assert locality.warm_agents(("course", "task1", "env")) == {b"a1", b"a2"}
+        assert locality.warm_agents(("course", "task3", "env")) == set()
+        assert locality.recent(b"a1") == [("course", "task2", "env"), ("course", "task1", "env")]
+
+        locality.remove_agent(b"a1")
+        assert locality.warm_agents(("course", "task1", "env")) == {b"a2"}
+        assert locality.warm_agents(("course", "task2", "env")) == set()
+        assert locality.recent(b"a1") == []
+
+    def test_lru(self):
+        locality = AgentLocality(size=2)
+        locality.job_started(b"a1", "task1")
+        locality.job_started(b"a1", "task2")
+        locality.job_started(b"a1", "task1")
+        locality.job_started(b"a1", "task3")
+        assert locality.recent(b"a1") == ["task3", "task1"]
+        assert locality.warm_agents("task2") == set()
+
+
+class TestSchedulingPolicies(object):
+    def _job(self, idx, course_id, username="user", priority=0):
+        msg = ClientNewJob(str(idx), priority, course_id, "task", {"@username": username}, "default", {}, False, "test")
+        return priority, float(idx), b"client", str(idx), msg
+
+    def _run(self, policy, jobs):
+        for job in jobs:
+            policy.put("default", job[3], job)
+        return [policy.get(["default"])[3] for _ in jobs]
+
+    def test_fifo(self):
+        jobs = [self._job(0, "big"), self._job(1, "big"), self._job(2, "small"), self._job(3, "big", priority=-1)]
+        assert self._run(FIFOPolicy(), jobs) == ["3", "0", "1", "2"]
+
+    def test_fair_course(self):
+        jobs = [self._job(i, "big") for i in range(4)] + [self._job(4, "small"), self._job(5, "small")]
+        assert self._run(CourseFairSharePolicy(), jobs) == ["0", "4", "1", "5", "2", "3"]
+
+    def test_fair_course_weights(self):
+        jobs = [self._job(i, "a") for i in range(4)] + [self._job(i, "b") for i in range(4, 8)]
+        assert self._run(CourseFairSharePolicy({"a": 2}), jobs)[:6] == ["0", "4", "1", "2", "5", "3"]
+
+    def test_round_robin_user(self):
+        jobs = [self._job(0, "c", "u1"), self._job(1, "c", "u1"), self._job(2, "c", "u2")]
+        assert self._run(UserRoundRobinPolicy(), jobs) == ["0", "2", "1"]
+
+    def test_removed_job_releases_flow(self):
+        policy = CourseFairSharePolicy()
+        job = self._job(0, "course")
+        policy.put("default", job[3], job)
+        policy.remove(job[3])
+        assert policy.empty() and not policy._flows  # pylint: disable=protected-access
+
+
+class TestBackendScheduling(object):
+    def setup_method(self):
+        self.loop = asyncio.get_event_loop()
+        self.context = Context()
+        self.backend = Backend(self.context, "inproc://agents", "inproc://clients")
+        self.sent = []
+        self.backend._send_to_agent = lambda agent_addr, message: self.sent.append((agent_addr, message.job_id[1]))
+
+    def teardown_method(self):
+        self.context.destroy(0)
+
+    def _hello(self, agent_addr, slots, memory):
+        environments = {"default": {"id": "default-id", "created": 0, "type": "docker"}}
+        message = AgentHello(agent_addr.decode(), slots, environments, False, [], {"memory": memory})
+        self.loop.run_until_complete(self.backend.handle_agent_hello(agent_addr, message))
+
+    def _new_job(self, job_id, memory, task_id=None):
+        message = ClientNewJob(job_id, 0, "course", task_id or job_id, {}, "default", {"limits": {"memory": memory}}, False, "test")
+        self.loop.run_until_complete(self.backend.handle_client_new_job(b"client", message))
+
+    def test_reserved_agent_does_not_stall_others(self):
+        self._hello(b"large", 2, 4096)
+        self._new_job("running", 3000)
+        self._hello(b"small", 1, 1024)
+        assert self.sent == [(b"large", "running")]
+
+        # The large agent waits for its running job to end before running j1, the small one runs j2 meanwhile
+        self._new_job("j1", 2000)
+        self._new_job("j2", 200)
+        assert self.sent == [(b"large", "running"), (b"small", "j2")]
+
+    def test_reservation_updates_other_agents(self):
+        self._hello(b"large", 2, 4096)
+        self._new_job("running", 3000)
+        self._hello(b"small", 1, 1024)
+
+        # j2 is first given to the large agent, that recently ran its task, but it is reserved for j1
+        self._new_job("j1", 2000)
+        self._new_job("j2", 200, "running")
+        assert self.sent == [(b"large", "running"), (b"small", "j2")]
@@ -1,48 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import itertools
 import queue
 from heapq import heappush, heappop
 
 
 class TopicPriorityQueue:
-    """ A simple queue which supports getting elements by topics """
+    """
+        A priority queue which supports getting elements by topics.
+
+        Each topic has its own heap. Elements are identified by a (hashable) key, which allows to remove them in O(1)
+        using lazy deletion: removed entries are only flagged, and are discarded when they reach the top of their heap.
+
+        The order of the elements is given by _order(item), that is computed once, when the element is put in the queue.
+        By default, elements are compared between them. Subclasses can override _order, _on_get and _on_remove to
+        implement other scheduling policies.
+    """
+
+    _REMOVED = object()  # placeholder for the key of a removed entry
+
     def __init__(self):
-        self.queues = {}
-        self.size = 0
+        self.queues = {}  # topic -> heap of [order, counter, key, item, topic]
+        self._entries = {}  # key -> entry
+        self._counter = itertools.count()  # ensures stability and that keys/items are never compared
 
     def __len__(self):
-        return self.size
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
 
     def empty(self, topics=None):
+        """
+        This operation is in O(m) amortized, where m is the number of topics
+        """
         if topics is None:
-            return self.size == 0
+            return len(self._entries) == 0
         for topic in topics:
-            if topic in self.queues and len(self.queues[topic]) != 0:
+            if self._head(topic) is not None:
                 return False
         return True
 
-    def put(self, topic, item):
+    def put(self, topic, key, item):
         """
         This operation is in O(log n), where n is the size of the queue for the given topic
+
+        :param topic: topic of the element
+        :param key: a hashable unique identifier of the element, that can be given to remove()
+        :param item: the element itself
+        """
+        if key in self._entries:
+            raise KeyError("Key %s is already in the queue" % str(key))
+        entry = [self._order(item), next(self._counter), key, item, topic]
+        self._entries[key] = entry
+        heappush(self.queues.setdefault(topic, []), entry)
+
+    def remove(self, key):
         """
-        if topic not in self.queues:
-            self.queues[topic] = []
-        heappush(self.queues[topic], item)
-        self.size += 1
+        This operation is in O(1). The memory used by the element is only released when it reaches the top of its heap.
 
-    def get(self, topics=None):
+        :param key: the identifier given to put()
+        :return: the removed element
+        :raises: KeyError if the key is not in the queue
         """
-        This operation is in O(m + log n) where m is the number of topics and n the size of the queue
+        entry = self._entries.pop(key)
+        entry[2] = TopicPriorityQueue._REMOVED  # counters are unique, so keys are never compared
+        self._on_remove(entry[0], entry[3])
+        return entry[3]
 
-        :param topics: a list of topics
-        :return: the smallest elements that fits in one of the topics
+    def get(self, topics=None, skip=None, max_skipped=64):
+        """
+        This operation is in O(m + log n) amortized where m is the number of topics and n the size of the queue.
+        Each skipped element adds O(m + log n).
+
+        :param topics: a list of topics. If None, all the topics are considered.
+        :param skip: a function returning True for the elements that must be skipped, or None
+        :param max_skipped: maximum number of elements skipped. When more elements must be skipped, the queue is
+                            considered as empty.
+        :return: the smallest elements that fits in one of the topics, and that is not skipped
         :raises: queue.Empty exception if the queue has no elements that fits in any of the topics
         """
-        best_topic = None
-        best_elem = None
-        for topic in topics:
-            if topic in self.queues and len(self.queues[topic]) != 0 and (best_elem is None or best_elem > self.queues[topic][0]):
-                best_topic = topic
-                best_elem = self.queues[topic][0]
-        if best_topic is None:
-            raise queue.Empty()
-        self.size -= 1
-        return heappop(self.queues[best_topic])
+        entry = self._select(topics, skip, max_skipped)
+        key, heap = entry[2], self.queues[entry[4]]
+        if heap[0] is entry:
+            heappop(heap)
+        else:
+            entry[2] = TopicPriorityQueue._REMOVED  # a skipped element is before it in its heap
+        del self._entries[key]
+        self._on_get(entry[0], entry[3])
+        return entry[3]
+
+    def peek(self, topics=None, skip=None, max_skipped=64):
+        """
+        Returns the element that get() would return with the same parameters, without removing it from the queue
+        :raises: queue.Empty exception if the queue has no elements that fits in any of the topics
+        """
+        return self._select(topics, skip, max_skipped)[3]
+
+    def items(self):
+        """
+        This operation is in O(n log n), where n is the size of the queue
+
+        :return: the list of the (topic, element) in the queue, in the order in which get() would return them if all
+                 the topics were given
+        """
+        return [(entry[4], entry[3]) for entry in sorted(self._entries.values())]
+
+    def _select(self, topics, skip, max_skipped):
+        """ Returns the entry of the smallest element that fits in one of the topics and that is not skipped """
+        skipped = []
+        try:
+            while True:
+                best_entry = None
+                for topic in (topics if topics is not None else list(self.queues)):
+                    entry = self._head(topic)
+                    if entry is not None and (best_entry is None or entry < best_entry):
+                        best_entry = entry
+                if best_entry is None:
+                    raise queue.Empty()
+                if skip is None or not skip(best_entry[3]):
+                    return best_entry
+                if len(skipped) >= max_skipped:
+                    raise queue.Empty()
+                skipped.append(heappop(self.queues[best_entry[4]]))
+        finally:
+            for entry in skipped:
+                heappush(self.queues[entry[4]], entry)
+
+    def _head(self, topic):
+        """ Returns the first valid entry of the heap of a given topic, discarding the removed ones. None if there is no such entry """
+        heap = self.queues.get(topic)
+        while heap:
+            if heap[0][2] is not TopicPriorityQueue._REMOVED:
+                return heap[0]
+            heappop(heap)
+        return None
+
+    def _order(self, item):
+        """ Returns the value used to order item in the queue. Smallest values are returned first. """
+        return item
+
+    def _on_get(self, order, item):
+        """ Called when an element is returned by get() """
+        pass
+
+    def _on_remove(self, order, item):
+        """ Called when an element is removed by remove() """
+        pass
@@ -7,7 +7,7 @@ import asyncio
 
 import zmq
 
-from inginious.common.message_meta import ZMQUtils
+from inginious.common.message_meta import ZMQUtils, MessageMeta
 from inginious.common.messages import Pong, Ping, Unknown
 
 
@@ -33,6 +33,7 @@ class BetterParanoidPirateClient(object, metaclass=abc.ABCMeta):
         self._msgs_registered_inv = {}
         self._handlers_registered = {Pong.__msgtype__: self._handle_pong, Unknown.__msgtype__: self._handle_unknown}  # pylint: disable=no-member
         self._transactions = {}
+        self._batch_msgs_registered = set()
 
         self._restartable_tasks = [] # a list of asyncio task that should be closed each time the client restarts
 
@@ -46,6 +47,14 @@ class BetterParanoidPirateClient(object, metaclass=abc.ABCMeta):
         """
         self._handlers_registered[recv_msg.__msgtype__] = coroutine_recv
 
+    def _register_batch(self, batch_msg):
+        """
+        Register a class of batch messages, i.e. messages whose `messages` field contains a list of dumped messages. The messages of a batch
+        are handled, in order, as if they were received one by one.
+        :param batch_msg:
+        """
+        self._batch_msgs_registered.add(batch_msg.__msgtype__)
+
     def _register_transaction(self, send_msg, recv_msg, coroutine_recv, coroutine_abrt, get_key=None, inter_msg=None):
         """
         Register a type of message to be sent.
@@ -157,13 +166,7 @@ class BetterParanoidPirateClient(object, metaclass=abc.ABCMeta):
         """
 
         # 1. Close all transactions
-        for msg_class in self._transactions:
-            _1, _2, _3, coroutine_abrt, _4 = self._msgs_registered[msg_class]
-            if coroutine_abrt is not None:
-                for key in self._transactions[msg_class]:
-                    for args, kwargs in self._transactions[msg_class][key]:
-                        self._loop.create_task(coroutine_abrt(key, *args, **kwargs))
-            self._transactions[msg_class] = {}
+        await self._interrupt_transactions()
 
         # 2. Call on_disconnect
         await self._on_disconnect()
@@ -179,6 +182,29 @@ class BetterParanoidPirateClient(object, metaclass=abc.ABCMeta):
         # 5. Re-do start sequence
         await self.client_start()
 
+    async def _interrupt_transactions(self):
+        """
+        Called when the connection with the remote server is lost. Aborts all the running transactions.
+        Subclasses whose remote server may still complete the transactions after a reconnection can override it, and
+        abort them later with _abort_transactions.
+        """
+        self._abort_transactions()
+
+    def _abort_transactions(self, keys=None):
+        """
+        Aborts running transactions
+        :param keys: the keys of the transactions to abort. If None, all the transactions are aborted.
+        """
+        for msg_class in self._transactions:
+            _1, _2, _3, coroutine_abrt, _4 = self._msgs_registered[msg_class]
+            for key in list(self._transactions[msg_class]):
+                if keys is not None and key not in keys:
+                    continue
+                if coroutine_abrt is not None:
+                    for args, kwargs in self._transactions[msg_class][key]:
+                        self._loop.create_task(coroutine_abrt(key, *args, **kwargs))
+                del self._transactions[msg_class][key]
+
     async def client_start(self):
         """
         Starts the client
@@ -209,27 +235,37 @@ class BetterParanoidPirateClient(object, metaclass=abc.ABCMeta):
             while True:
                 message = await ZMQUtils.recv(self._socket)
                 self._ping_count = 0  # restart ping count
-                msg_class = message.__msgtype__
-                if msg_class in self._handlers_registered:
-                    # If a handler is registered, give the message to it
-                    self._loop.create_task(self._handlers_registered[msg_class](message))
-                elif msg_class in self._transactions:
-                    # If there are transaction associated, check if the key is ok
-                    _1, get_key, coroutine_recv, _2, responsible = self._msgs_registered[msg_class]
-                    key = get_key(message)
-                    if key in self._transactions[msg_class]:
-                        # key exists; call all the coroutines
-                        for args, kwargs in self._transactions[msg_class][key]:
-                            self._loop.create_task(coroutine_recv(message, *args, **kwargs))
-                        # remove all transaction parts
-                        for key2 in responsible:
-                            del self._transactions[key2][key]
-                    else:
-                        # key does not exist
-                        raise Exception("Received message %s for an unknown transaction %s", msg_class, key)
+                if message.__msgtype__ in self._batch_msgs_registered:
+                    for dumped_message in message.messages:
+                        self._handle_message(MessageMeta.load(dumped_message))
                 else:
-                    raise Exception("Received unknown message %s", msg_class)
+                    self._handle_message(message)
         except asyncio.CancelledError:
             return
         except KeyboardInterrupt:
             return
+
+    def _handle_message(self, message):
+        """
+        Give a received message to its handler, or to the coroutines of its transaction
+        """
+        msg_class = message.__msgtype__
+        if msg_class in self._handlers_registered:
+            # If a handler is registered, give the message to it
+            self._loop.create_task(self._handlers_registered[msg_class](message))
+        elif msg_class in self._transactions:
+            # If there are transaction associated, check if the key is ok
+            _1, get_key, coroutine_recv, _2, responsible = self._msgs_registered[msg_class]
+            key = get_key(message)
+            if key in self._transactions[msg_class]:
+                # key exists; call all the coroutines
+                for args, kwargs in self._transactions[msg_class][key]:
+                    self._loop.create_task(coroutine_recv(message, *args, **kwargs))
+                # remove all transaction parts
+                for key2 in responsible:
+                    del self._transactions[key2][key]
+            else:
+                # key does not exist
+                raise Exception("Received message %s for an unknown transaction %s", msg_class, key)
+        else:
+            raise Exception("Received unknown message %s", msg_class)
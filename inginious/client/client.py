@@ -7,11 +7,11 @@ import logging
 import uuid
 from abc import abstractmethod, ABCMeta
 
-import time
-
 from inginious.client._zeromq_client import BetterParanoidPirateClient
+from inginious.client.job_queue_index import JobQueueIndex
 from inginious.common.messages import ClientHello, BackendUpdateEnvironments, BackendJobStarted, \
-    BackendJobDone, BackendJobSSHDebug, ClientNewJob, ClientKillJob, ClientGetQueue, BackendGetQueue
+    BackendJobDone, BackendJobSSHDebug, ClientNewJob, ClientKillJob, BackendJobDoneBatch, ClientSubscribeQueue, BackendKnownJobs, \
+    BackendQueueSnapshot, BackendQueueDelta, BackendQueueDeltaBatch, BackendQueueWaitTimes
 
 
 def _callable_once(func):
@@ -86,7 +86,7 @@ class AbstractClient(object, metaclass=ABCMeta):
 
         Return a tuple of two lists (or None, None):
         jobs_running: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, started_at, max_time)
+            (job_id, is_current_client_job, agent_name, info, launcher, started_at, max_time, expected_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
@@ -95,14 +95,17 @@ class AbstractClient(object, metaclass=ABCMeta):
             - launcher is the name of the launcher, which may be anything
             - started_at the time (in seconds since UNIX epoch) at which the job started
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
         jobs_waiting: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, max_time)
+            (job_id, is_current_client_job, info, launcher, max_time, expected_time, wait_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
             - info is "courseid/taskid"
             - launcher is the name of the launcher, which may be anything
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
+            - wait_time the expected time (in seconds) before the job starts, or -1 if no agent can run the job
         """
         pass
 
@@ -117,84 +120,93 @@ class AbstractClient(object, metaclass=ABCMeta):
 
 
 class Client(BetterParanoidPirateClient):
-    def __init__(self, context, backend_addr, queue_update=10):
+    def __init__(self, context, backend_addr, subscribe_queue=True):
         """
         Init a new RRR.
         :param context: 0MQ context
         :param backend_addr: 0MQ address of the backend
-        :param queue_update: interval in seconds between two updates of the distant queue. Set to something <= 0 to disable updates.
+        :param subscribe_queue: whether to follow the changes of the distant queue. Set to False to disable updates.
         """
         super().__init__(context, backend_addr)
         self._logger = logging.getLogger("inginious.client")
         self._available_environments = {}
 
+        # Keep the same identity when reconnecting, so that the backend can still send us the results of our jobs
+        self._socket.identity = ("client-%s" % uuid.uuid4()).encode()
+        self._interrupted_jobs = set()  # jobs sent before a reconnection, that the backend may still run. See BackendKnownJobs.
+
         self._register_handler(BackendUpdateEnvironments, self._handle_update_environments)
-        self._register_handler(BackendGetQueue, self._handle_job_queue_update)
+        self._register_handler(BackendKnownJobs, self._handle_known_jobs)
+        self._register_handler(BackendQueueSnapshot, self._handle_queue_snapshot)
+        self._register_handler(BackendQueueDelta, self._handle_queue_delta)
+        self._register_handler(BackendQueueWaitTimes, self._handle_queue_wait_times)
+        self._register_batch(BackendJobDoneBatch)
+        self._register_batch(BackendQueueDeltaBatch)
         self._register_transaction(ClientNewJob, BackendJobDone, self._handle_job_done, self._handle_job_abort,
                                    lambda x: x.job_id, [
                                        (BackendJobStarted, self._handle_job_started),
                                        (BackendJobSSHDebug, self._handle_job_ssh_debug)
                                    ])
 
-        self._queue_update_timer = queue_update
-        self._queue_update_last_attempt = 0  # nb of time we waited _queue_update_timer seconds for a reply
-        self._queue_update_last_attempt_max = 3
-        self._queue_cache = None
-        self._queue_job_cache = {} #format is job_id: (nb_tasks_before (can be -1 == running), approx_wait_time_in_seconds)
-
-    async def _ask_queue_update(self):
-        """ Send a ClientGetQueue message to the backend, if one is not already sent """
-        try:
-            while True:
-                await asyncio.sleep(self._queue_update_timer)
-                if self._queue_update_last_attempt == 0 or self._queue_update_last_attempt > self._queue_update_last_attempt_max:
-                    if self._queue_update_last_attempt:
-                        self._logger.error("Asking for a job queue update despite previous update not yet received")
-                    else:
-                        self._logger.debug("Asking for a job queue update")
-
-                    self._queue_update_last_attempt = 1
-                    await self._simple_send(ClientGetQueue())
-                else:
-                    self._logger.error("Not asking for a job queue update as previous update not yet received")
-        except asyncio.CancelledError:
-            return
-        except KeyboardInterrupt:
+        self._subscribe_queue = subscribe_queue
+        self._queue_index = JobQueueIndex()
+        self._queue_sequence = None  # sequence number of the last message received about the queue, None if not synchronized
+
+    async def _interrupt_transactions(self):
+        """ Keeps the running jobs until the backend tells if it still knows them (see _handle_known_jobs) """
+        self._interrupted_jobs.update(self._transactions[BackendJobDone.__msgtype__])  # pylint: disable=no-member
+
+    async def _handle_known_jobs(self, message: BackendKnownJobs):
+        """ Handles a BackendKnownJobs, sent after our ClientHello. Abort the jobs that the backend lost. """
+        lost_jobs = self._interrupted_jobs.difference(message.job_ids)
+        if lost_jobs:
+            self._logger.warning("The backend lost %i jobs", len(lost_jobs))
+            self._abort_transactions(lost_jobs)
+        if len(lost_jobs) != len(self._interrupted_jobs):
+            self._logger.info("The backend still knows %i jobs", len(self._interrupted_jobs) - len(lost_jobs))
+        self._interrupted_jobs = set()
+
+    async def _handle_queue_snapshot(self, message: BackendQueueSnapshot):
+        """ Handles a BackendQueueSnapshot containing a snapshot of the job queue """
+        self._logger.debug("Received job queue snapshot")
+        self._queue_sequence = message.sequence
+        self._queue_index.reset(message.jobs_running, message.jobs_waiting)
+
+    async def _handle_queue_delta(self, message: BackendQueueDelta):
+        """ Handles a BackendQueueDelta containing a change of the job queue """
+        if not await self._check_queue_sequence(message.sequence):
             return
-
-    async def _handle_job_queue_update(self, message: BackendGetQueue):
-        """ Handles a BackendGetQueue containing a snapshot of the job queue """
-        self._logger.debug("Received job queue update")
-        self._queue_update_last_attempt = 0
-        self._queue_cache = message
-
-        # Do some precomputation
-        new_job_queue_cache = {}
-        # format is job_id: (nb_jobs_before, max_remaining_time)
-        for (job_id, is_local, _, _2, _3, start_time, max_time) in message.jobs_running:
-            if is_local:
-                remaining = 0
-                if max_time > 0:
-                    remaining = max(0, (start_time + max_time) - time.time())
-                new_job_queue_cache[job_id] = (-1, remaining)
-        wait_time = 0
-        nb_tasks = 0
-        for (job_id, is_local, _, _2, timeout) in message.jobs_waiting:
-            if timeout > 0:
-                wait_time += timeout
-            if is_local:
-                new_job_queue_cache[job_id] = (nb_tasks, wait_time)
-            nb_tasks += 1
-
-        self._queue_job_cache = new_job_queue_cache
+        if message.event == "queued":
+            self._queue_index.job_queued(message.job)
+        elif message.event == "started":
+            self._queue_index.job_started(message.job)
+        else:
+            self._queue_index.job_ended(message.job[0])
+
+    async def _handle_queue_wait_times(self, message: BackendQueueWaitTimes):
+        """ Handles a BackendQueueWaitTimes containing the expected waiting times of our waiting jobs """
+        if await self._check_queue_sequence(message.sequence):
+            self._queue_index.update_wait_times(message.wait_times)
+
+    async def _check_queue_sequence(self, sequence):
+        """ Returns True if the message with the given sequence number is the next one. Else, asks for a new snapshot. """
+        if self._queue_sequence is None:
+            return False  # waiting for a snapshot
+        if sequence != self._queue_sequence + 1:
+            self._logger.warning("Lost some job queue updates, asking for a new snapshot")
+            self._queue_sequence = None
+            await self._simple_send(ClientSubscribeQueue())
+            return False
+        self._queue_sequence = sequence
+        return True
 
     def get_job_queue_snapshot(self):
-        if self._queue_cache is not None:
-            return self._queue_cache.jobs_running, self._queue_cache.jobs_waiting
+        if self._queue_sequence is not None:
+            return self._queue_index.snapshot()
         return None, None
 
     def get_job_queue_info(self, jobid):
-        return self._queue_job_cache.get(jobid)
+        return self._queue_index.job_info(jobid)
 
     async def _handle_update_environments(self, message: BackendUpdateEnvironments):
         self._available_environments = message.available_environments
@@ -242,8 +254,10 @@ class Client(BetterParanoidPirateClient):
 
     async def _on_connect(self):
         self._available_environments = {}
-        await self._simple_send(ClientHello("me"))
-        self._restartable_tasks.append(self._loop.create_task(self._ask_queue_update()))
+        await self._simple_send(ClientHello("me", True))
+        self._queue_sequence = None
+        if self._subscribe_queue:
+            await self._simple_send(ClientSubscribeQueue())
         self._logger.info("Connecting to backend")
 
     def start(self):
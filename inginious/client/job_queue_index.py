@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import time
+from bisect import bisect_left
+
+
+class JobQueueIndex:
+    """
+        Local copy of the job queue of the backend, built from a snapshot and kept up to date with the changes sent
+        by the backend. The jobs are in the forms described in BackendGetQueue.
+    """
+
+    def __init__(self):
+        self._running = {}  # job_id -> running job
+        self._waiting = {}  # job_id -> (position, waiting job), ordered by position
+        self._positions = []  # sorted positions of the waiting jobs
+        self._next_position = 0
+        self._start_times = {}  # job_id -> time at which a waiting job is expected to start
+
+    def reset(self, jobs_running, jobs_waiting):
+        """ Replaces the content of the index by a snapshot of the queue """
+        self._running = {job[0]: tuple(job) for job in jobs_running}
+        self._waiting = {}
+        self._positions = []
+        self._next_position = 0
+        self._start_times = {}
+        for job in jobs_waiting:
+            self.job_queued(job)
+
+    def job_queued(self, job):
+        """ Adds a waiting job, after the other waiting jobs """
+        job = tuple(job)
+        self._waiting[job[0]] = (self._next_position, job)
+        self._positions.append(self._next_position)
+        self._next_position += 1
+        if job[6] >= 0:
+            self._start_times[job[0]] = time.time() + job[6]
+
+    def job_started(self, job):
+        """ Moves a job from the waiting jobs to the running jobs """
+        self._remove_waiting(job[0])
+        self._running[job[0]] = tuple(job)
+
+    def job_ended(self, job_id):
+        """ Removes a waiting or running job """
+        self._remove_waiting(job_id)
+        self._running.pop(job_id, None)
+
+    def update_wait_times(self, wait_times):
+        """ Updates the expected waiting time (in seconds from now) of some waiting jobs """
+        now = time.time()
+        for job_id, wait_time in wait_times.items():
+            if job_id in self._waiting and wait_time >= 0:
+                self._start_times[job_id] = now + wait_time
+            else:
+                self._start_times.pop(job_id, None)
+
+    def snapshot(self):
+        """ Returns a tuple of two lists (jobs_running, jobs_waiting), in the form of BackendGetQueue """
+        now = time.time()
+        jobs_waiting = []
+        for job_id, (_, job) in self._waiting.items():
+            start_time = self._start_times.get(job_id)
+            jobs_waiting.append(job[:6] + (int(round(max(0, start_time - now))) if start_time is not None else -1,))
+        return list(self._running.values()), jobs_waiting
+
+    def job_info(self, job_id):
+        """
+        :return: a tuple (nb jobs before running (or -1 if running), approx wait time in seconds) if the job is
+                 in the queue, None else
+        """
+        now = time.time()
+        if job_id in self._running:
+            _, _2, _3, _4, _5, start_time, max_time, expected_time = self._running[job_id]
+            remaining = 0
+            if expected_time >= 0:
+                remaining = max(0, (start_time + expected_time) - now)
+            elif max_time > 0:
+                remaining = max(0, (start_time + max_time) - now)
+            return -1, remaining
+        if job_id in self._waiting:
+            position = self._waiting[job_id][0]
+            start_time = self._start_times.get(job_id)
+            return bisect_left(self._positions, position), max(0, start_time - now) if start_time is not None else 0
+        return None
+
+    def _remove_waiting(self, job_id):
+        if job_id not in self._waiting:
+            return
+        position, _ = self._waiting.pop(job_id)
+        del self._positions[bisect_left(self._positions, position)]
+        self._start_times.pop(job_id, None)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import time
+
+from inginious.client.job_queue_index import JobQueueIndex
+
+
+def waiting(job_id, wait_time=-1):
+    return job_id, True, "course/task", "launcher", 30, 5, wait_time
+
+
+def running(job_id, started_at, expected_time=5):
+    return job_id, True, "agent", "course/task", "launcher", started_at, 30, expected_time
+
+
+class TestJobQueueIndex(object):
+    def test_positions(self):
+        index = JobQueueIndex()
+        index.reset([], [waiting("a"), waiting("b")])
+        index.job_queued(waiting("c"))
+        index.job_queued(waiting("d"))
+        assert [index.job_info(job_id)[0] for job_id in "abcd"] == [0, 1, 2, 3]
+
+        index.job_started(running("b", int(time.time())))
+        index.job_ended("a")
+        assert index.job_info("a") is None
+        assert index.job_info("b")[0] == -1
+        assert index.job_info("c")[0] == 0 and index.job_info("d")[0] == 1
+
+        jobs_running, jobs_waiting = index.snapshot()
+        assert [job[0] for job in jobs_running] == ["b"]
+        assert [job[0] for job in jobs_waiting] == ["c", "d"]
+
+    def test_times(self):
+        index = JobQueueIndex()
+        now = time.time()
+        index.reset([running("a", int(now) - 2, 10), running("b", int(now) - 20, -1)], [waiting("c", 100), waiting("d")])
+        assert 7 <= index.job_info("a")[1] <= 8
+        assert 9 <= index.job_info("b")[1] <= 10  # no estimate: time limit
+        assert 99 <= index.job_info("c")[1] <= 100
+        assert index.job_info("d")[1] == 0
+        assert index.snapshot()[1][1][6] == -1
+
+        index.update_wait_times({"c": 50, "d": 60, "unknown": 10})
+        assert 49 <= index.job_info("c")[1] <= 50
+        assert 59 <= index.job_info("d")[1] <= 60
+        assert index.job_info("unknown") is None
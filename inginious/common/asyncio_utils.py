@@ -8,9 +8,14 @@
 """
 
 import asyncio
+import collections
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps, partial
 
+from inginious.common.base import percentile
+
 
 class AsyncIteratorWrapper(object):
     """ A wrapper that converts old-style-generators to async generators using run_in_executor """
@@ -67,3 +72,35 @@ class AsyncProxy(object):
             return await self._loop.run_in_executor(self._executor, f)
 
         return _inner
+
+
+class MeasuredThreadPoolExecutor(ThreadPoolExecutor):
+    """ A named ThreadPoolExecutor that measures how long the calls wait in its queue before being run """
+    def __init__(self, max_workers, name, samples=1000):
+        """
+        :param max_workers: number of threads
+        :param name: name of the pool, used as prefix of the names of its threads
+        :param samples: number of recent calls whose waiting time is kept
+        """
+        super(MeasuredThreadPoolExecutor, self).__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.size = max_workers
+        self._waits = collections.deque(maxlen=samples)
+        self._calls = 0
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.monotonic()
+
+        def measured():
+            self._waits.append(time.monotonic() - submitted)
+            return fn(*args, **kwargs)
+
+        self._calls += 1
+        return super(MeasuredThreadPoolExecutor, self).submit(measured)
+
+    def stats(self):
+        """ Returns the number of calls submitted, waiting, and the p50/p99/max waiting times (in s) of the recent calls """
+        waits = sorted(self._waits)
+        return {"calls": self._calls, "queued": self._work_queue.qsize(),
+                "wait_p50": percentile(waits, 50), "wait_p99": percentile(waits, 99),
+                "wait_max": waits[-1] if waits else 0.0}
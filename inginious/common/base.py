@@ -24,6 +24,12 @@ def id_checker_tests(id_to_test):
     return bool(re.match(r'[a-z0-9\-_*]+$', id_to_test, re.IGNORECASE))
     
 
+def percentile(values, pct):
+    """ Returns the pct-th percentile (nearest rank) of the given values, or 0.0 if there are none """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
 def load_json_or_yaml(file_path):
     """ Load JSON or YAML depending on the file extension. Returns a dict """
     with open(file_path, "r") as f:
@@ -3,6 +3,8 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 import inspect
+import typing
+import zlib
 
 import msgpack
 
@@ -26,34 +28,104 @@ class MessageMeta(type):
             def __init__(self, container_id: str, a_number: int):
                 self.container_id = container_id
                 self.a_number = a_number
+
+        The fields of the messages are stored in __slots__, and the messages are serialized as a msgpack array
+        [type id, field 1, field 2, ...], by code generated for each class when it is created.
+
+        The fields that may contain large bytes values (uploaded files, archives, ...) can be listed in the argument
+        `large_fields` of the metaclass. Those values can then be sent in their own frame, see dump_frames and ZMQUtils.
     """
-    _registered_messages = {}
-    DEBUG = True
+    _registered_messages = {}  # msgtype -> class
+    _registered_ids = {}  # type id -> class
+
+    #: no verification of the received messages: only for trusted peers
+    VALIDATE_NONE = 0
+    #: verifies the number of fields of the received messages
+    VALIDATE_FIELDS = 1
+    #: also verifies the types of the fields of the messages, received or created, against their annotations
+    VALIDATE_TYPES = 2
+    #: current validation level
+    VALIDATION_LEVEL = VALIDATE_FIELDS
 
     def __new__(cls, name, bases, namespace, **kargs):  # pylint: disable=unused-argument
+        parameters = list(inspect.signature(namespace["__init__"]).parameters)[1:]  # self is not a real parameter
+        namespace["__slots__"] = tuple(parameters)
         return super().__new__(cls, name, bases, namespace)
 
     @classmethod
-    def load(cls, bmessage):
+    def load(cls, bmessage, payloads=None):
         """
         From a bytestring given by a (distant) call to Message.dump(), retrieve the original message
-        :param bmessage: bytestring given by a .dump() call on a message
+        :param bmessage: bytestring given by a .dump() call on a message, or the first frame given by dump_frames
+        :param payloads: the values of the other frames given by dump_frames, if any
         :return: the original message
         """
-        message_dict = msgpack.loads(bmessage, use_list=False)
-
+        if payloads:
+            def ext_hook(code, data):
+                if code != _PAYLOAD_EXT:
+                    return msgpack.ExtType(code, data)
+                return payloads[int.from_bytes(data, "big")]
+            values = msgpack.loads(bmessage, use_list=False, ext_hook=ext_hook)
+        else:
+            values = msgpack.loads(bmessage, use_list=False)
         try:
-            obj = MessageMeta._registered_messages[message_dict["type"]].__new__(MessageMeta._registered_messages[message_dict["type"]])
-            object.__setattr__(obj, "__dict__", message_dict)
-        except:
+            message_class = MessageMeta._registered_ids[values[0]]
+        except (KeyError, IndexError, TypeError):
             raise TypeError("Unknown message type") from None
+        return message_class._from_values(values)  # pylint: disable=protected-access
 
-        if not obj._verify():  # pylint: disable=protected-access
-            raise TypeError("Invalid message content")
+    @classmethod
+    def peek(cls, bmessage, fields=("type",)):
+        """
+        Reads some fields of a message given by Message.dump(), without loading (nor verifying) the whole message.
+        The other fields are skipped without being decoded.
+        :param bmessage: bytestring given by a .dump() call on a message
+        :param fields: names of the fields to read. "type" is the msgtype of the message.
+        :return: a dict containing the fields that were found in the message
+        """
+        unpacker = msgpack.Unpacker(use_list=False, raw=False)
+        unpacker.feed(bmessage)
+        nb_values = unpacker.read_array_header()
+        message_class = MessageMeta._registered_ids.get(unpacker.unpack()) if nb_values else None
+        if message_class is None:
+            return {}
+        values = {"type": message_class.__msgtype__} if "type" in fields else {}
+        for name in message_class.__slots__[:nb_values - 1]:
+            if len(values) == len(fields):
+                break
+            if name in fields:
+                values[name] = unpacker.unpack()
+            else:
+                unpacker.skip()
+        return values
 
-        return obj
+    @classmethod
+    def dump_frames(cls, message, threshold):
+        """
+        Dumps a message in a list of frames. The bytes values of the large fields of the message that are larger than
+        threshold, and the Payload values, are put in their own frame instead of being copied in the first one.
+        :param message: the message to dump
+        :param threshold: minimal size of the values put in their own frame. None to put everything in the first frame.
+        :return: a list of frames, whose first one can be given to load along with the values of the others
+        """
+        if threshold is None or not message.__large_fields__:
+            return [message.dump()]
+        payloads = []
+        values = [message.__type_id__]
+        for field in message.__slots__:
+            value = getattr(message, field)
+            values.append(_extract_payloads(value, payloads, threshold) if field in message.__large_fields__ else value)
+        if not payloads:
+            return [message.dump()]
+        return [msgpack.packb(values, use_bin_type=True, default=_dump_payload)] + payloads
 
-    def __init__(cls, name, bases, attrs, msgtype):
+    @classmethod
+    def has_payloads(cls, message, threshold):
+        """ Returns True if dump_frames would put some values of the message in their own frame """
+        return threshold is not None and any(_contains_payload(getattr(message, field), threshold)
+                                             for field in message.__large_fields__)
+
+    def __init__(cls, name, bases, attrs, msgtype, large_fields=()):
         """
         Ensure that the new class
         - Provides immutable objects
@@ -62,9 +134,6 @@ class MessageMeta(type):
         - Has a .dump() function
         """
         old_init = cls.__init__
-        old_setattr = cls.__setattr__
-        old_delattr = cls.__delattr__
-
         parameters = inspect.signature(old_init).parameters.copy()
         del parameters["self"]  # self is not a real parameter
 
@@ -77,58 +146,66 @@ class MessageMeta(type):
             if parameters[field].annotation == inspect._empty:  # pylint: disable=protected-access
                 raise TypeError("All types should be annotated")
 
+        # check, once and for all, that __init__ only assigns its arguments to the fields of the same name
+        sentinels = {field: object() for field in parameters}
+        fake_self = _FakeMessage()
+        old_init(fake_self, **sentinels)
+        if fake_self.__dict__ != sentinels:
+            raise TypeError("__init__ does not fullfill the contract of messages. All fields must be init in the object and have the same value "
+                            "and name than in the parameters")
+
+        type_id = zlib.crc32(msgtype.encode())
+        if type_id in MessageMeta._registered_ids and MessageMeta._registered_ids[type_id].__msgtype__ != msgtype:
+            raise TypeError("The type id of %s collides with the one of %s" % (msgtype, MessageMeta._registered_ids[type_id].__msgtype__))
         MessageMeta._registered_messages[msgtype] = cls
+        MessageMeta._registered_ids[type_id] = cls
 
-        def new_init(self, *args, **kwargs):
-            object.__setattr__(self, "__currently_mutable", True)
-
-            # Get the message content
-            message_content = {x[0]: y for (x, y) in zip(parameters.items(), args)}
-
-            # Ask the init function to fill himself __dict__
-            old_init(self, *args, **kwargs)
-
-            object.__delattr__(self, "__currently_mutable")
-
-            # Verify that dict has been filled correctly
-            if self.__dict__ != message_content:
-                raise TypeError("__init__ does not fullfill the contract of messages. All fields must be init in the object and have the same value "
-                                "and name than in the parameters")
-
-            # Do not forget to add message name now
-            object.__setattr__(self, "type", msgtype)
+        type_checks = {field: _type_check(parameter.annotation) for field, parameter in parameters.items()}
 
         def new_delattr(self, name):
-            if "__currently_mutable" in self.__dict__:
-                old_delattr(self, name)
-            else:
-                raise TypeError("Immutable object")
+            raise TypeError("Immutable object")
 
         def new_setattr(self, name, value):
-            if "__currently_mutable" in self.__dict__:
-                old_setattr(self, name, value)
-            else:
-                raise TypeError("Immutable object")
-
-        needed_keys = set(parameters.keys()) | {"type"}
+            raise TypeError("Immutable object")
 
         def _verify(self, force=False):
             """
-            Ensure this message is consistent with its definition. Verifies only if force or MessageMeta.DEBUG is True
+            Ensure this message is consistent with its definition. Verifies only if force or the validation level is
+            at least VALIDATE_TYPES
             :param force:
             :return: True if correct, False else
             """
-            if force or MessageMeta.DEBUG:
-                content_present = set(self.__dict__.keys()) == needed_keys
-                type_ok = self.type == msgtype
-                return content_present and type_ok
+            if force or MessageMeta.VALIDATION_LEVEL >= MessageMeta.VALIDATE_TYPES:
+                for field, accepted_types in type_checks.items():
+                    if accepted_types is not None and not isinstance(getattr(self, field), accepted_types):
+                        return False
             return True
 
-        def dump(self):
-            """
-            :return: a bytestring containing a black-box representation of the message, that can be loaded using MessageMeta.load.
-            """
-            return msgpack.dumps(self.__dict__, use_bin_type=True)
+        # Code generated for this class: the constructor, the serialization and the deserialization
+        fields = list(parameters)
+        namespace = {"MessageMeta": MessageMeta, "cls": cls, "packb": msgpack.packb, "new": object.__new__,
+                     "default": _dump_payload}
+        namespace.update({"set_" + field: getattr(cls, field).__set__ for field in fields})
+        source = "def __init__(self%s):\n" % "".join(", " + field for field in fields)
+        source += "".join("    set_%s(self, %s)\n" % (field, field) for field in fields)
+        source += "    if MessageMeta.VALIDATION_LEVEL >= MessageMeta.VALIDATE_TYPES and not self._verify():\n"
+        source += "        raise TypeError('Invalid message content')\n"
+        source += "def dump(self):\n"
+        source += "    \"\"\" :return: a bytestring containing a black-box representation of the message, that can be loaded using MessageMeta.load. \"\"\"\n"
+        source += "    return packb((%i,%s), use_bin_type=True, default=default)\n" % (type_id, "".join(" self.%s," % field for field in fields))
+        source += "def _from_values(values):\n"
+        source += "    if MessageMeta.VALIDATION_LEVEL >= MessageMeta.VALIDATE_FIELDS and len(values) != %i:\n" % (len(fields) + 1)
+        source += "        raise TypeError('Invalid message content')\n"
+        source += "    obj = new(cls)\n"
+        source += "".join("    set_%s(obj, values[%i])\n" % (field, idx + 1) for idx, field in enumerate(fields))
+        source += "    if MessageMeta.VALIDATION_LEVEL >= MessageMeta.VALIDATE_TYPES and not obj._verify():\n"
+        source += "        raise TypeError('Invalid message content')\n"
+        source += "    return obj\n"
+        exec(source, namespace)  # pylint: disable=exec-used
+
+        new_init = namespace["__init__"]
+        new_init.__doc__ = old_init.__doc__
+        new_init.__signature__ = inspect.signature(old_init)
 
         super().__init__(name, bases, attrs)
 
@@ -136,8 +213,89 @@ class MessageMeta(type):
         cls.__delattr__ = new_delattr
         cls.__setattr__ = new_setattr
         cls._verify = _verify
-        cls.dump = dump
+        cls._from_values = staticmethod(namespace["_from_values"])
+        cls.dump = namespace["dump"]
+        cls.type = msgtype
         cls.__msgtype__ = msgtype
+        cls.__type_id__ = type_id
+        cls.__large_fields__ = frozenset(large_fields)
+
+
+class _FakeMessage(object):
+    """ Object on which the __init__ of the messages are called to verify that they respect the contract """
+
+
+class Payload(object):
+    """
+        A large bytes value of a message that was received in its own ZeroMQ frame, and kept in it (see ZMQUtils).
+        A message containing Payloads can be sent again without copying them; bytes(payload) returns the value.
+    """
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __bytes__(self):
+        return self.frame.bytes
+
+    def __len__(self):
+        return len(self.frame)
+
+
+#: msgpack extension type code of the references to the frames given by MessageMeta.dump_frames
+_PAYLOAD_EXT = 1
+
+
+def _dump_payload(obj):
+    """ msgpack hook that copies the Payloads in the messages dumped in a single frame """
+    if isinstance(obj, Payload):
+        return obj.frame.bytes
+    raise TypeError("Cannot serialize %r" % (obj,))
+
+
+def _extract_payloads(value, payloads, threshold):
+    """ Returns value in which the large bytes values and the Payloads are replaced by references to the frames appended to payloads """
+    if isinstance(value, Payload) or (isinstance(value, bytes) and len(value) >= threshold):
+        payloads.append(value.frame if isinstance(value, Payload) else value)
+        return msgpack.ExtType(_PAYLOAD_EXT, (len(payloads) - 1).to_bytes(4, "big"))
+    if isinstance(value, dict):
+        return {key: _extract_payloads(item, payloads, threshold) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_extract_payloads(item, payloads, threshold) for item in value]
+    return value
+
+
+def _contains_payload(value, threshold):
+    """ Returns True if _extract_payloads would extract something from value """
+    if isinstance(value, Payload) or (isinstance(value, bytes) and len(value) >= threshold):
+        return True
+    if isinstance(value, dict):
+        return any(_contains_payload(item, threshold) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_contains_payload(item, threshold) for item in value)
+    return False
+
+
+def _type_check(annotation):
+    """ Returns the tuple of the types accepted for a field annotated with the given type, or None to accept anything """
+    if annotation in (float, complex):
+        return (int, float) if annotation is float else (int, float, complex)
+    if annotation is bytes:
+        return bytes, Payload
+    if annotation in (str, int, bool, dict, list, tuple):
+        return (list, tuple) if annotation in (list, tuple) else (annotation,)
+    origin = getattr(annotation, "__origin__", None)
+    if origin is typing.Union:
+        accepted_types = ()
+        for argument in annotation.__args__:
+            argument_types = type(None) if argument is type(None) else _type_check(argument)
+            if argument_types is None:
+                return None
+            accepted_types += argument_types if isinstance(argument_types, tuple) else (argument_types,)
+        return accepted_types
+    if origin is not None:
+        return _type_check(origin)
+    return None  # Any, or a type we do not know how to check
 
 
 def run_tests():
@@ -190,7 +348,7 @@ def run_tests():
 
     print("----------------- Invalid dump 1 (invalid type)")
     try:
-        invalid_dump1 = b'\x82\xaccontainer_id\x01\xa4type\xaekill_containeI'
+        invalid_dump1 = msgpack.dumps((zlib.crc32(b"kill_containeI"), "test3"))
         obj4 = MessageMeta.load(invalid_dump1)
         print(type(obj4))
         print(obj4.container_id)
@@ -202,19 +360,20 @@ def run_tests():
 
     print("----------------- Invalid dump 2 (invalid fields)")
     try:
-        invalid_dump2 = b'\x82\xaccontainer_iI\x01\xa4type\xaekill_container'
+        invalid_dump2 = msgpack.dumps((KillContainer.__type_id__, "test3", "test4"))  # pylint: disable=no-member
         obj5 = MessageMeta.load(invalid_dump2)
         print(type(obj5))
         print(obj5.container_id)
         print("does not work")
-    except KeyError as e:
+    except TypeError as e:
         print(e)
         print("(works)")
     print()
 
     print("----------------- Invalid dump 3 (invalid content)")
     try:
-        invalid_dump3 = msgpack.dumps({"type": "kill_container", "container_id": 2})
+        invalid_dump3 = msgpack.dumps((KillContainer.__type_id__, 2))  # pylint: disable=no-member
+        MessageMeta.VALIDATION_LEVEL = MessageMeta.VALIDATE_TYPES
         obj6 = MessageMeta.load(invalid_dump3)
         print(type(obj6))
         print(obj6.container_id)
@@ -222,32 +381,52 @@ def run_tests():
     except TypeError as e:
         print(e)
         print("(works)")
+    finally:
+        MessageMeta.VALIDATION_LEVEL = MessageMeta.VALIDATE_FIELDS
     print()
 
 
 class ZMQUtils(object):
     """
         Utilities that do serializing/unserializing of messages (whose metaclass is MessageMeta)
+
+        The large bytes values of the messages are sent in their own frames (see MessageMeta.dump_frames). The receiving
+        side can keep them in their frame (keep_payloads=True), as Payload objects, to forward them without copying them.
     """
 
+    #: minimal size of the values of the large fields of the messages that are sent in their own frame. None to disable.
+    PAYLOAD_THRESHOLD = 64 * 1024
+
+    @classmethod
+    def _load(cls, frames, keep_payloads):
+        """ Loads the message whose frames are given, as received with recv_multipart(copy=not keep_payloads) """
+        if keep_payloads:
+            return MessageMeta.load(frames[0].bytes, [Payload(frame) for frame in frames[1:]])
+        return MessageMeta.load(frames[0], frames[1:])
+
+    @classmethod
+    async def _send_frames(cls, socket, frames):
+        # The payloads are given to ZeroMQ without copy
+        await socket.send_multipart(frames, copy=len(frames) <= 2)
+
     @classmethod
-    async def recv_with_addr(cls, socket):
-        message = await socket.recv_multipart()
-        addr = message[0]
-        obj = MessageMeta.load(message[1])
+    async def recv_with_addr(cls, socket, keep_payloads=False):
+        message = await socket.recv_multipart(copy=not keep_payloads)
+        addr = message[0].bytes if keep_payloads else message[0]
+        obj = cls._load(message[1:], keep_payloads)
         return addr, obj
 
     @classmethod
     async def send_with_addr(cls, socket, addr: bytes, obj):
-        message = [addr, obj.dump()]
-        await socket.send_multipart(message)
+        message = [addr] + MessageMeta.dump_frames(obj, cls.PAYLOAD_THRESHOLD)
+        await cls._send_frames(socket, message)
 
     @classmethod
-    async def recv(cls, socket, skip_first=False):
-        message = await socket.recv_multipart()
-        return MessageMeta.load(message[0] if not skip_first else message[1])
+    async def recv(cls, socket, skip_first=False, keep_payloads=False):
+        message = await socket.recv_multipart(copy=not keep_payloads)
+        return cls._load(message if not skip_first else message[1:], keep_payloads)
 
     @classmethod
     async def send(cls, socket, obj, send_white=False):
-        message_obj = obj.dump()
-        await socket.send_multipart([message_obj] if not send_white else ["", message_obj])
+        message = MessageMeta.dump_frames(obj, cls.PAYLOAD_THRESHOLD)
+        await cls._send_frames(socket, message if not send_white else [b""] + message)
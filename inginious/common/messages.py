@@ -24,14 +24,16 @@ class ClientHello(metaclass=MessageMeta, msgtype="client_hello"):
         Let the client say hello to the backend (and thus register to some events)
     """
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, supports_batches: bool):
         """
         :param name: name of the client (do not need to be unique)
+        :param supports_batches: True if the client accepts BackendJobDoneBatch messages
         """
         self.name = name
+        self.supports_batches = supports_batches
 
 
-class ClientNewJob(metaclass=MessageMeta, msgtype="client_new_job"):
+class ClientNewJob(metaclass=MessageMeta, msgtype="client_new_job", large_fields=("inputdata",)):
     """
         Creates a new job
         B->A.
@@ -86,6 +88,15 @@ class ClientGetQueue(metaclass=MessageMeta, msgtype="client_get_queue"):
 
     def __init__(self): pass
 
+
+class ClientSubscribeQueue(metaclass=MessageMeta, msgtype="client_subscribe_queue"):
+    """
+       Ask the backend to send a snapshot of its job queue (BackendQueueSnapshot), followed by the changes of the queue
+       (BackendQueueDelta and BackendQueueWaitTimes). Sending it again restarts the subscription with a new snapshot.
+    """
+
+    def __init__(self): pass
+
 #################################################################
 #                                                               #
 #                      Backend to Client                        #
@@ -105,6 +116,20 @@ class BackendUpdateEnvironments(metaclass=MessageMeta, msgtype="backend_update_e
         self.available_environments = available_environments
 
 
+class BackendKnownJobs(metaclass=MessageMeta, msgtype="backend_known_jobs"):
+    """
+        Sent after a ClientHello: gives the jobs of the client that the backend is still running or waiting to run,
+        e.g. after a reconnection of the client or a restart of the backend. The client should consider the other
+        jobs it sent before the ClientHello as lost.
+    """
+
+    def __init__(self, job_ids: List[ClientJobId]):
+        """
+            :param job_ids: list of the job ids
+        """
+        self.job_ids = job_ids
+
+
 class BackendJobStarted(metaclass=MessageMeta, msgtype="backend_job_started"):
     """
         Indicates to the backend that a job started
@@ -117,7 +142,7 @@ class BackendJobStarted(metaclass=MessageMeta, msgtype="backend_job_started"):
         self.job_id = job_id
 
 
-class BackendJobDone(metaclass=MessageMeta, msgtype="backend_job_done"):
+class BackendJobDone(metaclass=MessageMeta, msgtype="backend_job_done", large_fields=("archive",)):
     """
         Gives the result of a job.
     """
@@ -155,6 +180,18 @@ class BackendJobDone(metaclass=MessageMeta, msgtype="backend_job_done"):
         self.stderr = stderr
 
 
+class BackendJobDoneBatch(metaclass=MessageMeta, msgtype="backend_job_done_batch"):
+    """
+        Gives the results of multiple jobs at once. Only sent to clients that support batches (see ClientHello).
+    """
+
+    def __init__(self, messages: List[bytes]):
+        """
+        :param messages: list of dumped BackendJobDone messages, in the order in which they would have been sent
+        """
+        self.messages = messages
+
+
 class BackendJobSSHDebug(metaclass=MessageMeta, msgtype="backend_job_ssh_debug"):
     """
         Gives the necessary info to SSH into a job running in ssh debug mode
@@ -176,11 +213,11 @@ class BackendGetQueue(metaclass=MessageMeta, msgtype="backend_get_queue"):
     """
         Send the status of the job queue to the client
     """
-    def __init__(self, jobs_running: List[Tuple[ClientJobId, bool, str, str, str, int, int]],
-                       jobs_waiting: List[Tuple[ClientJobId, bool, str, str, int]]):
+    def __init__(self, jobs_running: List[Tuple[ClientJobId, bool, str, str, str, int, int, int]],
+                       jobs_waiting: List[Tuple[ClientJobId, bool, str, str, int, int, int]]):
         """
         :param jobs_running: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, started_at, max_tuime)
+            (job_id, is_current_client_job, agent_name, info, launcher, started_at, max_time, expected_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
@@ -189,18 +226,84 @@ class BackendGetQueue(metaclass=MessageMeta, msgtype="backend_get_queue"):
             - launcher is the name of the launcher, which may be anything
             - started_at the time (in seconds since UNIX epoch) at which the job started
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
         :param jobs_waiting: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, max_time)
+            (job_id, is_current_client_job, info, launcher, max_time, expected_time, wait_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
             - info is "courseid/taskid"
             - launcher is the name of the launcher, which may be anything
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
+            - wait_time the expected time (in seconds) before the job starts, or -1 if no agent can run the job
+        """
+        self.jobs_running = jobs_running
+        self.jobs_waiting = jobs_waiting
+
+class BackendQueueSnapshot(metaclass=MessageMeta, msgtype="backend_queue_snapshot"):
+    """
+        Send the status of the job queue to a client that subscribed to it (see ClientSubscribeQueue)
+    """
+    def __init__(self, sequence: int,
+                 jobs_running: List[Tuple[ClientJobId, bool, str, str, str, int, int, int]],
+                 jobs_waiting: List[Tuple[ClientJobId, bool, str, str, int, int, int]]):
+        """
+        :param sequence: sequence number of the message. The snapshot starts a new sequence at 0.
+        :param jobs_running: the running jobs, in the same form as in BackendGetQueue
+        :param jobs_waiting: the waiting jobs, in the same form as in BackendGetQueue, in the order in which they will run
         """
+        self.sequence = sequence
         self.jobs_running = jobs_running
         self.jobs_waiting = jobs_waiting
 
+
+class BackendQueueDelta(metaclass=MessageMeta, msgtype="backend_queue_delta"):
+    """
+        Send a change of the job queue to a client that subscribed to it
+    """
+    def __init__(self, sequence: int, event: str, job: Tuple):
+        """
+        :param sequence: sequence number of the message. If it is not the sequence number of the previous message
+                         plus one, messages were lost, and the client should subscribe again.
+        :param event: one of
+            - "queued": a new job is waiting. job is in the same form as the waiting jobs in BackendGetQueue.
+            - "started": a job was sent to an agent. job is in the same form as the running jobs in BackendGetQueue.
+            - "done": a running job ended. job is (job_id, is_current_client_job)
+            - "killed": a waiting job was killed. job is (job_id, is_current_client_job)
+        :param job: the job, see event
+        """
+        self.sequence = sequence
+        self.event = event
+        self.job = job
+
+
+class BackendQueueDeltaBatch(metaclass=MessageMeta, msgtype="backend_queue_delta_batch"):
+    """
+        Gives multiple changes of the job queue at once. Only sent to clients that support batches (see ClientHello).
+    """
+
+    def __init__(self, messages: List[bytes]):
+        """
+        :param messages: list of dumped BackendQueueDelta messages, in the order in which they would have been sent
+        """
+        self.messages = messages
+
+
+class BackendQueueWaitTimes(metaclass=MessageMeta, msgtype="backend_queue_wait_times"):
+    """
+        Send, regularly, the estimated waiting time of the waiting jobs of a client that subscribed to the job queue
+    """
+    def __init__(self, sequence: int, wait_times: Dict[ClientJobId, int]):
+        """
+        :param sequence: sequence number of the message, see BackendQueueDelta
+        :param wait_times: the expected time (in seconds) before each waiting job of the client starts,
+                           or -1 if no agent can run the job
+        """
+        self.sequence = sequence
+        self.wait_times = wait_times
+
+
 #################################################################
 #                                                               #
 #                      Backend to Agent                         #
@@ -208,7 +311,7 @@ class BackendGetQueue(metaclass=MessageMeta, msgtype="backend_get_queue"):
 #################################################################
 
 
-class BackendNewJob(metaclass=MessageMeta, msgtype="backend_new_job"):
+class BackendNewJob(metaclass=MessageMeta, msgtype="backend_new_job", large_fields=("inputdata",)):
     """
         Creates a new job
         B->A.
@@ -238,6 +341,19 @@ class BackendNewJob(metaclass=MessageMeta, msgtype="backend_new_job"):
         self.environment_parameters = environment_parameters
 
 
+class BackendNewJobBatch(metaclass=MessageMeta, msgtype="backend_new_job_batch"):
+    """
+        Creates multiple jobs at once. Only sent to agents that support batches (see AgentHello).
+        B->A.
+    """
+
+    def __init__(self, messages: List[bytes]):
+        """
+        :param messages: list of dumped BackendNewJob messages, in the order in which they would have been sent
+        """
+        self.messages = messages
+
+
 class BackendKillJob(metaclass=MessageMeta, msgtype="backend_kill_job"):
     """
         Kills a running job.
@@ -263,7 +379,8 @@ class AgentHello(metaclass=MessageMeta, msgtype="agent_hello"):
         Let the agent say hello and announce which environments it has available
     """
 
-    def __init__(self, friendly_name: str, available_job_slots: int, available_environments: Dict[str, Dict[str, Any]]):
+    def __init__(self, friendly_name: str, available_job_slots: int, available_environments: Dict[str, Dict[str, Any]],
+                 supports_batches: bool, running_jobs: List[BackendJobId], resources: Dict[str, int]):
         """
             :param friendly_name: a string containing a friendly name to identify agent
             :param available_job_slots: an integer giving the number of concurrent
@@ -276,11 +393,19 @@ class AgentHello(metaclass=MessageMeta, msgtype="agent_hello"):
                     "type": "agent type id"        # type of the environment
                 }
             }
+            :param supports_batches: True if the agent accepts BackendNewJobBatch messages
+            :param running_jobs: jobs that the agent is still running, when it says hello again to the backend
+            :param resources: resources that the agent shares between its jobs, e.g. {"memory": 16384} (in MB). The
+                backend only sends a job to the agent if the job fits in its free resources. Resources that are not
+                given are not limited.
         """
 
         self.friendly_name = friendly_name
         self.available_job_slots = available_job_slots
         self.available_environments = available_environments
+        self.supports_batches = supports_batches
+        self.running_jobs = running_jobs
+        self.resources = resources
 
 class AgentJobStarted(metaclass=MessageMeta, msgtype="agent_job_started"):
     """
@@ -295,7 +420,7 @@ class AgentJobStarted(metaclass=MessageMeta, msgtype="agent_job_started"):
         self.job_id = job_id
 
 
-class AgentJobDone(metaclass=MessageMeta, msgtype="agent_job_done"):
+class AgentJobDone(metaclass=MessageMeta, msgtype="agent_job_done", large_fields=("archive",)):
     """
         Gives the result of a job.
         A->B.
@@ -352,6 +477,40 @@ class AgentJobSSHDebug(metaclass=MessageMeta, msgtype="agent_job_ssh_debug"):
         self.password = password
 
 
+#################################################################
+#                                                               #
+#                  Backend shard to Backend shard               #
+#                                                               #
+#################################################################
+
+
+class BackendShardStealJobs(metaclass=MessageMeta, msgtype="backend_shard_steal_jobs"):
+    """
+        Sent by a shard of a sharded backend to the other shards when its number of free agent slots changes.
+        The other shards give it (BackendShardGiveJobs) the waiting jobs that none of their own agents can run.
+    """
+
+    def __init__(self, environments: List[str], nb_jobs: int):
+        """
+        :param environments: the environments of the agents that have free slots
+        :param nb_jobs: the number of free slots. 0 cancels the previous request.
+        """
+        self.environments = environments
+        self.nb_jobs = nb_jobs
+
+
+class BackendShardGiveJobs(metaclass=MessageMeta, msgtype="backend_shard_give_jobs"):
+    """
+        Gives waiting jobs to a shard of a sharded backend that asked for them with BackendShardStealJobs
+    """
+
+    def __init__(self, jobs: List[Tuple[bytes, float, bytes]]):
+        """
+        :param jobs: a list of tuples (client_addr, insert_time, ClientNewJob dumped with .dump())
+        """
+        self.jobs = jobs
+
+
 #################################################################
 #                                                               #
 #                           Heartbeat                           #
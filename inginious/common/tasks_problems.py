@@ -246,6 +246,7 @@ class MultipleChoiceProblem(Problem):
         self._success_message = content.get("success_message", None)
 
         self._choices = good_choices + bad_choices
+        self._choices_by_index = {choice["index"]: choice for choice in self._choices}
 
     @classmethod
     def get_type(cls):
@@ -257,10 +258,7 @@ class MultipleChoiceProblem(Problem):
 
     def get_choice_with_index(self, index):
         """ Return the choice with index=index """
-        for entry in self._choices:
-            if entry["index"] == index:
-                return entry
-        return None
+        return self._choices_by_index.get(index)
 
     def input_type(self):
         return list if self._multiple else str
@@ -290,11 +288,9 @@ class MultipleChoiceProblem(Problem):
         msgs = []
         invalid_count = 0
         if self._multiple:
+            answers = set(task_input[self.get_id()])
             for choice in self._choices:
-                if choice["valid"] and not choice["index"] in task_input[self.get_id()] and not str(choice["index"]) in task_input[self.get_id()]:
-                    valid = False
-                    invalid_count += 1
-                elif not choice["valid"] and (choice["index"] in task_input[self.get_id()] or str(choice["index"]) in task_input[self.get_id()]):
+                if choice["valid"] != (choice["index"] in answers or str(choice["index"]) in answers):
                     valid = False
                     invalid_count += 1
             for i in task_input[self.get_id()]:
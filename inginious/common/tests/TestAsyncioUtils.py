@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import threading
+import time
+
+from inginious.common.asyncio_utils import MeasuredThreadPoolExecutor
+
+
+class TestMeasuredThreadPoolExecutor(object):
+    def test_wait_times(self):
+        executor = MeasuredThreadPoolExecutor(1, "test")
+        release = threading.Event()
+        blocking = executor.submit(release.wait)
+        waiting = executor.submit(threading.current_thread)
+        time.sleep(0.05)
+        assert executor.stats()["queued"] == 1
+        release.set()
+
+        assert blocking.result() is True
+        assert waiting.result().name.startswith("test")
+        stats = executor.stats()
+        assert stats["calls"] == 2 and stats["queued"] == 0
+        assert stats["wait_max"] >= 0.05 and stats["wait_p99"] == stats["wait_max"]
+        executor.shutdown()
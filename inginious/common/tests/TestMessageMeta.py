@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import msgpack
+
+from inginious.common.message_meta import MessageMeta, Payload
+from inginious.common.messages import BackendJobDone, ClientNewJob, Ping
+
+
+class TestMessageMeta(object):
+    def _job_done(self, grade=100.0):
+        return BackendJobDone("42", ("success", ""), grade, {}, {}, {}, "", b"archive", "", "")
+
+    def test_dump_load(self):
+        message = MessageMeta.load(self._job_done().dump())
+        assert isinstance(message, BackendJobDone)
+        assert (message.job_id, message.result, message.archive) == ("42", ("success", ""), b"archive")
+        assert message.type == "backend_job_done"
+        assert isinstance(MessageMeta.load(Ping().dump()), Ping)
+
+    def test_immutable(self):
+        message = self._job_done()
+        for action in (lambda: setattr(message, "grade", 0.0), lambda: setattr(message, "other", 0),
+                       lambda: delattr(message, "grade")):
+            try:
+                action()
+                assert False
+            except (TypeError, AttributeError):
+                pass
+        assert not hasattr(message, "__dict__")
+
+    def test_invalid_messages(self):
+        for dumped in (msgpack.dumps((1, "42")), msgpack.dumps({"type": "ping"}), msgpack.dumps(Ping.__type_id__ + 1),
+                       msgpack.dumps((BackendJobDone.__type_id__, "42"))):
+            try:
+                MessageMeta.load(dumped)
+                assert False
+            except TypeError:
+                pass
+
+    def test_validation_levels(self):
+        dumped = msgpack.dumps((BackendJobDone.__type_id__, "42", ("success", ""), "not a float", {}, {}, {}, "", None, "", ""))
+        assert MessageMeta.load(dumped).grade == "not a float"
+        MessageMeta.VALIDATION_LEVEL = MessageMeta.VALIDATE_TYPES
+        try:
+            for action in (lambda: MessageMeta.load(dumped), lambda: self._job_done("not a float")):
+                try:
+                    action()
+                    assert False
+                except TypeError:
+                    pass
+            assert MessageMeta.load(self._job_done(100).dump()).grade == 100
+        finally:
+            MessageMeta.VALIDATION_LEVEL = MessageMeta.VALIDATE_FIELDS
+
+    def test_peek(self):
+        dumped = ClientNewJob("42", 0, "course", "task", {"file": b"x" * 1000}, "default", {}, False, "test").dump()
+        assert MessageMeta.peek(dumped, ("type", "job_id", "environment")) == {"type": "client_new_job", "job_id": "42",
+                                                                              "environment": "default"}
+        assert MessageMeta.peek(msgpack.dumps((1, 2))) == {}
+
+    def test_dump_frames(self):
+        message = ClientNewJob("42", 0, "course", "task", {"small": b"x", "file": {"value": b"y" * 1000}}, "default", {},
+                               False, "test")
+        frames = MessageMeta.dump_frames(message, 100)
+        assert frames[1:] == [b"y" * 1000] and len(frames[0]) < 1000
+        assert MessageMeta.load(frames[0], frames[1:]).inputdata == message.inputdata
+        assert MessageMeta.dump_frames(message, None) == [message.dump()]
+        assert MessageMeta.dump_frames(message, 10000) == [message.dump()]
+        assert MessageMeta.has_payloads(message, 100) and not MessageMeta.has_payloads(message, 10000)
+
+    def test_payloads(self):
+        class Frame(object):
+            def __init__(self, value):
+                self.bytes = value
+
+            def __len__(self):
+                return len(self.bytes)
+
+        frame = Frame(b"archive")
+        message = BackendJobDone("42", ("success", ""), 100.0, {}, {}, {}, "", Payload(frame), "", "")
+        # Payloads are forwarded in their frame whatever their size, or copied when the message is dumped inline
+        assert MessageMeta.dump_frames(message, 100)[1:] == [frame]
+        assert MessageMeta.load(message.dump()).archive == b"archive"
@@ -19,6 +19,7 @@ from inginious.frontend.cookieless_app import CookieLessCompatibleApplication
 from inginious.frontend.courses import WebAppCourse
 from inginious.frontend.plugin_manager import PluginManager
 from inginious.frontend.session_mongodb import MongoStore
+from inginious.frontend.local_evaluator import LocalEvaluator
 from inginious.frontend.submission_manager import WebAppSubmissionManager
 from inginious.frontend.submission_manager import update_pending_jobs
 from inginious.frontend.tasks import WebAppTask
@@ -110,10 +111,12 @@ def _put_configuration_defaults(config):
     return config
 
 
-def _close_app(app, mongo_client, client):
+def _close_app(app, mongo_client, client, local_evaluator):
     """ Ensures that the app is properly closed """
     app.stop()
     client.close()
+    if local_evaluator is not None:
+        local_evaluator.close()
     mongo_client.close()
 
 
@@ -216,7 +219,11 @@ def get_app(config):
 
     lti_outcome_manager = LTIOutcomeManager(database, user_manager, course_factory)
 
-    submission_manager = WebAppSubmissionManager(client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager)
+    local_evaluation = config.get("local_evaluation", [])
+    local_evaluator = LocalEvaluator(local_evaluation) if local_evaluation else None
+
+    submission_manager = WebAppSubmissionManager(client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager,
+                                                 local_evaluator)
 
     template_helper = TemplateHelper(plugin_manager, user_manager, 'frontend/templates',
                                      'frontend/templates/layout',
@@ -296,4 +303,4 @@ def get_app(config):
     # Start the inginious.backend
     client.start()
 
-    return appli.wsgifunc(), lambda: _close_app(appli, mongo_client, client)
+    return appli.wsgifunc(), lambda: _close_app(appli, mongo_client, client, local_evaluator)
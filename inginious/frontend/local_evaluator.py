@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Grading of the submissions that need no container, in the process of the webapp """
+import logging
+
+from inginious.agent import CannotCreateJobException
+from inginious.agent.mcq_agent import check_mcq_answers, load_translations
+from inginious.common.asyncio_utils import MeasuredThreadPoolExecutor
+
+
+class LocalEvaluator(object):
+    """
+        Grades the submissions of some environment types directly in the webapp, in a pool of threads, instead of
+        sending them to the backend and to an agent. Only the environment types whose answers are checked without
+        running any code can be graded this way: see EVALUATORS.
+    """
+
+    def __init__(self, environment_types, threads=2):
+        """
+        :param environment_types: list of the environment types graded locally, among the keys of EVALUATORS
+        :param threads: number of threads grading the submissions
+        """
+        unknown = set(environment_types) - set(self.EVALUATORS)
+        if unknown:
+            raise ValueError("Submissions of environment type(s) %s cannot be graded by the webapp" % ", ".join(sorted(unknown)))
+        self._environment_types = set(environment_types)
+        self._logger = logging.getLogger("inginious.webapp.local_evaluator")
+        self._executor = MeasuredThreadPoolExecutor(threads, "local-evaluator")
+        self._translations = load_translations()
+
+    def handles(self, task, debug=False):
+        """ Returns True if the submissions to the task are graded locally. Debug submissions are always sent to the backend. """
+        return not debug and task.get_environment_type() in self._environment_types
+
+    def new_job(self, task, inputdata, callback):
+        """
+        Grades a submission in the background
+        :param callback: a function called, from a thread of the pool, with the same arguments as the callbacks of
+            Client.new_job
+        """
+        self._executor.submit(self._run, task, inputdata, callback)
+
+    def stats(self):
+        """ Returns the statistics of the pool of threads (see MeasuredThreadPoolExecutor.stats) """
+        return self._executor.stats()
+
+    def close(self):
+        """ Stops the threads of the pool, once the queued submissions are graded """
+        self._executor.shutdown(wait=True)
+
+    def _run(self, task, inputdata, callback):
+        try:
+            result, text, grade, problems = self.EVALUATORS[task.get_environment_type()](self, task, inputdata)
+        except CannotCreateJobException as e:
+            self._logger.warning("Cannot grade %s/%s in the webapp: %s", task.get_course_id(), task.get_id(), e.message)
+            result, text, grade, problems = "crash", e.message, 0.0, {}
+        except Exception:
+            self._logger.exception("Error while grading %s/%s in the webapp", task.get_course_id(), task.get_id())
+            result, text, grade, problems = "crash", "An unknown error occurred while grading the submission.", 0.0, {}
+
+        try:
+            callback((result, text), round(grade, 2), problems, {}, {}, "", None, None, None)
+        except Exception:
+            self._logger.exception("Failed to call the callback function for %s/%s", task.get_course_id(), task.get_id())
+
+    def _evaluate_mcq(self, task, inputdata):
+        return check_mcq_answers(task, inputdata, self._translations)
+
+    #: functions grading the submissions, by environment type
+    EVALUATORS = {"mcq": _evaluate_mcq}
@@ -4,6 +4,7 @@
 # more information about the licensing of this file.
 
 """ Manages submissions """
+import collections
 import io
 import gettext
 import logging
@@ -11,6 +12,7 @@ import os.path
 import tarfile
 import tempfile
 import time
+import uuid
 from datetime import datetime
 
 import bson
@@ -20,19 +22,23 @@ from bson.objectid import ObjectId
 from pymongo.collection import ReturnDocument
 
 import inginious.common.custom_yaml
+from inginious.common.base import percentile
 from inginious.frontend.parsable_text import ParsableText
 
 
 class WebAppSubmissionManager:
     """ Manages submissions. Communicates with the database and the client. """
 
-    def __init__(self, client, user_manager, database, gridfs, hook_manager, lti_outcome_manager):
+    def __init__(self, client, user_manager, database, gridfs, hook_manager, lti_outcome_manager, local_evaluator=None):
         """
         :type client: inginious.client.client.AbstractClient
         :type user_manager: inginious.frontend.user_manager.UserManager
         :type database: pymongo.database.Database
         :type gridfs: gridfs.GridFS
         :type hook_manager: inginious.common.hook_manager.HookManager
+        :param local_evaluator: LocalEvaluator grading the submissions of some environment types in the webapp, instead
+            of sending them to the backend, or None
+        :type local_evaluator: inginious.frontend.local_evaluator.LocalEvaluator
         :return:
         """
         self._client = client
@@ -42,6 +48,12 @@ class WebAppSubmissionManager:
         self._hook_manager = hook_manager
         self._logger = logging.getLogger("inginious.webapp.submissions")
         self._lti_outcome_manager = lti_outcome_manager
+        self._local_evaluator = local_evaluator
+
+        # Time between the submission of the recent jobs and their result, by environment type and by path ("backend"
+        # or "local"), and last time they were logged
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=1000))
+        self._latencies_logged_at = time.time()
 
     def _job_done_callback(self, submissionid, task, result, grade, problems, tests, custom, state, archive, stdout,
                            stderr, newsub=True):
@@ -188,11 +200,15 @@ class WebAppSubmissionManager:
             submission["tests"] = {}  # Be sure tags are reinitialized
             submissionid = self._database.submissions.insert(submission)
 
-        jobid = self._client.new_job(1, task, inputdata,
-                                     (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
-                                      self._job_done_callback(submissionid, task, result, grade, problems, tests,
-                                                              custom, state, archive, stdout, stderr, copy)),
-                                     "Frontend - {}".format(submission["username"]), debug, ssh_callback)
+        graded_locally = self._is_graded_locally(task, debug)
+        callback = self._timed_callback(task, graded_locally, (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
+                                                               self._job_done_callback(submissionid, task, result, grade, problems, tests,
+                                                                                       custom, state, archive, stdout, stderr, copy)))
+        if graded_locally:
+            jobid = str(uuid.uuid4())
+        else:
+            jobid = self._client.new_job(1, task, inputdata, callback, "Frontend - {}".format(submission["username"]),
+                                         debug, ssh_callback)
 
         # Clean the submission document in db
         self._database.submissions.update(
@@ -202,6 +218,10 @@ class WebAppSubmissionManager:
                         "custom": ""}
              })
 
+        if graded_locally:
+            # Only once the job id is in the submission, so that the result is not ignored
+            self._local_evaluator.new_job(task, inputdata, callback)
+
         if not copy:
             self._logger.info("Replaying submission %s - %s - %s - %s", submission["username"], submission["courseid"],
                               submission["taskid"], submission["_id"])
@@ -210,6 +230,36 @@ class WebAppSubmissionManager:
                               submission["courseid"],
                               submission["taskid"], submission["_id"], self._user_manager.session_username())
 
+    def _is_graded_locally(self, task, debug):
+        """ Returns True if the submissions to the task are graded by the local evaluator instead of the backend """
+        return self._local_evaluator is not None and self._local_evaluator.handles(task, debug)
+
+    def _timed_callback(self, task, graded_locally, callback):
+        """ Wraps the callback of a job, to measure the time until the result of the job """
+        key = (task.get_environment_type(), "local" if graded_locally else "backend")
+        submitted_at = time.time()
+
+        def timed_callback(*args):
+            self._latencies[key].append(time.time() - submitted_at)
+            callback(*args)
+            if time.time() - self._latencies_logged_at > 60:
+                self._latencies_logged_at = time.time()
+                for (environment_type, path), stats in sorted(self.get_job_latencies().items()):
+                    self._logger.info("Jobs of environment type %s, through %s: p50 %.0f ms, p99 %.0f ms over %i jobs",
+                                      environment_type, path, stats["p50"] * 1000, stats["p99"] * 1000, stats["jobs"])
+        return timed_callback
+
+    def get_job_latencies(self):
+        """
+        Returns the time between the submission of the recent jobs and their result, by environment type and by path:
+        {(environment_type, "backend" or "local"): {"jobs": number of jobs measured, "p50": ..., "p99": ... (in s)}}
+        """
+        latencies = {}
+        for key, values in list(self._latencies.items()):
+            values = list(values)
+            latencies[key] = {"jobs": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99)}
+        return latencies
+
     def get_available_environments(self):
         """:return a list of available environments """
         return self._client.get_available_environments()
@@ -280,17 +330,24 @@ class WebAppSubmissionManager:
 
         ssh_callback = lambda host, port, password: self._handle_ssh_callback(submissionid, host, port, password)
 
-        jobid = self._client.new_job(0, task, inputdata,
-                                     (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
-                                      self._job_done_callback(submissionid, task, result, grade, problems, tests,
-                                                              custom, state, archive, stdout, stderr, True)),
-                                     "Frontend - {}".format(username), debug, ssh_callback)
+        graded_locally = self._is_graded_locally(task, debug)
+        callback = self._timed_callback(task, graded_locally, (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
+                                                               self._job_done_callback(submissionid, task, result, grade, problems, tests,
+                                                                                       custom, state, archive, stdout, stderr, True)))
+        if graded_locally:
+            jobid = str(uuid.uuid4())
+        else:
+            jobid = self._client.new_job(0, task, inputdata, callback, "Frontend - {}".format(username), debug, ssh_callback)
 
         self._database.submissions.update(
             {"_id": submissionid, "status": "waiting"},
             {"$set": {"jobid": jobid}}
         )
 
+        if graded_locally:
+            # Only once the job id is in the submission, so that the result is not ignored
+            self._local_evaluator.new_job(task, inputdata, callback)
+
         self._logger.info("New submission from %s - %s - %s/%s - %s", self._user_manager.session_username(),
                           self._user_manager.session_email(), task.get_course_id(), task.get_id(),
                           web.ctx['ip'])
@@ -633,7 +690,7 @@ class WebAppSubmissionManager:
 
         Return a tuple of two lists (None, None):
         jobs_running: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, started_at, max_time)
+            (job_id, is_current_client_job, agent_name, info, launcher, started_at, max_time, expected_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
@@ -642,14 +699,17 @@ class WebAppSubmissionManager:
             - launcher is the name of the launcher, which may be anything
             - started_at the time (in seconds since UNIX epoch) at which the job started
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
         jobs_waiting: a list of tuples in the form
-            (job_id, is_current_client_job, info, launcher, max_time)
+            (job_id, is_current_client_job, info, launcher, max_time, expected_time, wait_time)
             where
             - job_id is a job id. It may be from another client.
             - is_current_client_job is a boolean indicating if the client that asked the request has started the job
             - info is "courseid/taskid"
             - launcher is the name of the launcher, which may be anything
             - max_time the maximum time that can be used, or -1 if no timeout is set
+            - expected_time the expected run time of the job (in seconds), based on the previous jobs of the task, or -1 if unknown
+            - wait_time the expected time (in seconds) before the job starts, or -1 if no agent can run the job
         """
         return self._client.get_job_queue_snapshot()
 
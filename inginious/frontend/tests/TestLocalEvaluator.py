@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import os
+import tempfile
+
+from inginious.common.course_factory import create_factories
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.tasks_problems import MatchProblem, MultipleChoiceProblem
+from inginious.frontend.local_evaluator import LocalEvaluator
+
+TASK = """name: Quiz
+environment_id: mcq
+environment_type: mcq
+problems:
+    mc:
+        type: multiple_choice
+        multiple: true
+        choices:
+          - text: A
+            valid: true
+          - text: B
+          - text: C
+            valid: true
+    match:
+        type: match
+        answer: '42'
+"""
+
+
+class TestLocalEvaluator(object):
+    def setup_method(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.dir.name, "course", "quiz"))
+        with open(os.path.join(self.dir.name, "course", "course.yaml"), "w") as f:
+            f.write("name: Course\nadmins: []\naccessible: true\n")
+        with open(os.path.join(self.dir.name, "course", "quiz", "task.yaml"), "w") as f:
+            f.write(TASK)
+        fs = LocalFSProvider(self.dir.name)
+        course_factory, _ = create_factories(fs, {"multiple_choice": MultipleChoiceProblem, "match": MatchProblem})
+        self.task = course_factory.get_task("course", "quiz")
+
+    def teardown_method(self):
+        self.dir.cleanup()
+
+    def test_local_evaluator(self):
+        evaluator = LocalEvaluator(["mcq"])
+        assert evaluator.handles(self.task) and not evaluator.handles(self.task, debug="ssh")
+
+        results = []
+        evaluator.new_job(self.task, {"mc": ["0", "2"], "match": "41", "@lang": "en"}, lambda *args: results.append(args))
+        evaluator.close()
+        (result, text), grade, problems = results[0][:3]
+        assert result == "failed" and grade == 50.0
+        assert problems["match"] == ("failed", "Wrong answer")
+
+    def test_local_evaluator_unknown_type(self):
+        try:
+            LocalEvaluator(["docker"])
+            assert False
+        except ValueError:
+            pass
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+import io
+
+import web
+from bson.objectid import ObjectId
+
+from inginious.frontend.submission_manager import WebAppSubmissionManager
+
+
+class FakeCollection(object):
+    """ The methods of a pymongo collection used by the submission manager, on documents kept in memory """
+
+    def __init__(self, documents=None):
+        self.documents = documents or []
+
+    def find_one(self, spec, projection=None):
+        for document in self.documents:
+            if all(document.get(key) == value for key, value in spec.items()):
+                return dict(document)
+        return None
+
+    def insert(self, document):
+        document["_id"] = ObjectId()
+        self.documents.append(dict(document))
+        return document["_id"]
+
+    def update(self, spec, update):
+        for document in self.documents:
+            if all(document.get(key) == value for key, value in spec.items()):
+                document.update(update.get("$set", {}))
+                for key in update.get("$unset", {}):
+                    document.pop(key, None)
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.submissions = FakeCollection()
+        self.user_tasks = FakeCollection([{"courseid": "course", "taskid": "quiz", "username": "student", "tried": 0}])
+
+
+class FakeGridFS(object):
+    def __init__(self):
+        self.files = {}
+
+    def put(self, data):
+        self.files[len(self.files)] = data
+        return len(self.files) - 1
+
+    def get(self, fileid):
+        return io.BytesIO(self.files[fileid])
+
+
+class FakeUserManager(object):
+    def session_logged_in(self):
+        return True
+
+    def session_username(self):
+        return "student"
+
+    def session_email(self):
+        return "student@inginious.org"
+
+    def session_language(self):
+        return "en"
+
+    def session_lti_info(self):
+        return None
+
+
+class FakeHookManager(object):
+    def call_hook(self, name, **kwargs):
+        return []
+
+
+class FakeClient(object):
+    """ Records the jobs sent to the backend """
+
+    def __init__(self):
+        self.callbacks = []
+
+    def new_job(self, priority, task, inputdata, callback, launcher_name=None, debug=False, ssh_callback=None):
+        self.callbacks.append(callback)
+        return "backend-job"
+
+
+class FakeTask(object):
+    def get_course_id(self):
+        return "course"
+
+    def get_id(self):
+        return "quiz"
+
+    def get_environment_type(self):
+        return "mcq"
+
+    def get_response_type(self):
+        return "rst"
+
+    def get_problems(self):
+        return []
+
+    def get_stored_submissions(self):
+        return 0
+
+    def is_group_task(self):
+        return False
+
+
+class FakeEvaluator(object):
+    """ Grades the submissions at once, and records the job id their submission had when they were given """
+
+    def __init__(self, database):
+        self.database = database
+        self.jobids = []
+
+    def handles(self, task, debug=False):
+        return not debug
+
+    def new_job(self, task, inputdata, callback):
+        self.jobids.append(self.database.submissions.documents[-1].get("jobid"))
+        callback(("success", "Perfect"), 100.0, {}, {}, {}, "", None, "", "")
+
+
+class TestSubmissionManager(object):
+    def setup_method(self):
+        web.ctx["ip"] = "127.0.0.1"
+        self.database = FakeDatabase()
+        self.client = FakeClient()
+        self.evaluator = FakeEvaluator(self.database)
+        self.manager = WebAppSubmissionManager(self.client, FakeUserManager(), self.database, FakeGridFS(),
+                                               FakeHookManager(), None, self.evaluator)
+        self.done = []
+        self.manager._job_done_callback = lambda *args: self.done.append(args)
+
+    def test_local_job(self):
+        submissionid, _ = self.manager.add_job(FakeTask(), {"mc": ["0", "2"]})
+
+        # The job id is in the submission before the evaluator gets the job, so that its result is not ignored
+        jobid = self.database.submissions.find_one({"_id": submissionid})["jobid"]
+        assert self.evaluator.jobids == [jobid] and jobid is not None
+        assert self.client.callbacks == []
+
+        assert len(self.done) == 1
+        assert self.done[0][0] == submissionid and self.done[0][2] == ("success", "Perfect") and self.done[0][3] == 100.0
+        latencies = self.manager.get_job_latencies()
+        assert list(latencies) == [("mcq", "local")] and latencies[("mcq", "local")]["jobs"] == 1
+
+    def test_local_job_replayed(self):
+        submissionid, _ = self.manager.add_job(FakeTask(), {"mc": ["0", "2"]})
+        submission = self.database.submissions.find_one({"_id": submissionid})
+        self.manager.replay_job(FakeTask(), submission)
+
+        assert self.evaluator.jobids[1] == self.database.submissions.find_one({"_id": submissionid})["jobid"]
+        assert self.evaluator.jobids[1] != self.evaluator.jobids[0]
+        assert [args[0] for args in self.done] == [submissionid, submissionid]
+        assert self.manager.get_job_latencies()[("mcq", "local")]["jobs"] == 2
+
+    def test_debug_job_sent_to_backend(self):
+        submissionid, _ = self.manager.add_job(FakeTask(), {"mc": ["0", "2"]}, debug=True)
+        assert self.evaluator.jobids == []
+        assert self.database.submissions.find_one({"_id": submissionid})["jobid"] == "backend-job"
+        assert self.manager.get_job_latencies() == {}
+
+        self.client.callbacks[0](("failed", "Wrong"), 0.0, {}, {}, {}, "", None, "", "")
+        assert self.done[0][0] == submissionid
+        assert self.manager.get_job_latencies()[("mcq", "backend")]["jobs"] == 1
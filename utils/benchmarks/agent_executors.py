@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the latency of the calls that start and kill containers in the docker agent while the files of new jobs
+    are staged and those of finished jobs are deleted: with all these calls sent to a single thread pool, and with
+    the docker, staging and cleanup thread pools of the agent. Reports the p50/p99 latency of the start/kill calls,
+    and the waiting times of the calls reported by each pool (MeasuredThreadPoolExecutor).
+
+    No Docker daemon is needed: all the calls are simulated by sleeps.
+"""
+
+import argparse
+import asyncio
+import time
+
+from inginious.common.asyncio_utils import MeasuredThreadPoolExecutor
+from inginious.common.base import percentile
+
+
+async def benchmark(pools, args):
+    loop = asyncio.get_event_loop()
+    latencies = []
+
+    async def call(executor, duration, record=False):
+        start = time.perf_counter()
+        await loop.run_in_executor(executor, time.sleep, duration)
+        if record:
+            latencies.append(time.perf_counter() - start)
+
+    async def jobs():
+        for _ in range(args.rounds):
+            await asyncio.gather(*[call(pools["staging"], args.staging) for _ in range(args.concurrency)],
+                                 *[call(pools["cleanup"], args.cleanup) for _ in range(args.concurrency)])
+
+    async def lifecycle():
+        for _ in range(args.rounds * 10):
+            await asyncio.gather(*[call(pools["docker"], args.docker_call, True) for _ in range(4)])
+            await asyncio.sleep(args.staging / 10)
+
+    await asyncio.gather(jobs(), lifecycle())
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the latency of the calls to Docker of the agent while staging jobs")
+    parser.add_argument("--concurrency", help="Concurrency of the agent", default=8, type=int)
+    parser.add_argument("--rounds", help="Number of rounds of concurrency jobs staged and cleaned", default=10, type=int)
+    parser.add_argument("--staging", help="Duration of the staging of a job, in s", default=0.5, type=float)
+    parser.add_argument("--cleanup", help="Duration of the cleanup of a job, in s", default=0.3, type=float)
+    parser.add_argument("--docker-call", help="Duration of a start/kill call to Docker, in s", default=0.01, type=float)
+    args = parser.parse_args()
+
+    shared = MeasuredThreadPoolExecutor(args.concurrency + 4, "shared")
+    separate = {"docker": MeasuredThreadPoolExecutor(args.concurrency + 4, "docker"),
+                "staging": MeasuredThreadPoolExecutor(args.concurrency, "staging"),
+                "cleanup": MeasuredThreadPoolExecutor(2, "cleanup")}
+    print("pools     start/kill p50 (ms)  start/kill p99 (ms)  pool     wait p50 (ms)  wait p99 (ms)")
+    for name, pools in (("shared", dict.fromkeys(separate, shared)), ("separate", separate)):
+        latencies = asyncio.get_event_loop().run_until_complete(benchmark(pools, args))
+        for i, executor in enumerate(sorted(set(pools.values()), key=lambda executor: executor.name)):
+            stats = executor.stats()
+            print("%-8s  %19s  %19s  %-7s  %13.0f  %13.0f" % (
+                name if i == 0 else "", "%.0f" % (percentile(latencies, 50) * 1000) if i == 0 else "",
+                "%.0f" % (percentile(latencies, 99) * 1000) if i == 0 else "", executor.name,
+                stats["wait_p50"] * 1000, stats["wait_p99"] * 1000))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Microbenchmark of the job scheduler of the backend: queues jobs, and then simulates job done events from agents """
+
+import argparse
+import asyncio
+import logging
+import time
+
+from zmq.asyncio import Context
+
+from inginious.backend.backend import Backend
+from inginious.common.messages import AgentHello, AgentJobDone, ClientHello, ClientNewJob
+
+
+async def let_loop_run():
+    """ Lets the backend send its messages """
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def run_benchmark(nb_jobs, nb_agents, nb_slots, nb_environments, nb_idle_agents):
+    context = Context()
+    backend = Backend(context, "inproc://bench_backend_agent", "inproc://bench_backend_client")
+    environments = {"env%i" % i: {"id": "env%i" % i, "created": 0, "ports": [], "type": "docker"} for i in range(nb_environments)}
+
+    client_addr = b"client"
+    await backend.handle_client_hello(client_addr, ClientHello("bench", True))
+    agents = [("agent%i" % i).encode() for i in range(nb_agents)]
+    for agent_addr in agents:
+        await backend.handle_agent_hello(agent_addr, AgentHello(agent_addr.decode(), nb_slots, environments, True, [], {}))
+
+    # Agents whose free slots cannot run any of the queued jobs
+    idle_environments = {"idle": {"id": "idle", "created": 0, "ports": [], "type": "docker"}}
+    for i in range(nb_idle_agents):
+        await backend.handle_agent_hello(("idle%i" % i).encode(), AgentHello("idle%i" % i, nb_slots, idle_environments, True, [], {}))
+
+    start = time.perf_counter()
+    for i in range(nb_jobs):
+        msg = ClientNewJob(str(i), 0, "course", "task", {}, "env%i" % (i % nb_environments), {}, False, "bench")
+        await backend.handle_client_new_job(client_addr, msg)
+        await let_loop_run()
+    queue_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nb_events = 0
+    while backend._job_running:  # pylint: disable=protected-access
+        job_id, (agent_addr, _, _) = next(iter(backend._job_running.items()))  # pylint: disable=protected-access
+        await backend.handle_agent_job_done(agent_addr, AgentJobDone(job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", ""))
+        await let_loop_run()
+        nb_events += 1
+    done_time = time.perf_counter() - start
+
+    context.destroy(0)
+    return queue_time, done_time, nb_events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark of the backend job scheduler")
+    parser.add_argument("--jobs", help="Number of jobs to queue", default=10000, type=int)
+    parser.add_argument("--agents", help="Number of agents", default=40, type=int)
+    parser.add_argument("--slots", help="Number of slots per agent", default=25, type=int)
+    parser.add_argument("--environments", help="Number of environments", default=10, type=int)
+    parser.add_argument("--idle-agents", help="Number of additional agents that cannot run the queued jobs", default=10, type=int)
+    args = parser.parse_args()
+
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    queue_time, done_time, nb_events = loop.run_until_complete(run_benchmark(args.jobs, args.agents, args.slots, args.environments,
+                                                                                     args.idle_agents))
+    loop.close()
+
+    print("%i jobs, %i busy slots, %i idle slots, %i environments" % (args.jobs, args.agents * args.slots,
+                                                                      args.idle_agents * args.slots, args.environments))
+    print("Queueing:   %.2f s total, %.1f us/job" % (queue_time, queue_time / args.jobs * 10 ** 6))
+    print("Job done:   %.2f s total, %.1f us/event (%i events)" % (done_time, done_time / max(nb_events, 1) * 10 ** 6, nb_events))
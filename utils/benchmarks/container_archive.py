@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the transfer of the archive of a job, from its grading container to the backend, through the docker agent:
+    the archive is either sent by the container in base64 (as it used to be), or in binary (binary_archive). Reports
+    the bytes written by the container on its stdout, the bytes sent by the agent to the backend, and the peak memory
+    allocated by the agent (tracemalloc) from the reception of the stdout to the encoding of the AgentJobDone message.
+
+    The archives are random bytes, as incompressible as a tgz.
+"""
+
+import argparse
+import base64
+import os
+import struct
+import tracemalloc
+
+import msgpack
+
+from inginious.agent.docker_agent._container_output import ContainerOutputParser
+from inginious.common.message_meta import MessageMeta, ZMQUtils
+from inginious.common.messages import AgentJobDone
+
+
+def container_stdout(archive, binary, chunk_size):
+    """ The stdout of the container, split in chunks as the frames of the attach endpoint of Docker """
+    feedback = {"result": "success", "text": "ok", "grade": 100.0, "problems": {}, "tests": {}, "custom": {},
+                "archive": archive if binary else base64.b64encode(archive).decode('utf-8')}
+    message = msgpack.dumps({"type": "result", "result": feedback}, use_bin_type=True)
+    stdout = struct.pack('I', len(message)) + message
+    return [stdout[i:i + chunk_size] for i in range(0, len(stdout), chunk_size)]
+
+
+def agent(chunks):
+    """ What the agent does with the stdout: parse it, decode the archive and send the AgentJobDone message """
+    parser = ContainerOutputParser("benchmark", 2 ** 32 - 1)
+    result = None
+    for content in chunks:
+        for message in parser.feed(content):
+            result = message["result"]
+    archive = result["archive"]
+    if isinstance(archive, str):
+        archive = base64.b64decode(archive)
+    message = AgentJobDone("job", ("success", "ok"), 100.0, {}, {}, {}, "", archive, None, None)
+    return MessageMeta.dump_frames(message, ZMQUtils.PAYLOAD_THRESHOLD)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the transfer of the archive of a job by the docker agent")
+    parser.add_argument("--sizes", help="Sizes of the archives, in MB", default=[5, 100], type=int, nargs="+")
+    parser.add_argument("--chunk-size", help="Size of the chunks of stdout, in bytes", default=32 * 1024, type=int)
+    args = parser.parse_args()
+
+    print("archive (MB)  encoding  container stdout (MB)  agent to backend (MB)  agent peak memory (MB)")
+    for size in args.sizes:
+        archive = os.urandom(size * 1024 * 1024)
+        for binary in (False, True):
+            chunks = container_stdout(archive, binary, args.chunk_size)
+            tracemalloc.start()
+            frames = agent(chunks)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("%12i  %-8s  %21.1f  %21.1f  %22.1f" % (size, "binary" if binary else "base64",
+                                                         sum(map(len, chunks)) / 1024 / 1024,
+                                                         sum(map(len, frames)) / 1024 / 1024, peak / 1024 / 1024))
+            del chunks, frames
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the feedback calls of a grading script, with the inginious_container_api of the base container: either
+    each call reads and rewrites the whole feedback file (no feedback helper is running, as the container used to do),
+    or the calls are sent to the FeedbackHelper, that keeps the feedback in memory and writes it once when stopped.
+
+    A mix of per-problem results, messages, tags, custom values and grades is set, through the python API (in the
+    process of the benchmark) and through the feedback-* commands (one process per call). Reports the total time of
+    the calls, and checks that both modes give the same feedback.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_CONTAINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "base-containers", "base")
+sys.path.insert(0, BASE_CONTAINER)
+
+# In debug mode, the feedback is written in the current directory instead of /.__output
+import inginious_container_api
+inginious_container_api.DEBUG = True
+from inginious_container_api import feedback
+
+
+def api_calls(calls):
+    """ Sets the feedback through the python API """
+    for i in range(calls):
+        problem_id = "p%i" % (i % 100)
+        kind = i % 5
+        if kind == 0:
+            feedback.set_problem_result("success" if i % 3 else "failed", problem_id)
+        elif kind == 1:
+            feedback.set_problem_feedback("Test %i passed\n" % i, problem_id, True)
+        elif kind == 2:
+            feedback.set_tag("t%i" % i, True)
+        elif kind == 3:
+            feedback.set_custom_value("k%i" % i, i)
+        else:
+            feedback.set_grade(i * 100.0 / calls)
+
+
+def command_calls(calls):
+    """ Sets the feedback through the feedback-* commands, as a shell grading script does """
+    wrapper = "import sys, inginious_container_api; inginious_container_api.DEBUG = True; " \
+              "sys.argv = sys.argv[1:]; exec(open(sys.argv[0]).read())"
+    env = dict(os.environ, PYTHONPATH=BASE_CONTAINER)
+    for i in range(calls):
+        problem_id = "p%i" % (i % 100)
+        kind = i % 5
+        if kind == 0:
+            command = ["feedback-result", "-i", problem_id, "success" if i % 3 else "failed"]
+        elif kind == 1:
+            command = ["feedback-msg", "-a", "-i", problem_id, "-m", "Test %i passed\n" % i]
+        elif kind == 2:
+            command = ["tag-set", "t%i" % i, "true"]
+        elif kind == 3:
+            command = ["feedback-custom", "k%i" % i, str(i)]
+        else:
+            command = ["feedback-grade", str(i * 100.0 / calls)]
+        command[0] = os.path.join(BASE_CONTAINER, "bin", command[0])
+        subprocess.run([sys.executable, "-c", wrapper] + command, env=env, check=True)
+
+
+def measure(calls, run, helper):
+    """ Returns the time taken by the calls, and the feedback they gave """
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        open(feedback._feedback_file, 'w').close()  # pylint: disable=protected-access
+        start = time.perf_counter()
+        feedback_helper = None
+        if helper:
+            feedback_helper = feedback.FeedbackHelper()
+            feedback_helper.start()
+        run(calls)
+        if feedback_helper is not None:
+            feedback_helper.stop()
+        duration = time.perf_counter() - start
+        result = feedback.get_feedback()
+        os.chdir("/")
+    return duration, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the feedback calls of the grading scripts")
+    parser.add_argument("--calls", help="Number of calls through the python API", default=1000, type=int)
+    parser.add_argument("--command-calls", help="Number of calls through the feedback-* commands", default=1000, type=int)
+    args = parser.parse_args()
+
+    print("                 calls   file (s)  helper (s)  speedup")
+    for name, run, calls in (("python API", api_calls, args.calls), ("feedback-* commands", command_calls, args.command_calls)):
+        if calls <= 0:
+            continue
+        file_time, file_result = measure(calls, run, False)
+        helper_time, helper_result = measure(calls, run, True)
+        assert file_result == helper_result, "The feedback helper gave another feedback"
+        print("%20s  %5i  %9.3f  %10.3f  %6.1fx" % (name, calls, file_time, helper_time, file_time / helper_time))
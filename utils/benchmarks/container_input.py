@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures how a grading script reads the input of a job with the inginious_container_api of the base container:
+    the input file is either parsed at each call, and each template is parsed with one regex per field (as the
+    container used to do), or the parsed input is kept while the file is not modified, and the templates are parsed
+    together with one regex for all the fields. Reports the time taken to read each input, and to parse templates,
+    for an input of many fields.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+BASE_CONTAINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "base-containers", "base")
+sys.path.insert(0, BASE_CONTAINER)
+
+# In debug mode, the input is read from the current directory instead of /.__input
+import inginious_container_api
+inginious_container_api.DEBUG = True
+from inginious_container_api import input as container_input
+
+
+def legacy_load_input():
+    with open(container_input._input_file, 'r') as file:  # pylint: disable=protected-access
+        return json.loads(file.read().strip('\0').strip())
+
+
+def legacy_get_input(problem):
+    """ How get_input used to read the input """
+    input_data = legacy_load_input()
+    pbsplit = problem.split(":")
+    problem_input = input_data['input'][pbsplit[0]]
+    if isinstance(problem_input, dict) and "filename" in problem_input and "value" in problem_input:
+        if len(pbsplit) > 1 and pbsplit[1] == 'filename':
+            return problem_input["filename"]
+        return open(problem_input["value"], 'rb').read()
+    return problem_input
+
+
+def legacy_parse_template(input_filename, output_filename):
+    """ How parse_template used to parse a template """
+    data = legacy_load_input()
+    with open(input_filename, 'rb') as file:
+        template = file.read().decode("utf-8")
+    for field in data['input']:
+        subs = ["filename", "value"] if isinstance(data['input'][field], dict) and "filename" in data['input'][field] and "value" in data['input'][field] else [""]
+        for sub in subs:
+            displayed_field = field + (":" if sub else "") + sub
+            regex = re.compile("@([^@]*)@" + displayed_field + '@([^@]*)@')
+            for prefix, postfix in set(regex.findall(template)):
+                if sub == "value":
+                    text = open(data['input'][field][sub], 'rb').read().decode('utf-8')
+                elif sub:
+                    text = data['input'][field][sub]
+                else:
+                    text = data['input'][field]
+                rep = "\n".join([prefix + v + postfix for v in text.splitlines()])
+                template = template.replace("@{0}@{1}@{2}@".format(prefix, displayed_field, postfix), rep)
+    with open(output_filename, 'wb') as file:
+        file.write(template.encode("utf-8"))
+
+
+def make_job(directory, fields, templates):
+    """ Writes an input of `fields` code fields and a file field, and `templates` templates using them """
+    files = os.path.join(directory, "answer.c")
+    with open(files, "w") as f:
+        f.write("int main() {\n    return 0;\n}\n" * 100)
+    data = {"input": {"q%i" % i: "x = %i\ny = x * 2\nprint(y)\n" % i * 10 for i in range(fields)}}
+    data["input"]["file"] = {"filename": "answer.c", "value": files}
+    data["input"].update({"@username": "student", "@lang": "en", "@random": [], "@state": ""})
+    with open(os.path.join(directory, "__inputdata.json"), "w") as f:
+        f.write(json.dumps(data))
+
+    names = []
+    for i in range(templates):
+        names.append(os.path.join(directory, "template%i.py" % i))
+        with open(names[-1], "w") as f:
+            f.write("# template %i\n" % i + "def f():\n    pass\n" * 50 + "def g():\n    @    @q%i@@\n" % (i % fields)
+                    + "# @@file:filename@@\n" + ("@// @file:value@@\n" if i % 10 == 0 else ""))
+    return names
+
+
+def measure(args, get_input, parse_templates):
+    with tempfile.TemporaryDirectory() as directory:
+        templates = make_job(directory, args.fields, args.templates)
+        os.chdir(directory)
+
+        start = time.perf_counter()
+        for i in range(args.fields):
+            get_input("q%i" % i)
+        read_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parse_templates(templates, [name + ".out" for name in templates])
+        parse_time = time.perf_counter() - start
+
+        outputs = [open(name + ".out").read() for name in templates]
+        os.chdir("/")
+    return read_time, parse_time, outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the reading of the input of a job by a grading script")
+    parser.add_argument("--fields", help="Number of fields of the input, all read by get_input", default=50, type=int)
+    parser.add_argument("--templates", help="Number of templates parsed", default=50, type=int)
+    args = parser.parse_args()
+
+    legacy = measure(args, legacy_get_input,
+                     lambda inputs, outputs: [legacy_parse_template(i, o) for i, o in zip(inputs, outputs)])
+    cached = measure(args, container_input.get_input, container_input.parse_templates)
+    assert legacy[2] == cached[2], "The templates were not parsed the same way"
+
+    print("%i fields, %i templates" % (args.fields, args.templates))
+    print("          get_input, all fields (ms)  parse templates (ms)")
+    print("  legacy  %26.1f  %20.1f" % (legacy[0] * 1000, legacy[1] * 1000))
+    print("  cached  %26.1f  %20.1f" % (cached[0] * 1000, cached[1] * 1000))
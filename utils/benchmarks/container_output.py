@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the parsing of the stdout of a grading container by the docker agent: the messages are split and decoded
+    with a bytearray rebuilt after each message (as the agent used to do), and with the ContainerOutputParser. The
+    stdout is given to the parsers in chunks, as the frames of the attach endpoint of Docker. Reports the time taken
+    and the peak memory allocated (tracemalloc) for many small messages, and for one large result.
+"""
+
+import argparse
+import struct
+import time
+import tracemalloc
+
+import msgpack
+
+from inginious.agent.docker_agent._container_output import ContainerOutputParser
+
+
+def legacy_parse(chunks):
+    """ How the agent used to parse the stdout of the containers """
+    buffer = bytearray()
+    count = 0
+    for content in chunks:
+        buffer += content
+        while len(buffer) > 4 and len(buffer) >= 4+struct.unpack('I',buffer[0:4])[0]:
+            msg_encoded = buffer[4:4 + struct.unpack('I', buffer[0:4])[0]]
+            buffer = buffer[4 + struct.unpack('I', buffer[0:4])[0]:]
+            msgpack.unpackb(msg_encoded, use_list=False)
+            count += 1
+    return count
+
+
+def parser_parse(chunks):
+    parser = ContainerOutputParser("benchmark", 2 ** 32 - 1)
+    return sum(len(parser.feed(content)) for content in chunks)
+
+
+def make_stdout(messages, chunk_size):
+    stdout = b"".join(struct.pack('I', len(data)) + data for data in map(msgpack.dumps, messages))
+    return [stdout[i:i + chunk_size] for i in range(0, len(stdout), chunk_size)]
+
+
+def measure(function, chunks):
+    """ Returns the number of messages parsed, the time taken and the peak memory allocated (in a second run) """
+    start = time.perf_counter()
+    count = function(chunks)
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    function(chunks)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, duration, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the parsing of the stdout of the grading containers")
+    parser.add_argument("--messages", help="Number of small messages", default=10000, type=int)
+    parser.add_argument("--result-size", help="Size of the large result, in MB", default=50, type=int)
+    parser.add_argument("--chunk-sizes", help="Sizes of the chunks of stdout, in bytes", default=[32 * 1024, 1024 * 1024], type=int, nargs="+")
+    args = parser.parse_args()
+
+    small = [{"type": "ssh_key", "ssh_key": "k" * 64}] * args.messages
+    large = [{"type": "result", "result": {"result": "success", "text": "x" * (args.result_size * 1024 * 1024)}}]
+    print("messages      chunks (kB)  parser     time (ms)  peak memory (MB)")
+    for name, messages in (("%i small" % args.messages, small), ("1 of %i MB" % args.result_size, large)):
+        for chunk_size in args.chunk_sizes:
+            chunks = make_stdout(messages, chunk_size)
+            for parser_name, function in (("legacy", legacy_parse), ("streaming", parser_parse)):
+                count, duration, peak = measure(function, chunks)
+                assert count == len(messages)
+                print("%-12s  %11i  %-9s  %9.1f  %16.1f" % (name, chunk_size // 1024, parser_name, duration * 1000,
+                                                           peak / 1024 / 1024))
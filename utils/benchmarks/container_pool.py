@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the job start latency of the docker agent with and without warm containers (see ContainerPool). A
+    simulated backend sends short jobs (a task whose run script only sets its result) to a real DockerAgent at a
+    fixed rate. Reports the hits/misses of the pool, the p50/p99 latency of the start of the grading container
+    (as measured by the agent) and the p50/p99 duration of the jobs, as seen by the backend.
+
+    Needs a running Docker daemon and the images of the INGInious environments.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import zmq
+from zmq.asyncio import Context
+
+from inginious.agent.docker_agent import DockerAgent
+from inginious.common.base import percentile
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.message_meta import ZMQUtils
+from inginious.common.messages import AgentHello, AgentJobDone, BackendNewJob, Ping, Pong
+
+RUN_SCRIPT = "#!/bin/bash\nfeedback-result success\n"
+
+
+async def benchmark(warm_containers, args, tasks_dir, port):
+    context = Context()
+    backend = context.socket(zmq.ROUTER)
+    backend.bind("tcp://127.0.0.1:%i" % port)
+    agent = DockerAgent(context, "tcp://127.0.0.1:%i" % port, "bench", args.concurrency, LocalFSProvider(tasks_dir),
+                        tmp_dir=os.path.join(tasks_dir, "..", "agent_tmp_%i" % port), warm_containers=warm_containers)
+    agent_task = asyncio.ensure_future(agent.run())
+
+    agent_addr = None
+    while agent_addr is None:
+        addr, message = await ZMQUtils.recv_with_addr(backend)
+        if isinstance(message, AgentHello):
+            agent_addr = addr
+
+    submitted = {}
+    durations = []
+
+    async def submit():
+        for i in range(args.jobs):
+            submitted[str(i)] = time.time()
+            await ZMQUtils.send_with_addr(backend, agent_addr, BackendNewJob(str(i), "bench", "task", {}, args.environment,
+                                                                              {"limits": {"time": 30, "memory": 100}}, False))
+            await asyncio.sleep(args.interval)
+
+    submit_task = asyncio.ensure_future(submit())
+    while len(durations) < args.jobs:
+        _, message = await ZMQUtils.recv_with_addr(backend)
+        if isinstance(message, Ping):
+            await ZMQUtils.send_with_addr(backend, agent_addr, Pong())
+        elif isinstance(message, AgentJobDone):
+            durations.append(time.time() - submitted[message.job_id])
+            if message.result[0] != "success":
+                print("job %s: %s" % (message.job_id, message.result))
+        await ZMQUtils.send_with_addr(backend, agent_addr, Ping())
+
+    stats = agent._container_pool.stats()  # pylint: disable=protected-access
+    submit_task.cancel()
+    agent_task.cancel()
+    try:
+        await agent_task
+    except asyncio.CancelledError:
+        pass
+    context.destroy(0)
+    return stats, durations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the job start latency of the docker agent with and without warm containers")
+    parser.add_argument("--environment", help="Environment of the jobs", default="default")
+    parser.add_argument("--jobs", help="Number of jobs", default=100, type=int)
+    parser.add_argument("--interval", help="Interval between two jobs, in s", default=0.5, type=float)
+    parser.add_argument("--concurrency", help="Concurrency of the agent", default=4, type=int)
+    parser.add_argument("--warm", help="Maximum number of warm containers when the pool is enabled", default=4, type=int)
+    parser.add_argument("--port", help="TCP port used by the benchmark", default=24700, type=int)
+    args = parser.parse_args()
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        tasks_dir = os.path.join(directory, "tasks")
+        os.makedirs(os.path.join(tasks_dir, "bench", "task"))
+        with open(os.path.join(tasks_dir, "bench", "task", "run"), "w") as run_file:
+            run_file.write(RUN_SCRIPT)
+
+        print("%i jobs, one every %.2f s, agent concurrency %i" % (args.jobs, args.interval, args.concurrency))
+        print("pool      hits  misses  start p50 (ms)  start p99 (ms)  job p50 (ms)  job p99 (ms)")
+        for i, warm_containers in enumerate([0, args.warm]):
+            stats, durations = asyncio.get_event_loop().run_until_complete(benchmark(warm_containers, args, tasks_dir,
+                                                                                     args.port + i))
+            print("%-6s  %6i  %6i  %14.0f  %14.0f  %12.0f  %12.0f" % (
+                "%i" % warm_containers if warm_containers else "none", stats["hits"], stats["misses"],
+                stats["start_latency_p50"] * 1000, stats["start_latency_p99"] * 1000,
+                percentile(durations, 50) * 1000, percentile(durations, 99) * 1000))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the round-trip latency of the Docker calls done by the agent for each container (create, start, get,
+    kill, remove), with a Docker client created for each call (as the agent used to do) and with a single client
+    keeping a pool of connections (see DockerInterface). The calls are done by a pool of threads, as in the agent.
+    Needs a running Docker daemon and an image that stays up until killed.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from inginious.agent.docker_agent._docker_interface import DockerInterface
+from inginious.common.base import percentile
+
+
+class DockerInterfaceWithoutPool(DockerInterface):
+    """ DockerInterface creating a new client (and a new connection) for each call """
+
+    @property
+    def _docker(self):
+        return docker.from_env()
+
+
+def container_round_trip(interface, image):
+    """ Creates, starts, inspects, kills and removes a container. Returns the duration of each step, in s """
+    durations = []
+    start = time.perf_counter()
+    container_id = interface._docker.containers.create(image, command="sleep 60").id  # pylint: disable=protected-access
+    durations.append(time.perf_counter() - start)
+    for call in (interface.start_container, lambda cid: interface._docker.containers.get(cid),  # pylint: disable=protected-access
+                 interface.kill_container, interface.remove_container):
+        start = time.perf_counter()
+        call(container_id)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def benchmark(interface, args):
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: container_round_trip(interface, args.image), range(args.containers)))
+        duration = time.perf_counter() - start
+    return duration, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the latency of the Docker calls of the agent, with and without "
+                                                 "a pooled Docker client")
+    parser.add_argument("--image", help="Image of the containers", default="ingi/inginious-c-default")
+    parser.add_argument("--containers", help="Number of containers", default=100, type=int)
+    parser.add_argument("--threads", help="Number of threads doing the calls", default=8, type=int)
+    args = parser.parse_args()
+
+    steps = ["create", "start", "get", "kill", "remove"]
+    print("%i containers, %i threads" % (args.containers, args.threads))
+    print("client      containers/s  " + "  ".join("%s p50/p99 (ms)" % step for step in steps))
+    for name, interface in [("per call", DockerInterfaceWithoutPool()), ("pooled", DockerInterface(args.threads))]:
+        interface._docker.images.get(args.image)  # warms up the pooled client # pylint: disable=protected-access
+        duration, results = benchmark(interface, args)
+        columns = []
+        for i, step in enumerate(steps):
+            latencies = [result[i] for result in results]
+            columns.append("%*s" % (len(step) + 14, "%.1f/%.1f" % (percentile(latencies, 50) * 1000,
+                                                                   percentile(latencies, 99) * 1000)))
+        print("%-10s  %12.1f  %s" % (name, args.containers / duration, "  ".join(columns)))
+        interface.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the end of a burst of jobs in the docker agent (e.g. at the end of an exam): each job removes its
+    container and deletes its directory, either inline, in the threads doing the calls to Docker, before sending its
+    result (as the agent used to do), or in the background, through the CleanupQueue, after sending its result.
+    Meanwhile, new jobs are created. Reports the p50/p99 delay between the end of a job and the sending of its result,
+    and the p50/p99 time taken to create a new job.
+
+    No Docker daemon is needed: the calls to Docker are simulated by sleeps, the directories of the jobs are real.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inginious.agent.docker_agent._cleanup_queue import CleanupQueue
+from inginious.common.base import percentile
+
+
+def make_job_directory(directory, nb_files, file_size):
+    path = tempfile.mkdtemp(dir=directory)
+    for i in range(nb_files):
+        with open(os.path.join(path, "file%i" % i), "wb") as f:
+            f.write(os.urandom(file_size))
+    return path
+
+
+def remove_job_sync(args, path):
+    time.sleep(args.docker_call)  # removal of the container
+    shutil.rmtree(path)
+
+
+async def benchmark(mode, args, directory):
+    loop = asyncio.get_event_loop()
+    docker_executor = ThreadPoolExecutor(max_workers=args.concurrency + 4)
+    cleanup_queue = CleanupQueue() if mode == "queue" else None
+    paths = [make_job_directory(directory, args.files, args.file_size) for _ in range(args.jobs)]
+    result_delays, start_delays = [], []
+
+    async def job_closing(path):
+        end = time.perf_counter()
+        if cleanup_queue is None:
+            await loop.run_in_executor(docker_executor, remove_job_sync, args, path)
+            result_delays.append(time.perf_counter() - end)
+        else:
+            result_delays.append(time.perf_counter() - end)
+            await cleanup_queue.put(remove_job_sync, args, path)
+
+    async def new_job():
+        start = time.perf_counter()
+        if cleanup_queue is None:
+            await loop.run_in_executor(docker_executor, time.sleep, args.docker_call)
+        else:
+            with cleanup_queue.job_starting():
+                await loop.run_in_executor(docker_executor, time.sleep, args.docker_call)
+        start_delays.append(time.perf_counter() - start)
+
+    async def new_jobs():
+        for _ in range(args.new_jobs):
+            await asyncio.gather(*[new_job() for _ in range(args.concurrency)])
+
+    await asyncio.gather(new_jobs(), *[job_closing(path) for path in paths])
+    if cleanup_queue is not None:
+        while any(cleanup_queue.stats()[key] for key in ("queued", "running")):
+            await asyncio.sleep(0.01)
+        await cleanup_queue.close()
+    docker_executor.shutdown()
+    return result_delays, start_delays
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the end of a burst of jobs in the docker agent")
+    parser.add_argument("--jobs", help="Number of jobs ending at once", default=200, type=int)
+    parser.add_argument("--concurrency", help="Concurrency of the agent", default=8, type=int)
+    parser.add_argument("--new-jobs", help="Number of rounds of new jobs (concurrency jobs each)", default=10, type=int)
+    parser.add_argument("--files", help="Number of files in the directory of a job", default=50, type=int)
+    parser.add_argument("--file-size", help="Size of the files, in bytes", default=64 * 1024, type=int)
+    parser.add_argument("--docker-call", help="Duration of a call to Docker, in s", default=0.05, type=float)
+    args = parser.parse_args()
+
+    print("%i jobs ending, %i new jobs" % (args.jobs, args.new_jobs * args.concurrency))
+    print("cleanup  result p50 (ms)  result p99 (ms)  new job p50 (ms)  new job p99 (ms)")
+    for mode in ("inline", "queue"):
+        with tempfile.TemporaryDirectory() as directory:
+            result_delays, start_delays = asyncio.get_event_loop().run_until_complete(benchmark(mode, args, directory))
+        print("%-7s  %15.0f  %15.0f  %16.0f  %16.0f" % (mode, percentile(result_delays, 50) * 1000,
+                                                       percentile(result_delays, 99) * 1000,
+                                                       percentile(start_delays, 50) * 1000,
+                                                       percentile(start_delays, 99) * 1000))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Benchmark of the journal of the backend: time needed to append entries to the journal, and to replay it when the
+    backend restarts. Each job adds three entries (queued, started, ended), and a fraction of the jobs is left
+    waiting or running at the end.
+"""
+
+import argparse
+import tempfile
+import time
+
+from inginious.backend.journal import BackendJournal
+from inginious.common.messages import ClientNewJob
+
+
+def write_journal(directory, nb_entries, input_size, pending, fsync):
+    """ Writes about nb_entries entries to a new journal in directory, and returns the time taken """
+    journal = BackendJournal(directory, compact_every=nb_entries + 1, fsync=fsync)
+    journal.load()
+    inputdata = {"q1": "x" * input_size}
+    nb_jobs = nb_entries // 3
+    start = time.perf_counter()
+    for i in range(nb_jobs):
+        client_addr = ("client%i" % (i % 4)).encode()
+        journal.job_queued(client_addr, 0, time.time(), ClientNewJob(str(i), 0, "course", "task%i" % (i % 50), inputdata,
+                                                                     "default", {}, False, "bench"))
+        if i % 100 >= pending * 100:
+            journal.job_started(client_addr, str(i))
+            journal.job_ended(client_addr, str(i))
+    elapsed = time.perf_counter() - start
+    journal.close()
+    return elapsed, nb_jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the journal of the backend")
+    parser.add_argument("--entries", help="Number of entries in the journal", default=100000, type=int)
+    parser.add_argument("--input-size", help="Size of the input of each job, in bytes", default=1000, type=int)
+    parser.add_argument("--pending", help="Fraction of the jobs that did not end", default=0.05, type=float)
+    parser.add_argument("--fsync", help="fsync the journal after each entry", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_time, nb_jobs = write_journal(directory, args.entries, args.input_size, args.pending, args.fsync)
+        print("append: %i jobs in %.2f s (%.1f us/job)" % (nb_jobs, write_time, write_time / nb_jobs * 1e6))
+
+        journal = BackendJournal(directory)
+        start = time.perf_counter()
+        jobs, running = journal.load()
+        replay_time = time.perf_counter() - start
+        print("replay: %.2f s, %i jobs restored" % (replay_time, len(jobs)))
+
+        start = time.perf_counter()
+        journal.compact(((client_addr, priority, insert_time, message)
+                         for (client_addr, _), (priority, insert_time, message) in jobs.items()), running)
+        compact_time = time.perf_counter() - start
+        journal.close()
+
+        start = time.perf_counter()
+        BackendJournal(directory).load()
+        print("compaction: %.2f s, replay after compaction: %.3f s" % (compact_time, time.perf_counter() - start))
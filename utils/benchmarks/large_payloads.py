@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the cost of the large payloads for the backend: a simulated client submits jobs whose input contains an
+    uploaded file, and a simulated agent answers each of them with an archive of the same size. The backend runs in
+    its own process. Reports the number of jobs per second, the MB/s of payloads going through the backend (both
+    directions), and the peak memory (max RSS) of the backend process, with the payloads sent inline in the messages
+    and in their own frames (see ZMQUtils.PAYLOAD_THRESHOLD).
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import resource
+import time
+
+import zmq
+from zmq.asyncio import Context
+
+from inginious.backend.backend import Backend
+from inginious.common.message_meta import ZMQUtils
+from inginious.common.messages import AgentHello, AgentJobDone, BackendNewJob, BackendJobDone, ClientHello, \
+    ClientNewJob, Ping, Pong
+
+ENVIRONMENTS = {"env": {"id": "env", "created": 0, "ports": [], "type": "docker"}}
+
+
+def run_backend(threshold, agent_addr, client_addr, results):
+    """ Runs a backend in the current process. Puts its max RSS, in MB, in results when interrupted by SIGTERM """
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    ZMQUtils.PAYLOAD_THRESHOLD = threshold
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    backend = Backend(Context(), agent_addr, client_addr)
+    task = loop.create_task(backend.run())
+    loop.add_signal_handler(15, task.cancel)
+    loop.run_until_complete(task)
+    results.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def run_peers(threshold, agent_addr, client_addr, size, inflight, nb_jobs, results):
+    """ Runs the agent and the client. Puts the duration of the run in results. """
+    ZMQUtils.PAYLOAD_THRESHOLD = threshold
+    payload = bytes(size)
+
+    async def agent(context):
+        socket = context.socket(zmq.DEALER)
+        socket.connect(agent_addr)
+        await ZMQUtils.send(socket, AgentHello("agent", inflight, ENVIRONMENTS, False, [], {}))
+        while True:
+            message = await ZMQUtils.recv(socket)
+            if isinstance(message, Ping):
+                await ZMQUtils.send(socket, Pong())
+            elif isinstance(message, BackendNewJob):
+                assert len(message.inputdata["file"]["value"]) == size
+                await ZMQUtils.send(socket, AgentJobDone(message.job_id, ("success", ""), 100.0, {}, {}, {}, "",
+                                                         payload, "", ""))
+
+    async def client(context):
+        socket = context.socket(zmq.DEALER)
+        socket.connect(client_addr)
+        await ZMQUtils.send(socket, ClientHello("client", False))
+        await asyncio.sleep(0.5)
+        submitted, done = 0, 0
+
+        async def submit():
+            nonlocal submitted
+            submitted += 1
+            await ZMQUtils.send(socket, ClientNewJob(str(submitted), 0, "course", "task",
+                                                     {"file": {"filename": "file.tgz", "value": payload}},
+                                                     "env", {}, False, "bench"))
+
+        start = time.time()
+        for _ in range(min(inflight, nb_jobs)):
+            await submit()
+        while done < nb_jobs:
+            message = await ZMQUtils.recv(socket)
+            if isinstance(message, BackendJobDone):
+                assert len(message.archive) == size
+                done += 1
+                if submitted < nb_jobs:
+                    await submit()
+        return time.time() - start
+
+    async def main():
+        context = Context()
+        agent_task = asyncio.ensure_future(agent(context))
+        duration = await client(context)
+        agent_task.cancel()
+        context.destroy(0)
+        return duration
+
+    results.put(asyncio.run(main()))
+
+
+def benchmark(threshold, args, port):
+    mp = multiprocessing.get_context("spawn")
+    agent_addr = "tcp://127.0.0.1:%i" % port
+    client_addr = "tcp://127.0.0.1:%i" % (port + 1)
+    backend_results = mp.Queue()
+    peer_results = mp.Queue()
+    backend = mp.Process(target=run_backend, args=(threshold, agent_addr, client_addr, backend_results))
+    backend.start()
+    time.sleep(1)
+    peers = mp.Process(target=run_peers, args=(threshold, agent_addr, client_addr, args.size * 1024 * 1024,
+                                               args.inflight, args.jobs, peer_results))
+    peers.start()
+    duration = peer_results.get()
+    peers.join()
+    backend.terminate()
+    max_rss = backend_results.get()
+    backend.join()
+    return args.jobs / duration, 2 * args.jobs * args.size / duration, max_rss
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cost of the large payloads for the backend")
+    parser.add_argument("--size", help="Size of the uploaded files and of the archives, in MB", default=10, type=int)
+    parser.add_argument("--jobs", help="Number of jobs", default=200, type=int)
+    parser.add_argument("--inflight", help="Number of jobs in flight", default=8, type=int)
+    parser.add_argument("--port", help="First of the TCP ports used by the benchmark", default=24600, type=int)
+    args = parser.parse_args()
+
+    print("%i jobs, %i MB in and %i MB out per job, %i jobs in flight" % (args.jobs, args.size, args.size, args.inflight))
+    print("payloads         jobs/s  payload MB/s  backend max RSS (MB)")
+    for i, (name, threshold) in enumerate([("inline", None), ("own frames", ZMQUtils.PAYLOAD_THRESHOLD)]):
+        jobs_per_second, throughput, max_rss = benchmark(threshold, args, args.port + 2 * i)
+        print("%-12s  %9.1f  %12.0f  %20.0f" % (name, jobs_per_second, throughput, max_rss))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Simulation of the locality-aware placement of the backend. Jobs for tasks of Zipf-distributed popularity are
+    submitted to the real Backend, whose agents are simulated: a job runs longer on an agent that did not run the same
+    task recently (cold caches). Reports, without locality-aware placement and for each locality delay, the hit rate
+    (jobs run on a warm agent) and the p50/p99 time spent by the jobs in the queue of the backend.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from zmq.asyncio import Context
+
+from inginious.backend.agent_locality import AgentLocality
+from inginious.backend.backend import Backend
+from inginious.common.base import percentile
+from inginious.common.messages import AgentHello, AgentJobDone, BackendNewJob, ClientHello, ClientNewJob
+
+
+class SimulatedBackend(Backend):
+    """ A Backend whose agents are simulated in-process """
+
+    def __init__(self, context, locality_delay, warm_time, cold_penalty, cache_size):
+        super().__init__(context, "inproc://locality_agent", "inproc://locality_client", locality_delay=locality_delay)
+        self._warm_time = warm_time
+        self._cold_penalty = cold_penalty
+        self._cache_size = cache_size
+        self.caches = {}  # agent_addr -> OrderedDict of the tasks in the cache of the agent
+        self.arrivals = {}  # job_id -> arrival time
+        self.waiting_times = []
+        self.hits = 0
+
+    def _send_to_client(self, client_addr, message):
+        pass
+
+    def _send_to_agent(self, agent_addr, message):
+        if not isinstance(message, BackendNewJob):
+            return
+        self.waiting_times.append(time.perf_counter() - self.arrivals.pop(message.job_id[1]))
+
+        cache = self.caches.setdefault(agent_addr, OrderedDict())
+        key = (message.course_id, message.task_id)
+        run_time = self._warm_time
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+        else:
+            run_time += self._cold_penalty
+            cache[key] = None
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+
+        done = AgentJobDone(message.job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", "")
+        self._loop.call_later(run_time, self._create_safe_task, self.handle_agent_job_done(agent_addr, done))
+
+
+async def simulate(locality_delay, args):
+    context = Context()
+    backend = SimulatedBackend(context, locality_delay or 0.0, args.run_time, args.cold_penalty, args.cache_size)
+    if locality_delay is None:
+        backend._locality = AgentLocality(size=0)  # pylint: disable=protected-access
+    environments = {"env": {"id": "env", "created": 0, "ports": [], "type": "docker"}}
+    await backend.handle_client_hello(b"client", ClientHello("sim", True))
+    for i in range(args.agents):
+        await backend.handle_agent_hello(("agent%i" % i).encode(), AgentHello("agent%i" % i, args.slots, environments, True, [], {}))
+
+    rand = random.Random(args.seed)
+    weights = [1.0 / (rank + 1) ** args.zipf for rank in range(args.tasks)]
+    tasks = rand.choices(range(args.tasks), weights, k=args.jobs)
+
+    # Arrival rate giving the requested load, if all the jobs were warm
+    rate = args.load * args.agents * args.slots / args.run_time
+    next_arrival = time.perf_counter()
+    for i, task in enumerate(tasks):
+        next_arrival += rand.expovariate(rate)
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        backend.arrivals[str(i)] = time.perf_counter()
+        await backend.handle_client_new_job(b"client", ClientNewJob(str(i), 0, "course", "task%i" % task, {}, "env", {}, False, "sim"))
+
+    while backend._waiting_jobs or backend._job_running:  # pylint: disable=protected-access
+        await asyncio.sleep(0.01)
+
+    context.destroy(0)
+    return backend.hits / args.jobs, percentile(backend.waiting_times, 50), percentile(backend.waiting_times, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation of the locality-aware placement of the backend")
+    parser.add_argument("--delays", help="Locality delays to compare, in ms", default=[0, 5, 20, 50], type=float, nargs="+")
+    parser.add_argument("--jobs", help="Number of jobs", default=3000, type=int)
+    parser.add_argument("--agents", help="Number of agents", default=8, type=int)
+    parser.add_argument("--slots", help="Number of slots per agent", default=4, type=int)
+    parser.add_argument("--tasks", help="Number of tasks", default=200, type=int)
+    parser.add_argument("--zipf", help="Exponent of the Zipf distribution of the popularity of the tasks", default=1.0, type=float)
+    parser.add_argument("--cache-size", help="Number of tasks in the cache of each agent", default=8, type=int)
+    parser.add_argument("--run-time", help="Run time of a job on a warm agent, in s", default=0.02, type=float)
+    parser.add_argument("--cold-penalty", help="Additional run time of a job on a cold agent, in s", default=0.02, type=float)
+    parser.add_argument("--load", help="Load of the agents, if all the jobs were warm", default=0.35, type=float)
+    parser.add_argument("--seed", help="Random seed", default=42, type=int)
+    args = parser.parse_args()
+
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    print("%i jobs, %i tasks (zipf %.1f), %i agents x %i slots, load %.1f" % (args.jobs, args.tasks, args.zipf, args.agents,
+                                                                            args.slots, args.load))
+    print("delay (ms)  hit rate  queue p50 (ms)  queue p99 (ms)")
+    for delay in [None] + args.delays:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        hit_rate, p50, p99 = loop.run_until_complete(simulate(None if delay is None else delay / 1000.0, args))
+        loop.close()
+        print("%10s  %7.1f%%  %14.2f  %14.2f" % ("off" if delay is None else "%.1f" % delay, hit_rate * 100, p50 * 1000, p99 * 1000))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the number of MCQ jobs per second run by a MCQAgent, for several concurrencies. The backend, the agent
+    and a simulated client each run in their own process and communicate through TCP, as in a remote deployment. The
+    client keeps enough jobs in the queue of the backend for the agent to be always busy, on a task made of
+    multiple choice and match problems.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+import zmq
+from zmq.asyncio import Context
+
+from inginious.agent.mcq_agent import MCQAgent
+from inginious.backend.backend import Backend
+from inginious.common.course_factory import create_factories
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.message_meta import ZMQUtils
+from inginious.common.messages import BackendJobDone, ClientHello, ClientNewJob
+from inginious.common.tasks_problems import MatchProblem, MultipleChoiceProblem
+
+
+def make_course(directory, nb_problems, nb_choices):
+    """ Creates a course with a task of nb_problems multiple choice problems and one match problem """
+    os.makedirs(os.path.join(directory, "course", "quiz"))
+    with open(os.path.join(directory, "course", "course.yaml"), "w") as f:
+        f.write("name: Benchmark\nadmins: []\naccessible: true\n")
+    with open(os.path.join(directory, "course", "quiz", "task.yaml"), "w") as f:
+        f.write("name: Quiz\nenvironment_id: mcq\nenvironment_type: mcq\nenvironment_parameters: {}\nproblems:\n")
+        for i in range(nb_problems):
+            f.write("    mc%i:\n        type: multiple_choice\n        multiple: true\n        choices:\n" % i)
+            for j in range(nb_choices):
+                f.write("          - text: Choice %i\n            feedback: Feedback %i\n%s" % (j, j, "            valid: true\n" if j % 2 else ""))
+        f.write("    match:\n        type: match\n        answer: '42'\n")
+    inputdata = {"mc%i" % i: [str(j) for j in range(1, nb_choices, 2)] for i in range(nb_problems)}
+    inputdata.update({"match": "42", "@lang": "fr"})
+    return inputdata
+
+
+def run_backend(agent_addr, client_addr):
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(Backend(Context(), agent_addr, client_addr).run())
+
+
+def run_agent(agent_addr, directory, concurrency):
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    fs = LocalFSProvider(directory)
+    course_factory, _ = create_factories(fs, {"multiple_choice": MultipleChoiceProblem, "match": MatchProblem})
+    agent = MCQAgent(Context(), agent_addr, "mcq", concurrency, fs, course_factory)
+    loop.run_until_complete(agent.run())
+
+
+def run_client(client_addr, inputdata, nb_jobs, inflight, results):
+    async def main():
+        context = Context()
+        socket = context.socket(zmq.DEALER)
+        socket.connect(client_addr)
+        await ZMQUtils.send(socket, ClientHello("client", False))
+        await asyncio.sleep(1)
+        submitted, done = 0, 0
+
+        async def submit():
+            nonlocal submitted
+            submitted += 1
+            await ZMQUtils.send(socket, ClientNewJob(str(submitted), 0, "course", "quiz", inputdata, "mcq", {}, False, "bench"))
+
+        start = time.perf_counter()
+        for _ in range(min(inflight, nb_jobs)):
+            await submit()
+        while done < nb_jobs:
+            message = await ZMQUtils.recv(socket)
+            if isinstance(message, BackendJobDone):
+                assert message.result[0] == "success", message.result
+                done += 1
+                if submitted < nb_jobs:
+                    await submit()
+        duration = time.perf_counter() - start
+        context.destroy(0)
+        return duration
+
+    results.put(asyncio.run(main()))
+
+
+def benchmark(concurrency, args, directory, inputdata, port):
+    mp = multiprocessing.get_context("spawn")
+    agent_addr = "tcp://127.0.0.1:%i" % port
+    client_addr = "tcp://127.0.0.1:%i" % (port + 1)
+    results = mp.Queue()
+    backend = mp.Process(target=run_backend, args=(agent_addr, client_addr))
+    agent = mp.Process(target=run_agent, args=(agent_addr, directory, concurrency))
+    client = mp.Process(target=run_client, args=(client_addr, inputdata, args.jobs, max(2 * concurrency, 16), results))
+    for process in (backend, agent, client):
+        process.start()
+    duration = results.get()
+    client.join()
+    for process in (agent, backend):
+        process.terminate()
+        process.join()
+    return args.jobs / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the number of MCQ jobs per second run by a MCQAgent")
+    parser.add_argument("--concurrency", help="Concurrencies of the agent", default=[1, 8, 64], type=int, nargs="+")
+    parser.add_argument("--jobs", help="Number of jobs", default=5000, type=int)
+    parser.add_argument("--problems", help="Number of multiple choice problems in the task", default=10, type=int)
+    parser.add_argument("--choices", help="Number of choices per problem", default=10, type=int)
+    parser.add_argument("--port", help="First of the TCP ports used by the benchmark", default=24700, type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        inputdata = make_course(directory, args.problems, args.choices)
+        print("%i jobs, %i multiple choice problems of %i choices" % (args.jobs, args.problems, args.choices))
+        print("concurrency  jobs/s")
+        for i, concurrency in enumerate(args.concurrency):
+            print("%11i  %6.0f" % (concurrency, benchmark(concurrency, args, directory, inputdata, args.port + 2 * i)))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Microbenchmark of the serialization of the messages: dump and load of a BackendJobDone with a 1 MB archive and
+    of Ping/Pong, for each validation level. The "keyed map" row encodes the same fields in a msgpack map with string
+    keys, as the messages were encoded before the positional codecs, as a reference.
+"""
+
+import argparse
+import os
+import timeit
+
+import msgpack
+
+from inginious.common.message_meta import MessageMeta
+from inginious.common.messages import BackendJobDone, Ping, Pong
+
+
+def keyed_map_codec(message):
+    """ Returns (dump, load) functions encoding the message in a msgpack map with string keys """
+    content = {field: getattr(message, field) for field in message.__slots__}
+    content["type"] = message.__msgtype__
+
+    def dump():
+        return msgpack.dumps(content, use_bin_type=True)
+
+    dumped = dump()
+
+    def load():
+        obj = object.__new__(message.__class__)
+        values = msgpack.loads(dumped, use_list=False)
+        for field in message.__slots__:
+            object.__setattr__(obj, field, values[field])
+        return obj
+
+    return dump, load
+
+
+def measure(function, number):
+    """ Returns the time taken by one call of function, in microseconds """
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 10 ** 6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark of the serialization of the messages")
+    parser.add_argument("--archive-size", help="Size of the archive of the BackendJobDone, in bytes", default=1024 * 1024, type=int)
+    parser.add_argument("--number", help="Number of dumps/loads per measure for the small messages", default=100000, type=int)
+    args = parser.parse_args()
+
+    messages = [
+        ("BackendJobDone (%i KB archive)" % (args.archive_size // 1024),
+         BackendJobDone("42", ("success", "Well done"), 100.0, {"q1": ("success", "ok")}, {}, {}, "", os.urandom(args.archive_size),
+                        "stdout", "stderr"), max(args.number // 1000, 10)),
+        ("Ping", Ping(), args.number),
+        ("Pong", Pong(), args.number),
+    ]
+    levels = [("none", MessageMeta.VALIDATE_NONE), ("fields", MessageMeta.VALIDATE_FIELDS), ("types", MessageMeta.VALIDATE_TYPES)]
+
+    print("%-32s %-12s %10s %10s %10s" % ("message", "codec", "size (B)", "dump (us)", "load (us)"))
+    for name, message, number in messages:
+        dump, load = keyed_map_codec(message)
+        print("%-32s %-12s %10i %10.2f %10.2f" % (name, "keyed map", len(dump()), measure(dump, number), measure(load, number)))
+        dumped = message.dump()
+        for level_name, level in levels:
+            MessageMeta.VALIDATION_LEVEL = level
+            print("%-32s %-12s %10i %10.2f %10.2f" % (name, "pos. " + level_name, len(dumped), measure(message.dump, number),
+                                                     measure(lambda: MessageMeta.load(dumped), number)))
+        MessageMeta.VALIDATION_LEVEL = MessageMeta.VALIDATE_FIELDS
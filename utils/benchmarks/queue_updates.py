@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Compares the cost of following the job queue of the backend by polling (ClientGetQueue, answered by a full
+    BackendGetQueue) and by subscription (ClientSubscribeQueue, answered by a snapshot and then by deltas), for a given
+    number of waiting jobs and of frontends.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import msgpack
+from zmq.asyncio import Context
+
+from inginious.backend.backend import Backend
+from inginious.common.messages import AgentHello, AgentJobDone, ClientHello, ClientNewJob, ClientGetQueue, ClientSubscribeQueue
+
+
+class MeasuringBackend(Backend):
+    """ A Backend that measures the messages it sends to the clients instead of sending them """
+
+    def __init__(self, context):
+        super().__init__(context, "inproc://queue_agent", "inproc://queue_client")
+        self.sent_bytes = 0
+
+    def _send_to_client(self, client_addr, message):
+        self.sent_bytes += len(msgpack.dumps(message.__dict__, use_bin_type=True))
+
+    def _send_to_agent(self, agent_addr, message):
+        pass
+
+
+async def run_benchmark(nb_waiting, nb_clients, nb_events, poll_interval):
+    context = Context()
+    backend = MeasuringBackend(context)
+    clients = [("client%i" % i).encode() for i in range(nb_clients)]
+    for client_addr in clients:
+        await backend.handle_client_hello(client_addr, ClientHello("bench", True))
+    environments = {"env": {"id": "env", "created": 0, "ports": [], "type": "docker"}}
+    await backend.handle_agent_hello(b"agent", AgentHello("agent", 50, environments, True, [], {}))
+    for i in range(nb_waiting + 50):
+        msg = ClientNewJob(str(i), 0, "course", "task%i" % (i % 20), {}, "env", {"limits": {"time": 30}}, False, "bench")
+        await backend.handle_client_new_job(clients[i % nb_clients], msg)
+
+    # Polling: one full snapshot per client every poll_interval seconds
+    backend.sent_bytes = 0
+    start = time.perf_counter()
+    for client_addr in clients:
+        await backend.handle_client_get_queue(client_addr, ClientGetQueue())
+    poll_time = time.perf_counter() - start
+    poll_bytes = backend.sent_bytes * 60 / poll_interval
+
+    # Subscription: one snapshot per client, then deltas for nb_events jobs done (and started) per minute
+    backend.sent_bytes = 0
+    for client_addr in clients:
+        await backend.handle_client_subscribe_queue(client_addr, ClientSubscribeQueue())
+    snapshot_bytes = backend.sent_bytes
+    backend.sent_bytes = 0
+    start = time.perf_counter()
+    for i in range(nb_events):
+        job_id, (agent_addr, job_msg, _) = next(iter(backend._job_running.items()))  # pylint: disable=protected-access
+        await backend.handle_agent_job_done(agent_addr, AgentJobDone(job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", ""))
+        msg = ClientNewJob("new%i" % i, 0, "course", "task0", {}, "env", {"limits": {"time": 30}}, False, "bench")
+        await backend.handle_client_new_job(clients[i % nb_clients], msg)
+    delta_time = time.perf_counter() - start
+    delta_bytes = backend.sent_bytes
+    backend._send_queue_wait_times()  # pylint: disable=protected-access
+    wait_times_bytes = (backend.sent_bytes - delta_bytes) * 60 / backend._queue_wait_times_interval  # pylint: disable=protected-access
+    backend._queue_wait_times_timer.cancel()  # pylint: disable=protected-access
+
+    context.destroy(0)
+    return poll_bytes, poll_time, snapshot_bytes, delta_bytes, delta_time, wait_times_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares polling and subscription to the job queue of the backend")
+    parser.add_argument("--waiting", help="Number of waiting jobs", default=5000, type=int)
+    parser.add_argument("--clients", help="Number of clients (frontends)", default=8, type=int)
+    parser.add_argument("--events", help="Number of jobs ending (and starting) per minute", default=600, type=int)
+    parser.add_argument("--poll-interval", help="Interval between two ClientGetQueue, in seconds", default=10, type=float)
+    args = parser.parse_args()
+
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    poll_bytes, poll_time, snapshot_bytes, delta_bytes, delta_time, wait_times_bytes = loop.run_until_complete(
+        run_benchmark(args.waiting, args.clients, args.events, args.poll_interval))
+    loop.close()
+
+    print("%i waiting jobs, %i clients, %i jobs done per minute" % (args.waiting, args.clients, args.events))
+    print("Polling:      %.2f MB/min, %.1f ms of backend time per poll round" % (poll_bytes / 10 ** 6, poll_time * 1000))
+    print("Subscription: %.2f MB once, then %.2f MB/min of deltas (%.1f us/event) and %.2f MB/min of wait times"
+          % (snapshot_bytes / 10 ** 6, delta_bytes / 10 ** 6, delta_time / args.events * 10 ** 6, wait_times_bytes / 10 ** 6))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Simulation of the scheduling of jobs of different memory limits on agents. A burst of jobs, whose memory limits
+    follow the given mix, is submitted to the real Backend, whose agents are simulated. Three configurations are
+    compared:
+
+    - slots: each agent has one slot per core and gives no resources. As the docker agent used to do, it refuses the
+      jobs that ask for more than its memory divided by its number of slots.
+    - slots-large: the same, with fewer slots per agent, so that the largest jobs are accepted.
+    - resources: each agent has one slot per core and gives its memory to the backend, that only sends it the jobs that
+      fit in the memory left by its running jobs.
+
+    Reports the throughput (jobs run per second, until the last job is done), the number of refused jobs, the p99 time
+    spent in the queue by the largest jobs, and the peak memory reserved on an agent.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from zmq.asyncio import Context
+
+from inginious.backend.backend import Backend
+from inginious.common.base import percentile
+from inginious.common.messages import AgentHello, AgentJobDone, BackendNewJob, ClientHello, ClientNewJob
+
+
+class SimulatedBackend(Backend):
+    """ A Backend whose agents are simulated in-process """
+
+    def __init__(self, context, run_time, max_memory):
+        super().__init__(context, "inproc://resources_agent", "inproc://resources_client")
+        self._run_time = run_time
+        self._max_memory = max_memory  # agent_addr -> largest memory limit accepted by the agent
+        self.used_memory = {}  # agent_addr -> memory reserved by the running jobs
+        self.peak_memory = 0
+        self.arrivals = {}  # job_id -> arrival time
+        self.waiting_times = {}  # memory limit -> waiting times of the jobs
+        self.refused = 0
+
+    def _send_to_client(self, client_addr, message):
+        pass
+
+    def _send_to_agent(self, agent_addr, message):
+        if not isinstance(message, BackendNewJob):
+            return
+        memory = message.environment_parameters["limits"]["memory"]
+        if memory > self._max_memory[agent_addr]:
+            self.refused += 1
+            done = AgentJobDone(message.job_id, ("crash", "Not enough memory on agent"), 0.0, {}, {}, {}, "", None, "", "")
+            self._loop.call_soon(self._create_safe_task, self.handle_agent_job_done(agent_addr, done))
+            return
+
+        self.waiting_times.setdefault(memory, []).append(time.perf_counter() - self.arrivals[message.job_id[1]])
+        self.used_memory[agent_addr] = self.used_memory.get(agent_addr, 0) + memory
+        self.peak_memory = max(self.peak_memory, self.used_memory[agent_addr])
+        done = AgentJobDone(message.job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", "")
+        self._loop.call_later(self._run_time, self._job_done, agent_addr, memory, done)
+
+    def _job_done(self, agent_addr, memory, message):
+        self.used_memory[agent_addr] -= memory
+        self._create_safe_task(self.handle_agent_job_done(agent_addr, message))
+
+
+async def simulate(mode, args, mix):
+    largest = max(memory for memory, _ in mix)
+    slots = args.cores if mode != "slots-large" else max(1, min(args.cores, args.memory // largest))
+    resources = {"memory": args.memory} if mode == "resources" else {}
+    max_memory = args.memory if mode == "resources" else args.memory // slots
+
+    context = Context()
+    agents = [("agent%i" % i).encode() for i in range(args.agents)]
+    backend = SimulatedBackend(context, args.run_time, {agent_addr: max_memory for agent_addr in agents})
+    environments = {"env": {"id": "env", "created": 0, "ports": [], "type": "docker"}}
+    await backend.handle_client_hello(b"client", ClientHello("sim", True))
+    for agent_addr in agents:
+        await backend.handle_agent_hello(agent_addr, AgentHello(agent_addr.decode(), slots, environments, True, [], resources))
+
+    rand = random.Random(args.seed)
+    memories = rand.choices([memory for memory, _ in mix], [weight for _, weight in mix], k=args.jobs)
+    start = time.perf_counter()
+    for i, memory in enumerate(memories):
+        backend.arrivals[str(i)] = time.perf_counter()
+        await backend.handle_client_new_job(b"client", ClientNewJob(str(i), 0, "course", "task", {}, "env",
+                                                                    {"limits": {"memory": memory}}, False, "sim"))
+
+    while backend._waiting_jobs or backend._job_running:  # pylint: disable=protected-access
+        await asyncio.sleep(0.001)
+    duration = time.perf_counter() - start
+
+    context.destroy(0)
+    run = args.jobs - backend.refused
+    return run / duration, backend.refused, percentile(backend.waiting_times.get(largest, []), 99), backend.peak_memory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation of the scheduling of jobs of different memory limits")
+    parser.add_argument("--jobs", help="Number of jobs", default=5000, type=int)
+    parser.add_argument("--agents", help="Number of agents", default=4, type=int)
+    parser.add_argument("--cores", help="Number of cores (slots) per agent", default=16, type=int)
+    parser.add_argument("--memory", help="Memory of each agent, in MB", default=65536, type=int)
+    parser.add_argument("--mix", help="Memory limits of the jobs, in MB, and their share, as MEMORY:WEIGHT",
+                        default=["128:80", "1024:15", "5120:5"], nargs="+")
+    parser.add_argument("--run-time", help="Run time of a job, in s", default=0.02, type=float)
+    parser.add_argument("--seed", help="Random seed", default=42, type=int)
+    args = parser.parse_args()
+    mix = [(int(memory), float(weight)) for memory, weight in (item.split(":") for item in args.mix)]
+
+    logging.getLogger("inginious").setLevel(logging.ERROR)
+    print("%i jobs (%s), %i agents x %i cores, %i MB" % (args.jobs, ", ".join(args.mix), args.agents, args.cores, args.memory))
+    print("       mode  throughput (jobs/s)  refused  largest jobs, queue p99 (s)  peak memory (MB)")
+    for mode in ("slots", "slots-large", "resources"):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        throughput, refused, p99, peak = loop.run_until_complete(simulate(mode, args, mix))
+        loop.close()
+        print("%11s  %19.0f  %7i  %27.2f  %16i" % (mode, throughput, refused, p99, peak))
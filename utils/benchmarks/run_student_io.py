@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures run_student_simple of the inginious_container_api with large inputs and outputs. The student container is
+    replaced by a local process, that gets the same file descriptors. Two implementations are compared:
+
+    - legacy: the whole input is written in the pipe before the command starts, and the outputs are read once it has
+      ended (as the container used to do). It blocks as soon as the input or the output is larger than a pipe buffer.
+    - streaming: the input is written and the outputs are read while the command runs.
+
+    Reports the time taken to copy the input to stdout (cat), for several sizes, or "blocked" when the call did not
+    end within the timeout. The lines are then read as they arrive with run_student_lines, with an output cap.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+BASE_CONTAINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "base-containers", "base")
+sys.path.insert(0, BASE_CONTAINER)
+
+from inginious_container_api import run_student
+
+
+def local_run_student(cmd, container=None, time_limit=0, hard_time_limit=0, memory_limit=0, share_network=False,
+                      working_dir=None, stdin=None, stdout=None, stderr=None, signal_handler_callback=None):
+    """ Runs the command locally, with the given file descriptors, instead of in a student container """
+    return subprocess.Popen(cmd, shell=True, cwd=working_dir, stdin=stdin if stdin is not None else subprocess.DEVNULL,
+                            stdout=stdout, stderr=stderr).wait()
+
+
+run_student.run_student = local_run_student
+
+
+def legacy_run_student_simple(cmd, cmd_input=None, stdout_err_fuse=False, text="utf-8"):
+    """ How run_student_simple used to run the command """
+    stdin = None
+    if cmd_input is not None:
+        r, w = os.pipe()
+        fdo = os.fdopen(w, 'w')
+        fdo.write(cmd_input)
+        fdo.close()
+        stdin = r
+
+    stdout_r, stdout_w = os.pipe()
+    if stdout_err_fuse:
+        stderr_r, stderr_w = stdout_r, stdout_w
+    else:
+        stderr_r, stderr_w = os.pipe()
+
+    retval = run_student.run_student(cmd, None, 0, 0, 0, False, None, stdin, stdout_w, stderr_w)
+
+    preprocess_out = (lambda x: x.decode(text)) if text is not False else (lambda x: x)
+
+    os.fdopen(stdout_w, 'w').close()
+    stdout = preprocess_out(os.fdopen(stdout_r, 'rb').read())
+    if not stdout_err_fuse:
+        os.fdopen(stderr_w, 'w').close()
+        stderr = preprocess_out(os.fdopen(stderr_r, 'rb').read())
+        return stdout, stderr, retval
+    else:
+        return stdout, retval
+
+
+def timed(function, timeout, *args):
+    """ Returns (time taken, result) of the call, or (None, None) if it did not end within the timeout """
+    result = []
+    start = time.perf_counter()
+    thread = threading.Thread(target=lambda: result.append(function(*args)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if not result:
+        return None, None
+    return time.perf_counter() - start, result[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of run_student_simple with large inputs and outputs")
+    parser.add_argument("--sizes", help="Sizes of the input, in KB", default=[16, 256, 4096, 65536], type=int, nargs="+")
+    parser.add_argument("--timeout", help="Time after which a call is considered as blocked, in s", default=5, type=float)
+    args = parser.parse_args()
+
+    print("input (KB)  legacy (s)  streaming (s)")
+    for size in args.sizes:
+        cmd_input = ("%079i\n" % 0) * (size * 1024 // 80)
+        results = []
+        for function in (legacy_run_student_simple, run_student.run_student_simple):
+            duration, result = timed(function, args.timeout, "cat", cmd_input)
+            if duration is not None:
+                assert result == (cmd_input, "", 0), "The output is not the input"
+            results.append("%10.3f" % duration if duration is not None else "   blocked")
+        print("%10i  %s  %13s" % (size, results[0], results[1]))
+
+    size = max(args.sizes)
+    cmd_input = "".join("line %i\n" % i for i in range(size * 1024 // 10))
+    start = time.perf_counter()
+    output = run_student.run_student_lines("cat", cmd_input, max_output_size=len(cmd_input) // 2)
+    lines = sum(1 for _ in output)
+    print("run_student_lines: %i lines read in %.3f s (output capped at %i KB, truncated: %s, retval %i)"
+          % (lines, time.perf_counter() - start, len(cmd_input) // 2048, ", ".join(sorted(output.truncated)) or "no",
+             output.retval))
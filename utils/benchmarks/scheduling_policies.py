@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Simulation of the scheduling policies of the backend. A big course submits a burst of jobs while small courses
+    submit jobs at a steady rate. Reports the p50/p99 waiting time of the jobs of each course, for each policy.
+"""
+
+import argparse
+import heapq
+import random
+
+from inginious.backend.scheduling_policies import SCHEDULING_POLICIES, create_scheduling_policy
+from inginious.common.base import percentile
+from inginious.common.messages import ClientNewJob
+
+
+def generate_jobs(burst_jobs, burst_duration, small_courses, small_rate, duration, seed):
+    """ Returns a sorted list of (arrival_time, course_id, username, run_time) """
+    rand = random.Random(seed)
+    jobs = []
+    for _ in range(burst_jobs):
+        jobs.append((rand.uniform(0, burst_duration), "bigcourse", "big%i" % rand.randrange(300), rand.expovariate(1 / 5.0)))
+    for course in range(small_courses):
+        time = 0.0
+        while True:
+            time += rand.expovariate(small_rate)
+            if time > duration:
+                break
+            jobs.append((time, "small%i" % course, "small%i_%i" % (course, rand.randrange(30)), rand.expovariate(1 / 5.0)))
+    jobs.sort()
+    return jobs
+
+
+def simulate(policy, jobs, slots):
+    """ Returns a dict course_id -> list of waiting times """
+    events = [(arrival, 0, idx) for idx, arrival in enumerate(job[0] for job in jobs)]  # (time, 0=arrival/1=done, job idx)
+    heapq.heapify(events)
+    free_slots = slots
+    waiting_times = {}
+
+    while events:
+        time, event_type, idx = heapq.heappop(events)
+        if event_type == 0:
+            arrival, course_id, username, _ = jobs[idx]
+            msg = ClientNewJob(str(idx), 0, course_id, "task", {"@username": username}, "default", {}, False, "simulation")
+            policy.put("default", (b"client", str(idx)), (0, arrival, b"client", str(idx), msg))
+        else:
+            free_slots += 1
+
+        while free_slots > 0 and not policy.empty(["default"]):
+            _, arrival, _, job_id, msg = policy.get(["default"])
+            free_slots -= 1
+            waiting_times.setdefault(msg.course_id, []).append(time - arrival)
+            heapq.heappush(events, (time + jobs[int(job_id)][3], 1, int(job_id)))
+
+    return waiting_times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation of the scheduling policies of the backend")
+    parser.add_argument("--slots", help="Number of job slots", default=64, type=int)
+    parser.add_argument("--burst-jobs", help="Number of jobs submitted by the big course", default=2000, type=int)
+    parser.add_argument("--burst-duration", help="Duration of the burst of the big course, in seconds", default=60.0, type=float)
+    parser.add_argument("--small-courses", help="Number of small courses", default=5, type=int)
+    parser.add_argument("--small-rate", help="Number of jobs per second of each small course", default=0.2, type=float)
+    parser.add_argument("--duration", help="Duration of the simulation, in seconds", default=600.0, type=float)
+    parser.add_argument("--seed", help="Random seed", default=42, type=int)
+    args = parser.parse_args()
+
+    jobs = generate_jobs(args.burst_jobs, args.burst_duration, args.small_courses, args.small_rate, args.duration, args.seed)
+    print("%i jobs, %i slots" % (len(jobs), args.slots))
+    for name in sorted(SCHEDULING_POLICIES):
+        waiting_times = simulate(create_scheduling_policy(name), jobs, args.slots)
+        print("Policy %s" % name)
+        for course_id in sorted(waiting_times):
+            times = waiting_times[course_id]
+            print("\t%-10s %5i jobs   p50 %7.1f s   p99 %7.1f s" % (course_id, len(times), percentile(times, 50), percentile(times, 99)))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Load generator for the backend, with and without sharding. Simulated agents (that finish their jobs immediately)
+    and simulated clients (that keep a fixed number of jobs in flight) run in their own processes, and the backend
+    or its router and shards in others. Reports, for each number of shards, the number of jobs per second, the number
+    of messages per second handled by the backend (each job is made of four messages: the new job from the client,
+    the job sent to the agent, the result from the agent and the result sent to the client), and the p50/p99 dispatch
+    latency (from the submission of a job to its reception by an agent).
+
+    The backend processes compete for the CPUs with the load generator: use a machine with enough cores.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+import zmq
+from zmq.asyncio import Context
+
+from inginious.backend.backend import Backend, run_shard
+from inginious.backend.router import BackendRouter
+from inginious.common.base import percentile
+from inginious.common.message_meta import MessageMeta, ZMQUtils
+from inginious.common.messages import AgentHello, AgentJobDone, BackendNewJob, BackendNewJobBatch, BackendJobDone, \
+    BackendJobDoneBatch, ClientHello, ClientNewJob, Ping, Pong
+
+ENVIRONMENTS = {"env": {"id": "env", "created": 0, "ports": [], "type": "docker"}}
+
+
+def run_backend(nb_shards, agent_addr, client_addr, shard_dir):
+    """ Runs a backend (nb_shards == 0) or the router of a sharded backend, in the current process """
+    logging.getLogger("inginious").setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    context = Context()
+    if nb_shards == 0:
+        backend = Backend(context, agent_addr, client_addr)
+    else:
+        backend = BackendRouter(context, agent_addr, client_addr, "ipc://" + os.path.join(shard_dir, "agents"),
+                                "ipc://" + os.path.join(shard_dir, "clients"), nb_shards)
+    loop.run_until_complete(backend.run())
+
+
+def run_agents(agent_addr, nb_agents, nb_slots, stop, results):
+    """ Simulates agents that finish their jobs immediately. Puts the dispatch latencies in results when stop is set. """
+    async def agent(context, name, latencies):
+        socket = context.socket(zmq.DEALER)
+        socket.connect(agent_addr)
+        await ZMQUtils.send(socket, AgentHello(name, nb_slots, ENVIRONMENTS, True, [], {}))
+        while True:
+            message = await ZMQUtils.recv(socket)
+            if isinstance(message, Ping):
+                await ZMQUtils.send(socket, Pong())
+                continue
+            if isinstance(message, BackendNewJobBatch):
+                jobs = [MessageMeta.load(dumped) for dumped in message.messages]
+            elif isinstance(message, BackendNewJob):
+                jobs = [message]
+            else:
+                continue
+            now = time.time()
+            for job in jobs:
+                latencies.append(now - job.inputdata["submitted"])
+                await ZMQUtils.send(socket, AgentJobDone(job.job_id, ("success", ""), 100.0, {}, {}, {}, "", None, "", ""))
+
+    async def main():
+        context = Context()
+        latencies = []
+        tasks = [asyncio.ensure_future(agent(context, "agent%i" % i, latencies)) for i in range(nb_agents)]
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        results.put(latencies)
+
+    asyncio.run(main())
+
+
+def run_clients(client_addr, nb_clients, inflight, warmup, duration, results):
+    """ Simulates clients keeping `inflight` jobs in flight each. Puts the number of jobs done during `duration` in results. """
+    async def client(name, context, counter, deadline):
+        socket = context.socket(zmq.DEALER)
+        socket.connect(client_addr)
+        await ZMQUtils.send(socket, ClientHello(name, True))
+        next_job = 0
+
+        async def submit():
+            nonlocal next_job
+            next_job += 1
+            await ZMQUtils.send(socket, ClientNewJob(str(next_job), 0, "course", "task", {"submitted": time.time()},
+                                                     "env", {}, False, "bench"))
+
+        for _ in range(inflight):
+            await submit()
+        while time.time() < deadline:
+            message = await ZMQUtils.recv(socket)
+            if isinstance(message, BackendJobDoneBatch):
+                nb_done = len(message.messages)
+            elif isinstance(message, BackendJobDone):
+                nb_done = 1
+            else:
+                continue
+            counter[0] += nb_done
+            for _ in range(nb_done):
+                await submit()
+
+    async def main():
+        context = Context()
+        counter = [0]
+        start = time.time()
+        tasks = [asyncio.ensure_future(client("client%i" % i, context, counter, start + warmup + duration))
+                 for i in range(nb_clients)]
+        await asyncio.sleep(warmup)
+        done_after_warmup = counter[0]
+        await asyncio.sleep(duration)
+        results.put(counter[0] - done_after_warmup)
+        for task in tasks:
+            task.cancel()
+        context.destroy(0)
+
+    asyncio.run(main())
+
+
+def benchmark(nb_shards, args, port):
+    mp = multiprocessing.get_context("spawn")
+    agent_addr = "tcp://127.0.0.1:%i" % port
+    client_addr = "tcp://127.0.0.1:%i" % (port + 1)
+    with tempfile.TemporaryDirectory() as shard_dir:
+        processes = [mp.Process(target=run_backend, args=(nb_shards, agent_addr, client_addr, shard_dir))]
+        for index in range(nb_shards):
+            processes.append(mp.Process(target=run_shard, args=(index, nb_shards, "ipc://" + os.path.join(shard_dir, "agents"),
+                                                                "ipc://" + os.path.join(shard_dir, "clients"), logging.WARNING)))
+        for process in processes:
+            process.start()
+        time.sleep(1)
+
+        stop = mp.Event()
+        agent_results = mp.Queue()
+        client_results = mp.Queue()
+        agents = mp.Process(target=run_agents, args=(agent_addr, args.agents, args.slots, stop, agent_results))
+        agents.start()
+        time.sleep(1)
+        clients = mp.Process(target=run_clients, args=(client_addr, args.clients, args.inflight, args.warmup,
+                                                       args.duration, client_results))
+        clients.start()
+
+        nb_jobs = client_results.get()
+        stop.set()
+        latencies = agent_results.get()
+        for process in processes + [agents, clients]:
+            process.terminate()
+            process.join()
+
+    jobs_per_second = nb_jobs / args.duration
+    return jobs_per_second, percentile(latencies, 50), percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the backend, with and without sharding")
+    parser.add_argument("--shards", help="Numbers of shards to compare. 0 is the backend without router.", default=[0, 1, 2, 4],
+                        type=int, nargs="+")
+    parser.add_argument("--agents", help="Number of agents", default=32, type=int)
+    parser.add_argument("--slots", help="Number of slots per agent", default=4, type=int)
+    parser.add_argument("--clients", help="Number of clients", default=4, type=int)
+    parser.add_argument("--inflight", help="Number of jobs in flight per client", default=64, type=int)
+    parser.add_argument("--warmup", help="Warmup duration, in s", default=2, type=float)
+    parser.add_argument("--duration", help="Measurement duration, in s", default=5, type=float)
+    parser.add_argument("--port", help="First of the TCP ports used by the benchmark", default=24500, type=int)
+    args = parser.parse_args()
+
+    print("%i agents x %i slots, %i clients x %i jobs in flight, %i CPUs" % (args.agents, args.slots, args.clients,
+                                                                            args.inflight, os.cpu_count()))
+    print("shards     jobs/s  messages/s  dispatch p50 (ms)  dispatch p99 (ms)")
+    for i, nb_shards in enumerate(args.shards):
+        jobs_per_second, p50, p99 = benchmark(nb_shards, args, args.port + 2 * i)
+        print("%6s  %9.0f  %10.0f  %17.2f  %17.2f" % (nb_shards if nb_shards else "none", jobs_per_second, 4 * jobs_per_second,
+                                                      p50 * 1000, p99 * 1000))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the staging of the task files of the docker agent for each job: the task directory and the course common
+    files are either copied from the task filesystem (task_staging="copy"), or taken from the TaskCache: the task
+    directory is cloned from it and the common files are mounted from it (task_staging="cache"). Reports the time
+    per job, and the bytes written per job (as counted by the kernel in /proc/self/io: wchar is what the process
+    writes, write_bytes what reaches the storage layer).
+
+    The clones only share the data of the files on filesystems that support reflinks (e.g. Btrfs, XFS): give a
+    directory of such a filesystem with --directory to measure them.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from inginious.agent.docker_agent._task_cache import TaskCache
+from inginious.common.filesystems.local import LocalFSProvider
+
+
+def io_counters():
+    with open("/proc/self/io") as f:
+        return {line.split(":")[0]: int(line.split(":")[1]) for line in f}
+
+
+def make_course(directory, task_size, common_size, nb_files):
+    """ Creates a course with a task and common files, of the given sizes in MB, split in nb_files files each """
+    for path, size in ((os.path.join(directory, "course", "task", "data"), task_size),
+                       (os.path.join(directory, "course", "$common", "student"), common_size)):
+        os.makedirs(path)
+        for i in range(nb_files):
+            with open(os.path.join(path, "file%i" % i), "wb") as f:
+                f.write(os.urandom(size * 1024 * 1024 // nb_files))
+    with open(os.path.join(directory, "course", "task", "run"), "w") as f:
+        f.write("#!/bin/bash\nfeedback-result success\n")
+
+
+def stage(mode, cache, course_fs, job_path):
+    """ Stages the files of a job as DockerAgent.__new_job_sync does. Returns the cached paths to release. """
+    task_path = os.path.join(job_path, "task")
+    common_path = os.path.join(job_path, "course", "common")
+    os.makedirs(common_path)
+    if mode == "copy":
+        course_fs.from_subfolder("task").copy_from(None, task_path)
+        course_fs.from_subfolder("$common").copy_from(None, common_path)
+        course_fs.from_subfolder("$common").from_subfolder("student").copy_from(None, os.path.join(common_path, "student"))
+        return []
+    cached_task = cache.acquire(course_fs.from_subfolder("task"))
+    cache.clone_tree(cached_task, task_path)
+    cache.release(cached_task)
+    return [cache.acquire(course_fs.from_subfolder("$common"))]
+
+
+def benchmark(mode, args, directory):
+    course_fs = LocalFSProvider(os.path.join(directory, "course"))
+    cache = TaskCache(os.path.join(directory, "cache_" + mode))
+    durations = []
+    before = io_counters()
+    for i in range(args.jobs):
+        job_path = os.path.join(directory, "job_%s_%i" % (mode, i))
+        os.sync()
+        start = time.perf_counter()
+        cached = stage(mode, cache, course_fs, job_path)
+        durations.append(time.perf_counter() - start)
+        for path in cached:
+            cache.release(path)
+    os.sync()
+    after = io_counters()
+    return durations, {key: (after[key] - before[key]) / args.jobs for key in ("wchar", "write_bytes")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the staging of the task files of the docker agent")
+    parser.add_argument("--task-size", help="Size of the task directory, in MB", default=200, type=int)
+    parser.add_argument("--common-size", help="Size of the course common files, in MB", default=50, type=int)
+    parser.add_argument("--files", help="Number of files in the task directory and in the common files", default=20, type=int)
+    parser.add_argument("--jobs", help="Number of jobs", default=10, type=int)
+    parser.add_argument("--directory", help="Directory in which the tasks and the jobs are staged", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        make_course(directory, args.task_size, args.common_size, args.files)
+        print("task %i MB, common %i MB, %i jobs" % (args.task_size, args.common_size, args.jobs))
+        print("staging  first job (ms)  next jobs, mean (ms)  wchar/job (MB)  write_bytes/job (MB)")
+        for mode in ("copy", "cache"):
+            durations, io = benchmark(mode, args, directory)
+            print("%-7s  %14.0f  %20.0f  %14.1f  %20.1f" % (mode, durations[0] * 1000,
+                                                          sum(durations[1:]) / max(1, len(durations) - 1) * 1000,
+                                                          io["wchar"] / 1024 / 1024, io["write_bytes"] / 1024 / 1024))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the CPU time and memory used by the agent to watch the CPU time of its containers, with a stream of
+    Docker stats per container, each read by its own thread (as the agent used to do), and with the TimeoutWatcher
+    reading the cgroup files of all the containers from a single thread.
+
+    No Docker daemon is needed: the stats streams give one sample per second, as Docker does, and the cgroup files are
+    written in a temporary directory. Only the cost on the side of the agent is measured. Each measure runs in its own
+    process.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import psutil
+
+from inginious.agent.docker_agent._timeout_watcher import TimeoutWatcher
+from inginious.common.asyncio_utils import AsyncIteratorWrapper
+
+
+class FakeDockerInterface(object):
+    """ Async interface to Docker giving stats streams of containers that use no CPU time """
+    def __init__(self):
+        self.sync = self
+
+    async def get_stats(self, container_id):
+        def stream():
+            while True:
+                time.sleep(1)
+                yield {"cpu_stats": {"cpu_usage": {"total_usage": 0}}}
+        return stream()
+
+    async def kill_container(self, container_id):
+        pass
+
+
+async def watch_with_streams(docker_interface, container_id, timeout):
+    """ How the agent used to watch a container: a stats stream, read by a thread of AsyncIteratorWrapper """
+    source = AsyncIteratorWrapper(await docker_interface.get_stats(container_id))
+    async for stats in source:
+        if stats["cpu_stats"]["cpu_usage"]["total_usage"] > timeout * 10 ** 9:
+            await docker_interface.kill_container(container_id)
+            return
+
+
+def measure(mode, nb_containers, duration, results):
+    async def main():
+        docker_interface = FakeDockerInterface()
+        with tempfile.TemporaryDirectory() as cgroup_root:
+            watcher = TimeoutWatcher(docker_interface, cgroup_root)
+            for i in range(nb_containers):
+                container_id = "container%i" % i
+                if mode == "streams":
+                    asyncio.ensure_future(watch_with_streams(docker_interface, container_id, 30))
+                else:
+                    path = os.path.join(cgroup_root, "system.slice", "docker-%s.scope" % container_id)
+                    os.makedirs(path)
+                    with open(os.path.join(path, "cpu.stat"), "w") as f:
+                        f.write("usage_usec 0\nuser_usec 0\nsystem_usec 0\n")
+                    await watcher.register_container(container_id, 30, 3600)
+
+            await asyncio.sleep(2)  # warmup
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            start_cpu = usage.ru_utime + usage.ru_stime
+            await asyncio.sleep(duration)
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            cpu = (usage.ru_utime + usage.ru_stime - start_cpu) / duration
+            results.put((cpu, psutil.Process().memory_info().rss / 1024 / 1024, threading.active_count()))
+            results.close()
+            results.join_thread()
+            os._exit(0)  # the threads of the streams never end
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cost of watching the CPU time of the containers")
+    parser.add_argument("--containers", help="Numbers of containers watched", default=[50, 200, 500], type=int, nargs="+")
+    parser.add_argument("--duration", help="Measurement duration, in s", default=10, type=float)
+    args = parser.parse_args()
+
+    mp = multiprocessing.get_context("spawn")
+    print("containers  watcher  agent CPU (%)  RSS (MB)  threads")
+    for nb_containers in args.containers:
+        for mode in ("streams", "cgroups"):
+            results = mp.Queue()
+            process = mp.Process(target=measure, args=(mode, nb_containers, args.duration, results))
+            process.start()
+            cpu, rss, threads = results.get()
+            process.join()
+            print("%10i  %7s  %13.1f  %8.0f  %7i" % (nb_containers, mode, cpu * 100, rss, threads))